@@ -17,7 +17,8 @@ canvas = Canvas(
     canvas_size_mm=(229.0, 305.0),
     paper_color="black",
     pen_color="white",
-    respect_margin=True
+    respect_margin=True,
+    columnar=True
 )
 render = Render(canvas)
 
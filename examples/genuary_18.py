@@ -93,10 +93,7 @@ class GravitationalArt:
 
     def draw_path(self, path: List[Tuple[float, float]], color="white", thickness=0.5):
         """Draw a single particle's path"""
-        for i in range(len(path) - 1):
-            x1, y1 = path[i]
-            x2, y2 = path[i + 1]
-            self.canvas.line(x1, y1, x2, y2, color=color, thickness=thickness)
+        self.canvas.polyline(path, color=color, thickness=thickness)
 
     def generate_art(self, particle_list=None, colors=None):
         """Generate and draw all paths"""
@@ -2,21 +2,71 @@ import numpy as np
 import random
 from copy import deepcopy
 from PIL import Image, ImageDraw 
+from penpal.draw_stack import ColumnarDrawStack
+from penpal.spatial_index import SpatialIndex
+from penpal.op_index import OpIndex
+from penpal.clipping import clip_segment, clip_segments, clip_polyline
 class Canvas:
-    def __init__(self, canvas_size_mm = (356.0, 432.0), margin = 15.0, paper_color="white", pen_color="black", respect_margin=False):
+    def __init__(self, canvas_size_mm = (356.0, 432.0), margin = 15.0, paper_color="white", pen_color="black", respect_margin=False, columnar=False, collision_raster="eager", spatial_index=False):
         self.canvas_size_mm = canvas_size_mm
         self.paper_color = paper_color
         self.pen_color = pen_color
+        # columnar=True stores ops in NumPy columns (see ColumnarDrawStack) instead of one dict per op
+        self.columnar = columnar
         self.draw_stack = []
+        # Uniform grid over the draw stack geometry, built on the first query_* / nearest call
+        self.spatial_index = SpatialIndex() if spatial_index else None
+        # pid / type lookups over the draw stack, kept up to date as ops are added
+        self.op_index = OpIndex()
+        self._next_pid = 0
         self.tolerance = 0.2
         self.stored_matrix = np.identity(3) 
         self.current_matrix = np.identity(3)
         self.margin = margin
         self.respect_margin = respect_margin
 
-        self.plotter_buffer = Image.new("L", (self._mm_to_pixels(canvas_size_mm[0]), self._mm_to_pixels(canvas_size_mm[1])), "black")
+        # collision_raster controls the plotter_buffer used by check_collision:
+        #   "eager" draws every op into it as it is added
+        #   "lazy"  queues ops and rasterizes them in bulk on the first collision query
+        #   "off"   never rasterizes, plotter_buffer is None and check_collision is always False
+        self.collision_raster = collision_raster
         self.plotter_buffer_thickness = 2.0
-        self.plotter_buffer_draw = ImageDraw.Draw(self.plotter_buffer)
+        self._plotter_buffer = None
+        self._plotter_buffer_draw = None
+        # Summed-area table of lit plotter_buffer pixels for check_collision_many, dropped on every raster change
+        self._collision_sat = None
+        self._raster_lines = []
+        self._raster_points = []
+        self._raster_polylines = []
+        if collision_raster == "eager":
+            self._create_plotter_buffer()
+
+    @property
+    def draw_stack(self):
+        return self._draw_stack
+
+    @draw_stack.setter
+    def draw_stack(self, ops):
+        if self.columnar and not isinstance(ops, ColumnarDrawStack):
+            ops = ColumnarDrawStack(ops)
+        self._draw_stack = ops
+
+    @property
+    def plotter_buffer(self):
+        if self.collision_raster == "off":
+            return None
+        if self._plotter_buffer is None:
+            self._create_plotter_buffer()
+        self._flush_raster()
+        return self._plotter_buffer
+
+    @property
+    def plotter_buffer_draw(self):
+        if self.plotter_buffer is None:
+            return None
+        # Whoever asks for the draw handle is about to change the raster
+        self._collision_sat = None
+        return self._plotter_buffer_draw
 
     @property
     def width(self):
@@ -52,23 +102,73 @@ class Canvas:
         return self.canvas_size_mm[1] - self.margin
     
     def clone(self):
-        clone = Canvas(self.canvas_size_mm, self.margin, self.paper_color, self.pen_color, self.respect_margin)
-        clone.draw_stack = deepcopy(self.draw_stack)
+        clone = Canvas(self.canvas_size_mm, self.margin, self.paper_color, self.pen_color, self.respect_margin, self.columnar, self.collision_raster)
+        if isinstance(self.draw_stack, ColumnarDrawStack):
+            # Shares the column blocks with this canvas until either side writes to them
+            clone.draw_stack = self.draw_stack.copy()
+        else:
+            # Ops only hold numbers, strings and polyline point arrays that are
+            # replaced rather than edited in place, so a per-op dict copy is enough
+            clone.draw_stack = [dict(op) for op in self.draw_stack]
         clone.stored_matrix = deepcopy(self.stored_matrix)
         clone.current_matrix = deepcopy(self.current_matrix)
+        if self.spatial_index is not None:
+            clone.enable_spatial_index(self.spatial_index.cell_size)
+        clone._next_pid = self._next_pid
         return clone
     
     def crop(self):
-        temp_stack = []
-        for op in self.draw_stack:
-            if op["type"] == "line":    
-                if op["x1"] > self.margin and op["x1"] < self.canvas_size_mm[0] - self.margin and op["y1"] > self.margin and op["y1"] < self.canvas_size_mm[1] - self.margin:
-                    if op["x2"] > self.margin and op["x2"] < self.canvas_size_mm[0] - self.margin and op["y2"] > self.margin and op["y2"] < self.canvas_size_mm[1] - self.margin:
-                        temp_stack.append(op)
-            elif op["type"] == "point":
-                if op["x"] > self.margin and op["x"] < self.canvas_size_mm[0] - self.margin and op["y"] > self.margin and op["y"] < self.canvas_size_mm[1] - self.margin:
-                    temp_stack.append(op)
-        self.draw_stack = temp_stack
+        """Clips all ops to the margin. Lines and polylines crossing it are trimmed at the border."""
+        stack = self.draw_stack
+        n = len(stack)
+        if n == 0:
+            return
+        box = self._margin_box()
+        if isinstance(stack, ColumnarDrawStack):
+            types = stack.column("type")
+            is_line = types == stack.type_code("line")
+            is_point = types == stack.type_code("point")
+            is_polyline = types == stack.type_code("polyline")
+            x1, y1, x2, y2 = (stack.column(name) for name in ("x1", "y1", "x2", "y2"))
+        else:
+            types = [op["type"] for op in stack]
+            is_line = np.array([type == "line" for type in types])
+            is_point = np.array([type == "point" for type in types])
+            is_polyline = np.array([type == "polyline" for type in types])
+            coords = np.full((n, 4), np.nan)
+            for i, (op, type) in enumerate(zip(stack, types)):
+                if type == "line":
+                    coords[i] = (op["x1"], op["y1"], op["x2"], op["y2"])
+                elif type == "point":
+                    coords[i] = (op["x"], op["y"], op["x"], op["y"])
+            x1, y1, x2, y2 = coords.T
+
+        keep, cx1, cy1, cx2, cy2 = clip_segments(x1, y1, x2, y2, *box)
+        trimmed = is_line & keep & ((cx1 != x1) | (cy1 != y1) | (cx2 != x2) | (cy2 != y2))
+        # Every op turns into counts[i] ops: 0 or 1 for lines and points, one per remaining run for polylines
+        counts = ((is_line | is_point) & keep).astype(np.int64)
+        runs = {}
+        for i in np.flatnonzero(is_polyline).tolist():
+            runs[i] = clip_polyline(stack[i]["points"], *box)
+            counts[i] = len(runs[i])
+        rows = np.repeat(np.arange(n), counts)
+        position = np.cumsum(counts) - counts
+
+        if isinstance(stack, ColumnarDrawStack):
+            cropped = stack.take(rows)
+            t = np.flatnonzero(trimmed)
+            cropped.set_coords(position[t], cx1[t], cy1[t], cx2[t], cy2[t])
+            for i, pieces in runs.items():
+                for k, run in enumerate(pieces):
+                    cropped[position[i] + k]["points"] = run
+        else:
+            cropped = [stack[i] for i in rows.tolist()]
+            for i in np.flatnonzero(trimmed).tolist():
+                cropped[position[i]] = dict(stack[i], x1=float(cx1[i]), y1=float(cy1[i]), x2=float(cx2[i]), y2=float(cy2[i]))
+            for i, pieces in runs.items():
+                for k, run in enumerate(pieces):
+                    cropped[position[i] + k] = dict(stack[i], points=run)
+        self.draw_stack = cropped
 
     def translate(self, x, y):
         self.current_matrix = np.dot(self.current_matrix, np.array([[1, 0, x], [0, 1, y], [0, 0, 1]]))
@@ -91,11 +191,107 @@ class Canvas:
     
     def point(self, x, y, color=None, thickness=0.5, pid=None):
         self._point(x, y, color, thickness, pid)
-    
-    def max_pid(self):
-        if len(self.draw_stack) == 0:
-            return 0
-        return max([op["pid"] for op in self.draw_stack])
+
+    def lines(self, x1, y1, x2, y2, color=None, thickness=0.5, pid=None):
+        """
+        Adds many line segments at once. Coordinates are arrays of equal length;
+        color, thickness and pid are either a single value or one value per segment.
+        """
+        x1 = np.asarray(x1, dtype=float).ravel()
+        y1 = np.asarray(y1, dtype=float).ravel()
+        x2 = np.asarray(x2, dtype=float).ravel()
+        y2 = np.asarray(y2, dtype=float).ravel()
+        n = len(x1)
+        if n == 0:
+            return
+
+        # Transform both endpoints of every segment with a single matrix multiply
+        xy = self.current_matrix @ np.vstack([np.concatenate([x1, x2]), np.concatenate([y1, y2]), np.ones(2 * n)])
+        x1, x2 = xy[0, :n], xy[0, n:]
+        y1, y2 = xy[1, :n], xy[1, n:]
+
+        if self.respect_margin:
+            keep, x1, y1, x2, y2 = clip_segments(x1, y1, x2, y2, *self._margin_box())
+            if not keep.all():
+                x1, y1, x2, y2 = x1[keep], y1[keep], x2[keep], y2[keep]
+                color, thickness, pid = (v if np.ndim(v) == 0 else [v[i] for i in np.flatnonzero(keep)] for v in (color, thickness, pid))
+                if len(x1) == 0:
+                    return
+
+        if isinstance(self.draw_stack, ColumnarDrawStack):
+            self.draw_stack.extend_lines(x1, y1, x2, y2, color, thickness, pid)
+        else:
+            n = len(x1)
+            color, thickness, pid = ([v] * n if np.ndim(v) == 0 else v for v in (color, thickness, pid))
+            self.draw_stack.extend(
+                {"type": "line", "x1": sx, "y1": sy, "x2": ex, "y2": ey, "color": c, "thickness": t, "pid": p}
+                for sx, sy, ex, ey, c, t, p in zip(x1.tolist(), y1.tolist(), x2.tolist(), y2.tolist(), color, thickness, pid)
+            )
+
+        if self.collision_raster == "eager":
+            lines_px = np.rint(np.column_stack([x1, y1, x2, y2]) * 300 / 25.4).astype(int).tolist()
+            for px1, py1, px2, py2 in lines_px:
+                self._raster_line(px1, py1, px2, py2)
+        elif self.collision_raster == "lazy":
+            self._raster_lines.extend(zip(x1.tolist(), y1.tolist(), x2.tolist(), y2.tolist()))
+
+    def polyline(self, xy, color=None, thickness=0.5, pid=None):
+        """
+        Adds a connected stroke through the (N, 2) array of vertices xy as a
+        single "polyline" op. With respect_margin, the stroke is clipped to the
+        margin and split into separate polylines wherever it leaves it.
+        """
+        xy = np.asarray(xy, dtype=float).reshape(-1, 2)
+        if len(xy) < 2:
+            return
+        points = (self.current_matrix @ np.vstack([xy.T, np.ones(len(xy))]))[:2].T
+
+        if self.respect_margin:
+            runs = clip_polyline(points, *self._margin_box())
+        else:
+            runs = [points]
+
+        for run in runs:
+            self.draw_stack.append({
+                "type": "polyline",
+                "points": run,
+                "color": color,
+                "thickness": thickness,
+                "pid": pid
+            })
+            if self.collision_raster == "eager":
+                self._raster_polyline(np.rint(run * 300 / 25.4).astype(int))
+            elif self.collision_raster == "lazy":
+                self._raster_polylines.append(run)
+
+    def max_pid(self, type=None):
+        """Largest pid in use (optionally among ops of one type), 0 if there is none."""
+        pid = self._synced_op_index().max_pid(type)
+        return 0 if pid is None else pid
+
+    def new_pid(self):
+        """Returns a pid that no op on the canvas uses and that wasn't handed out before."""
+        pid = max(self.max_pid() + 1, self._next_pid)
+        self._next_pid = pid + 1
+        return pid
+
+    def ops_by_pid(self, type=None):
+        """{pid: [op, ...]} in draw stack order, optionally only for ops of one type."""
+        stack = self.draw_stack
+        groups = self._synced_op_index().pid_groups(type)
+        return {pid: [stack[i] for i in indices] for pid, indices in groups.items()}
+
+    def ops_with_pids(self, pids, type=None):
+        """All ops whose pid is in pids, in draw stack order."""
+        groups = self._synced_op_index().pid_groups(type)
+        indices = [i for pid in set(pids) for i in groups.get(pid, ())]
+        indices.sort()
+        stack = self.draw_stack
+        return [stack[i] for i in indices]
+
+    def ops_of_type(self, type):
+        stack = self.draw_stack
+        return [stack[i] for i in self._synced_op_index().of_type(type)]
     
     def clear(self, type="all", chance=1.0):
         if chance < 1.0:
@@ -104,14 +300,52 @@ class Canvas:
             elif type == "points":
                 self.draw_stack = [op for op in self.draw_stack if op["type"] != "point" or random.random() < chance]
             elif type == "lines":
-                self.draw_stack = [op for op in self.draw_stack if op["type"] != "line" or random.random() < chance]
+                self.draw_stack = [op for op in self.draw_stack if op["type"] not in ("line", "polyline") or random.random() < chance]
         else:
             if type == "all":
                 self.draw_stack = []
             elif type == "points":
                 self.draw_stack = [op for op in self.draw_stack if op["type"] != "point"]
             elif type == "lines":
-                self.draw_stack = [op for op in self.draw_stack if op["type"] != "line"]
+                self.draw_stack = [op for op in self.draw_stack if op["type"] not in ("line", "polyline")]
+
+    def enable_spatial_index(self, cell_size=10.0):
+        if self.spatial_index is None or self.spatial_index.cell_size != cell_size:
+            self.spatial_index = SpatialIndex(cell_size)
+        return self.spatial_index
+
+    def reindex(self):
+        """Rebuilds the indexes after ops were edited or reordered in place."""
+        if self.spatial_index is not None:
+            self.spatial_index.rebuild(self.draw_stack)
+        self.op_index.rebuild(self.draw_stack)
+
+    def query_radius(self, x, y, radius):
+        """Ops whose geometry passes within radius of (x, y), in canvas coordinates."""
+        index = self._synced_spatial_index()
+        return [self.draw_stack[i] for i in index.query_radius(x, y, radius)]
+
+    def query_segment(self, x1, y1, x2, y2, radius=0.0):
+        """Ops whose geometry passes within radius of the segment (x1, y1)-(x2, y2)."""
+        index = self._synced_spatial_index()
+        return [self.draw_stack[i] for i in index.query_segment(x1, y1, x2, y2, radius)]
+
+    def nearest(self, x, y, max_distance=None):
+        """Returns (op, distance) for the op closest to (x, y), or None."""
+        found = self._synced_spatial_index().nearest(x, y, max_distance)
+        if found is None:
+            return None
+        return self.draw_stack[found[0]], found[1]
+
+    def _synced_spatial_index(self):
+        if self.spatial_index is None:
+            self.enable_spatial_index()
+        self.spatial_index.sync(self.draw_stack)
+        return self.spatial_index
+
+    def _synced_op_index(self):
+        self.op_index.sync(self.draw_stack)
+        return self.op_index
 
     def merge_with(self, other):
         self.draw_stack.extend(other.draw_stack)
@@ -119,104 +353,48 @@ class Canvas:
     def cubic_bezier(self, x1, y1, x2, y2, x3, y3, x4, y4, color=None, thickness=1.0):
         """
         Approximates the cubic Bézier curve (x1,y1)-(x2,y2)-(x3,y3)-(x4,y4)
-        with line segments to within self.tolerance, and draws them using
-        self.line(...).
+        with line segments to within self.tolerance / 30.
         """
+        self.cubic_beziers([(x1, y1, x2, y2, x3, y3, x4, y4)], color, thickness)
 
-        import math
-
-        def is_flat_enough(p1, p2, p3, p4, tolerance):
-            """
-            Checks if the control polygon p1->p2->p3->p4 is 'flat enough'
-            by measuring the distance of p2 and p3 from the line p1->p4.
-            """
-            (x1, y1), (x2, y2), (x3, y3), (x4, y4) = p1, p2, p3, p4
-            
-            # Vector from p1 to p4
-            dx = x4 - x1
-            dy = y4 - y1
-            seg_len = math.hypot(dx, dy)
-            
-            # Degenerate case: p1 == p4
-            if seg_len < 1e-14:
-                return True
-            
-            def dist_point_to_line(px, py):
-                # Distance via the cross-product method
-                return abs(dx*(py - y1) - dy*(px - x1)) / seg_len
-            
-            # Distances for p2, p3
-            d2 = dist_point_to_line(x2, y2)
-            d3 = dist_point_to_line(x3, y3)
-            
-            return (d2 <= tolerance) and (d3 <= tolerance)
-
-        def subdivide_cubic_bezier(p1, p2, p3, p4):
-            """
-            Subdivide a cubic Bézier at t=0.5 using De Casteljau's algorithm.
-            Returns (left_p1, left_p2, left_p3, left_p4), (right_p1, right_p2, right_p3, right_p4)
-            """
-            (x1, y1) = p1
-            (x2, y2) = p2
-            (x3, y3) = p3
-            (x4, y4) = p4
-            
-            # First-level midpoints
-            x12 = 0.5 * (x1 + x2)
-            y12 = 0.5 * (y1 + y2)
-            x23 = 0.5 * (x2 + x3)
-            y23 = 0.5 * (y2 + y3)
-            x34 = 0.5 * (x3 + x4)
-            y34 = 0.5 * (y3 + y4)
-            
-            # Second-level midpoints
-            x123 = 0.5 * (x12 + x23)
-            y123 = 0.5 * (y12 + y23)
-            x234 = 0.5 * (x23 + x34)
-            y234 = 0.5 * (y23 + y34)
-            
-            # Third-level midpoint
-            x1234 = 0.5 * (x123 + x234)
-            y1234 = 0.5 * (y123 + y234)
-            
-            left  = ((x1, y1), (x12, y12), (x123, y123), (x1234, y1234))
-            right = ((x1234, y1234), (x234, y234), (x34, y34), (x4, y4))
-            return left, right
-
-        def approximate_cubic_bezier(p1, p2, p3, p4, tolerance):
-            """
-            Recursively approximates the Bézier curve defined by control points
-            p1, p2, p3, p4 to within 'tolerance'. Returns a list of points.
-            """
-            if is_flat_enough(p1, p2, p3, p4, tolerance):
-                # Flat enough: just [start, end]
-                return [p1, p4]
-            else:
-                # Subdivide and recurse
-                left, right = subdivide_cubic_bezier(p1, p2, p3, p4)
-                left_points  = approximate_cubic_bezier(*left,  tolerance)
-                right_points = approximate_cubic_bezier(*right, tolerance)
-                # Combine, removing the duplicate midpoint
-                return left_points[:-1] + right_points
-        
-        # 1) Get all the approximation points
-        p1 = (x1, y1)
-        p2 = (x2, y2)
-        p3 = (x3, y3)
-        p4 = (x4, y4)
-        points = approximate_cubic_bezier(p1, p2, p3, p4, self.tolerance / 30.0)
-
-        # 2) Draw line segments between consecutive points
-        for i in range(len(points) - 1):
-            start = points[i]
-            end   = points[i + 1]
-            self._line(start[0], start[1], end[0], end[1], color, thickness)
+    def cubic_beziers(self, curves, color=None, thickness=1.0):
+        """
+        Flattens many cubic Béziers at once. curves is an (N, 8) array of
+        x1, y1, x2, y2, x3, y3, x4, y4 rows.
+
+        The segment count of each curve comes from Wang's formula,
+        n = ceil(sqrt(3/4 * M / tolerance)) where M is the largest second
+        difference of the control points, which bounds the distance between
+        the curve and its n-segment flattening. All sample points are then
+        evaluated in one pass and drawn with self.lines(...).
+        """
+        p = np.asarray(curves, dtype=float).reshape(-1, 4, 2)
+        if len(p) == 0:
+            return
+        second = p[:, :2] - 2 * p[:, 1:3] + p[:, 2:]
+        m = np.hypot(second[..., 0], second[..., 1]).max(axis=1)
+        n = np.maximum(np.ceil(np.sqrt(0.75 * m / (self.tolerance / 30.0))), 1).astype(np.int64)
+
+        # Parameter t of every sample of every curve, flattened into one array
+        samples = n + 1
+        first = np.cumsum(samples) - samples
+        curve = np.repeat(np.arange(len(p)), samples)
+        t = ((np.arange(len(curve)) - first[curve]) / n[curve])[:, None]
+        s = 1.0 - t
+        c = p[curve]
+        points = s**3 * c[:, 0] + 3 * s**2 * t * c[:, 1] + 3 * s * t**2 * c[:, 2] + t**3 * c[:, 3]
+
+        # Every sample except the last one of each curve starts a segment
+        starts = np.ones(len(points), dtype=bool)
+        starts[first + n] = False
+        i = np.flatnonzero(starts)
+        self.lines(points[i, 0], points[i, 1], points[i + 1, 0], points[i + 1, 1], color=color, thickness=thickness)
 
     def circle(self, x, y, r, step_size=2.0, color=None, thickness=1.0, filled=False, fill_density=1.0, fill_direction='horizontal', outline=True):
         if not outline:
             return
         
-        pid = self.max_pid() + 1
+        pid = self.new_pid()
         points = []
         
         # Generate all points first
@@ -334,18 +512,56 @@ class Canvas:
 
 
     def check_collision(self, x, y, radius=1):
+        if self.collision_raster == "off":
+            return False
         x, y, _ = self.current_matrix @ np.array([x, y, 1])
         px = self._mm_to_pixels(x)
         py = self._mm_to_pixels(y)
         
         pr = self._mm_to_pixels(radius)
-        if px < 0 + pr or px >= self.plotter_buffer.width - pr or py < 0 + pr or py >= self.plotter_buffer.height - pr  :
+        plotter_buffer = self.plotter_buffer
+        if px < 0 + pr or px >= plotter_buffer.width - pr or py < 0 + pr or py >= plotter_buffer.height - pr  :
+            return False
+        if pr == 0:
             return False
-        for cx in range(px-pr, px+pr):
-            for cy in range(py-pr, py+pr):
-                if self.plotter_buffer.getpixel((cx, cy)) == 255:
-                    return True
-        return False
+        # Brightest pixel of the (2r)^2 window, computed by PIL instead of a getpixel loop
+        return plotter_buffer.crop((px - pr, py - pr, px + pr, py + pr)).getextrema()[1] == 255
+
+    def check_collision_many(self, xs, ys, radius=1):
+        """
+        check_collision for arrays of points at once, returns a boolean array.
+        radius is a single value or one per point. Each lookup is four reads
+        from a summed-area table of the plotter buffer, which is rebuilt only
+        after something new has been rasterized.
+        """
+        xs = np.asarray(xs, dtype=float).ravel()
+        ys = np.asarray(ys, dtype=float).ravel()
+        if self.collision_raster == "off" or len(xs) == 0:
+            return np.zeros(len(xs), dtype=bool)
+        xy = self.current_matrix @ np.vstack([xs, ys, np.ones(len(xs))])
+        px = np.rint(xy[0] * 300 / 25.4).astype(np.int64)
+        py = np.rint(xy[1] * 300 / 25.4).astype(np.int64)
+        pr = np.broadcast_to(np.rint(np.asarray(radius, dtype=float) * 300 / 25.4).astype(np.int64), px.shape)
+
+        table = self._collision_table()
+        height, width = table.shape[0] - 1, table.shape[1] - 1
+        inside = (px >= pr) & (px < width - pr) & (py >= pr) & (py < height - pr) & (pr > 0)
+        px, py, pr = px[inside], py[inside], pr[inside]
+        # Lit pixels in the window [px - pr, px + pr) x [py - pr, py + pr)
+        lit = table[py + pr, px + pr] - table[py - pr, px + pr] - table[py + pr, px - pr] + table[py - pr, px - pr]
+        hits = np.zeros(len(xs), dtype=bool)
+        hits[inside] = lit > 0
+        return hits
+
+    def _collision_table(self):
+        plotter_buffer = self.plotter_buffer
+        if self._collision_sat is None:
+            lit = np.asarray(plotter_buffer) == 255
+            table = np.zeros((lit.shape[0] + 1, lit.shape[1] + 1), dtype=np.int32)
+            np.cumsum(lit, axis=0, dtype=np.int32, out=table[1:, 1:])
+            np.cumsum(table[1:, 1:], axis=1, out=table[1:, 1:])
+            self._collision_sat = table
+        return self._collision_sat
 
     def _point(self, x, y, color=None, thickness=0.5, pid=None):
         x, y, _ = self.current_matrix @ np.array([x, y, 1])
@@ -362,19 +578,20 @@ class Canvas:
             "pid": pid
         })
 
-        point_px = (self._mm_to_pixels(x), self._mm_to_pixels(y))
-        thickness_px = self._mm_to_pixels(self.plotter_buffer_thickness)
-        self.plotter_buffer_draw.ellipse([point_px[0]-thickness_px/2, point_px[1]-thickness_px/2, point_px[0]+thickness_px/2, point_px[1]+thickness_px/2], fill="white")
+        if self.collision_raster == "eager":
+            self._raster_point(self._mm_to_pixels(x), self._mm_to_pixels(y))
+        elif self.collision_raster == "lazy":
+            self._raster_points.append((x, y))
 
     def _line(self, x1, y1, x2, y2, color=None, thickness=0.5, pid=None):
         x1, y1, _ = self.current_matrix @ np.array([x1, y1, 1])
         x2, y2, _ = self.current_matrix @ np.array([x2, y2, 1])
 
         if self.respect_margin:
-            if x1 < self.margin or x1 > self.canvas_size_mm[0] - self.margin or y1 < self.margin or y1 > self.canvas_size_mm[1] - self.margin:
-                return
-            if x2 < self.margin or x2 > self.canvas_size_mm[0] - self.margin or y2 < self.margin or y2 > self.canvas_size_mm[1] - self.margin:
+            clipped = clip_segment(x1, y1, x2, y2, *self._margin_box())
+            if clipped is None:
                 return
+            x1, y1, x2, y2 = clipped
 
         self.draw_stack.append({
             "type": "line",
@@ -387,10 +604,50 @@ class Canvas:
             "pid": pid
         })
 
-        start_point_px = (self._mm_to_pixels(x1), self._mm_to_pixels(y1))
-        end_point_px = (self._mm_to_pixels(x2), self._mm_to_pixels(y2))
+        if self.collision_raster == "eager":
+            self._raster_line(self._mm_to_pixels(x1), self._mm_to_pixels(y1), self._mm_to_pixels(x2), self._mm_to_pixels(y2))
+        elif self.collision_raster == "lazy":
+            self._raster_lines.append((x1, y1, x2, y2))
+
+    def _margin_box(self):
+        return (self.margin, self.margin, self.canvas_size_mm[0] - self.margin, self.canvas_size_mm[1] - self.margin)
+
+    def _create_plotter_buffer(self):
+        self._collision_sat = None
+        self._plotter_buffer = Image.new("L", (self._mm_to_pixels(self.canvas_size_mm[0]), self._mm_to_pixels(self.canvas_size_mm[1])), "black")
+        self._plotter_buffer_draw = ImageDraw.Draw(self._plotter_buffer)
+
+    def _raster_point(self, px, py):
+        self._collision_sat = None
+        thickness_px = self._mm_to_pixels(self.plotter_buffer_thickness)
+        self._plotter_buffer_draw.ellipse([px-thickness_px/2, py-thickness_px/2, px+thickness_px/2, py+thickness_px/2], fill="white")
+
+    def _raster_line(self, px1, py1, px2, py2):
+        self._collision_sat = None
+        thickness_px = self._mm_to_pixels(self.plotter_buffer_thickness)
+        self._plotter_buffer_draw.line([(px1, py1), (px2, py2)], fill="white", width=thickness_px)
+
+    def _raster_polyline(self, points_px):
+        self._collision_sat = None
         thickness_px = self._mm_to_pixels(self.plotter_buffer_thickness)
-        self.plotter_buffer_draw.line([start_point_px, end_point_px], fill="white", width=thickness_px)
+        self._plotter_buffer_draw.line([tuple(p) for p in points_px.tolist()], fill="white", width=thickness_px)
+
+    def _flush_raster(self):
+        """Rasterizes everything queued in lazy mode, converting coordinates in one pass."""
+        if self._raster_lines:
+            lines_px = np.rint(np.array(self._raster_lines) * 300 / 25.4).astype(int).tolist()
+            self._raster_lines = []
+            for px1, py1, px2, py2 in lines_px:
+                self._raster_line(px1, py1, px2, py2)
+        if self._raster_points:
+            points_px = np.rint(np.array(self._raster_points) * 300 / 25.4).astype(int).tolist()
+            self._raster_points = []
+            for px, py in points_px:
+                self._raster_point(px, py)
+        if self._raster_polylines:
+            for points in self._raster_polylines:
+                self._raster_polyline(np.rint(points * 300 / 25.4).astype(int))
+            self._raster_polylines = []
 
     def _mm_to_pixels(self, mm):
         return round(mm * 300 / 25.4)  
\ No newline at end of file
@@ -0,0 +1,88 @@
+import numpy as np
+
+
+def clip_segment(x1, y1, x2, y2, min_x, min_y, max_x, max_y):
+    """
+    Liang-Barsky clipping of a single segment against an axis-aligned box.
+    Returns the clipped (x1, y1, x2, y2), or None if the segment misses the box.
+    """
+    dx = x2 - x1
+    dy = y2 - y1
+    t0 = 0.0
+    t1 = 1.0
+    for p, q in ((-dx, x1 - min_x), (dx, max_x - x1), (-dy, y1 - min_y), (dy, max_y - y1)):
+        if p == 0:
+            if q < 0:
+                return None
+        elif p < 0:
+            t0 = max(t0, q / p)
+        else:
+            t1 = min(t1, q / p)
+    if t0 > t1:
+        return None
+    # Endpoints that needed no clipping come back bit-for-bit unchanged
+    if t1 < 1.0:
+        x2, y2 = x1 + t1 * dx, y1 + t1 * dy
+    if t0 > 0.0:
+        x1, y1 = x1 + t0 * dx, y1 + t0 * dy
+    return x1, y1, x2, y2
+
+
+def clip_segments(x1, y1, x2, y2, min_x, min_y, max_x, max_y):
+    """
+    Liang-Barsky clipping of many segments at once, vectorized over NumPy arrays.
+
+    Returns (keep, x1, y1, x2, y2) where keep is False for segments that miss
+    the box and the coordinates are the clipped segments. Degenerate segments
+    (points) are kept when they lie inside the box.
+    """
+    x1 = np.asarray(x1, dtype=float)
+    y1 = np.asarray(y1, dtype=float)
+    x2 = np.asarray(x2, dtype=float)
+    y2 = np.asarray(y2, dtype=float)
+    dx = x2 - x1
+    dy = y2 - y1
+    t0 = np.zeros_like(x1)
+    t1 = np.ones_like(x1)
+    keep = np.ones(x1.shape, dtype=bool)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for p, q in ((-dx, x1 - min_x), (dx, max_x - x1), (-dy, y1 - min_y), (dy, max_y - y1)):
+            r = q / p
+            keep &= (p != 0) | (q >= 0)
+            t0 = np.where(p < 0, np.maximum(t0, r), t0)
+            t1 = np.where(p > 0, np.minimum(t1, r), t1)
+    keep &= t0 <= t1
+    cx1 = np.where(t0 > 0, x1 + t0 * dx, x1)
+    cy1 = np.where(t0 > 0, y1 + t0 * dy, y1)
+    cx2 = np.where(t1 < 1, x1 + t1 * dx, x2)
+    cy2 = np.where(t1 < 1, y1 + t1 * dy, y2)
+    return keep, cx1, cy1, cx2, cy2
+
+
+def clip_polyline(points, min_x, min_y, max_x, max_y):
+    """
+    Clips an (N, 2) vertex array against a box. Returns the list of (M, 2)
+    runs that remain, the stroke is split wherever it leaves the box.
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    if len(points) < 2:
+        return []
+    sx, sy = points[:-1, 0], points[:-1, 1]
+    ex, ey = points[1:, 0], points[1:, 1]
+    keep, cx1, cy1, cx2, cy2 = clip_segments(sx, sy, ex, ey, min_x, min_y, max_x, max_y)
+    kept = np.flatnonzero(keep)
+    if len(kept) == 0:
+        return []
+    # Two neighbouring segments stay in one run unless the box cut through their shared vertex
+    start_cut = (cx1 != sx) | (cy1 != sy)
+    end_cut = (cx2 != ex) | (cy2 != ey)
+    joined = keep[:-1] & keep[1:] & ~end_cut[:-1] & ~start_cut[1:]
+    breaks = np.flatnonzero(~joined[kept[1:] - 1]) + 1
+    runs = []
+    for segments in np.split(kept, breaks):
+        run = np.empty((len(segments) + 1, 2))
+        run[:-1, 0] = cx1[segments]
+        run[:-1, 1] = cy1[segments]
+        run[-1] = (cx2[segments[-1]], cy2[segments[-1]])
+        runs.append(run)
+    return runs
@@ -0,0 +1,605 @@
+from collections.abc import Mapping, MutableMapping
+from copy import deepcopy
+import numpy as np
+
+NO_PID = np.iinfo(np.int64).min
+
+LINE_KEYS = ("type", "x1", "y1", "x2", "y2", "color", "thickness", "pid")
+POINT_KEYS = ("type", "x", "y", "color", "thickness", "pid")
+POLYLINE_KEYS = ("type", "points", "color", "thickness", "pid")
+OTHER_KEYS = ("type", "color", "thickness", "pid")
+
+# Keys that map onto a coordinate column, per op type
+_COORDS = {
+    "line": {"x1": "x1", "y1": "y1", "x2": "x2", "y2": "y2"},
+    "point": {"x": "x1", "y": "y1"},
+}
+
+
+def polyline_to_lines(op):
+    """Expands a polyline op into the equivalent list of two-point line ops."""
+    points = np.asarray(op["points"]).tolist()
+    return [{
+        "type": "line",
+        "x1": start[0],
+        "y1": start[1],
+        "x2": end[0],
+        "y2": end[1],
+        "color": op["color"],
+        "thickness": op["thickness"],
+        "pid": op["pid"]
+    } for start, end in zip(points[:-1], points[1:])]
+
+
+def op_identity(op):
+    """
+    Hashable identity of an op, the same for every OpView of one columnar
+    row. Use it to test whether an op is in a group, comparing ops by value
+    treats equal ops as the same one.
+    """
+    if isinstance(op, OpView):
+        return (id(op._stack), op._index)
+    return id(op)
+
+
+def ops_equal(a, b):
+    """Op equality that compares polyline "points" arrays by value."""
+    if a.keys() != b.keys():
+        return False
+    for key in a:
+        x, y = a[key], b[key]
+        if isinstance(x, np.ndarray) or isinstance(y, np.ndarray):
+            if not np.array_equal(x, y):
+                return False
+        elif x != y:
+            return False
+    return True
+
+
+class _Interner:
+    """Maps arbitrary hashable values (colors, thicknesses, types) to small integer codes."""
+    def __init__(self, values=()):
+        self.values = []
+        self.codes = {}
+        for value in values:
+            self.code(value)
+
+    def code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.values.append(value)
+            self.codes[value] = code
+        return code
+
+    def copy(self):
+        return _Interner(self.values)
+
+
+class OpView(MutableMapping):
+    """
+    Dict-like view of a single op stored in a ColumnarDrawStack.
+    Reads and writes go straight through to the underlying columns, so
+    operators written against dict ops keep working unchanged.
+    """
+    __slots__ = ("_stack", "_index")
+
+    def __init__(self, stack, index):
+        self._stack = stack
+        self._index = index
+
+    def __getitem__(self, key):
+        return self._stack._get(self._index, key)
+
+    def __setitem__(self, key, value):
+        self._stack._set(self._index, key, value)
+
+    def __delitem__(self, key):
+        self._stack._delete(self._index, key)
+
+    def __iter__(self):
+        return iter(self._stack._keys(self._index))
+
+    def __len__(self):
+        return len(self._stack._keys(self._index))
+
+    def __eq__(self, other):
+        if isinstance(other, OpView) and other._stack is self._stack and other._index == self._index:
+            return True
+        if not isinstance(other, Mapping):
+            return NotImplemented
+        return ops_equal(self, other)
+
+    __hash__ = None
+
+    def copy(self):
+        return dict(self.items())
+
+    def __copy__(self):
+        return self.copy()
+
+    def __deepcopy__(self, memo):
+        return deepcopy(self.copy(), memo)
+
+    def __repr__(self):
+        return repr(self.copy())
+
+
+_DTYPES = (
+    ("x1", np.float64),
+    ("y1", np.float64),
+    ("x2", np.float64),
+    ("y2", np.float64),
+    ("type", np.uint8),
+    ("color", np.uint16),
+    ("thickness", np.uint16),
+    ("pid", np.int64),
+)
+
+
+class _Block:
+    """
+    Fixed-size slab of rows: one array per column plus the sparse extra keys
+    and polyline vertex ranges of those rows, keyed by offset in the slab.
+    """
+    __slots__ = ("columns", "extra", "ranges")
+
+    def __init__(self, columns, extra=None, ranges=None):
+        self.columns = columns
+        self.extra = {} if extra is None else extra
+        self.ranges = {} if ranges is None else ranges
+
+    @classmethod
+    def empty(cls, size):
+        return cls({name: np.empty(size, dtype) for name, dtype in _DTYPES})
+
+    def copy(self):
+        return _Block({name: column.copy() for name, column in self.columns.items()},
+                      {offset: dict(extra) for offset, extra in self.extra.items()},
+                      dict(self.ranges))
+
+
+class ColumnarDrawStack:
+    """
+    Draw stack that keeps ops in NumPy columns instead of one dict per op.
+
+    Coordinates live in float64 columns (points use x1/y1), type, color and
+    thickness are stored as small integer codes and pid as int64. Keys that
+    don't fit a column (e.g. "mass" or "impulse" set by the simulation) are
+    kept in a sparse per-op dict. Polyline vertices are appended to shared
+    (M, 2) vertex pools and each polyline op records its range in a pool.
+    Iterating or indexing yields OpView objects that behave like the dicts
+    of a regular list-based draw stack.
+
+    Rows are stored in blocks of block_size. copy() only copies the list of
+    blocks, the copy and the original share them and whichever writes to a
+    shared block first gets a private copy of just that block. Vertex pools
+    are shared the same way, so cloning a large stack is cheap and a clone
+    that only appends never copies the rows it inherited.
+    """
+    block_size = 4096
+    vertex_block_size = 16384
+
+    def __init__(self, ops=None, capacity=1024):
+        self._size = 0
+        self._types = _Interner(("line", "point", "polyline"))
+        self._colors = _Interner()
+        self._thicknesses = _Interner()
+        self._blocks = []
+        self._owned = []
+        self._vertex_blocks = []
+        self._vertex_owned = []
+        self._vertex_fill = 0
+        self._reserve(capacity)
+        if ops is not None:
+            self.extend(ops)
+
+    # -- sequence protocol -------------------------------------------------
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        for i in range(self._size):
+            yield OpView(self, i)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [OpView(self, i) for i in range(*index.indices(self._size))]
+        if index < 0:
+            index += self._size
+        if index < 0 or index >= self._size:
+            raise IndexError("draw stack index out of range")
+        return OpView(self, index)
+
+    def __setitem__(self, index, op):
+        if index < 0:
+            index += self._size
+        if index < 0 or index >= self._size:
+            raise IndexError("draw stack index out of range")
+        op = dict(op)
+        block, offset = self._writable(index)
+        block.extra.pop(offset, None)
+        block.ranges.pop(offset, None)
+        self._write(index, op)
+
+    def __bool__(self):
+        return self._size > 0
+
+    def __iadd__(self, ops):
+        self.extend(ops)
+        return self
+
+    def __copy__(self):
+        return self.copy()
+
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+    def __repr__(self):
+        return f"ColumnarDrawStack({self._size} ops)"
+
+    def append(self, op):
+        self._reserve(self._size + 1)
+        index = self._size
+        self._size += 1
+        self._write(index, op)
+
+    def extend(self, ops):
+        if isinstance(ops, ColumnarDrawStack):
+            self._extend_columnar(ops)
+            return
+        for op in ops:
+            self.append(op)
+
+    def extend_lines(self, x1, y1, x2, y2, color=None, thickness=0.5, pid=None):
+        """
+        Appends line ops straight from coordinate arrays. color, thickness and
+        pid are either a single value or one value per line.
+        """
+        n = len(x1)
+        start = self._size
+        end = start + n
+        self._reserve(end)
+        values = {
+            "x1": np.asarray(x1, dtype=np.float64),
+            "y1": np.asarray(y1, dtype=np.float64),
+            "x2": np.asarray(x2, dtype=np.float64),
+            "y2": np.asarray(y2, dtype=np.float64),
+            "type": self._types.code("line"),
+        }
+        for name, table, value in (("color", self._colors, color), ("thickness", self._thicknesses, thickness)):
+            if np.ndim(value) == 0:
+                values[name] = table.code(value)
+            else:
+                values[name] = np.array([table.code(v) for v in value], dtype=np.int64)
+        if np.ndim(pid) == 0:
+            values["pid"] = NO_PID if pid is None else pid
+        else:
+            values["pid"] = np.array([NO_PID if p is None else p for p in pid], dtype=np.int64)
+        self._write_columns(start, end, values)
+        self._size = end
+
+    def clear(self):
+        # Drop the blocks rather than reuse them, a clone may still share them
+        self._size = 0
+        self._blocks = []
+        self._owned = []
+        self._vertex_blocks = []
+        self._vertex_owned = []
+        self._vertex_fill = 0
+
+    def copy(self):
+        """Copy-on-write clone, O(number of blocks) regardless of how many ops are stored."""
+        clone = ColumnarDrawStack(capacity=0)
+        used = -(-self._size // self.block_size)
+        clone._size = self._size
+        clone._types = self._types.copy()
+        clone._colors = self._colors.copy()
+        clone._thicknesses = self._thicknesses.copy()
+        clone._blocks = self._blocks[:used]
+        clone._owned = [False] * used
+        self._owned[:used] = [False] * used
+        clone._vertex_blocks = list(self._vertex_blocks)
+        clone._vertex_owned = [False] * len(self._vertex_blocks)
+        self._vertex_owned = [False] * len(self._vertex_blocks)
+        clone._vertex_fill = self._vertex_fill
+        return clone
+
+    def take(self, rows):
+        """
+        New stack holding the ops at rows, in that order. Rows may repeat.
+        Polyline vertices are shared with this stack copy-on-write.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        taken = ColumnarDrawStack(capacity=len(rows))
+        taken._types = self._types.copy()
+        taken._colors = self._colors.copy()
+        taken._thicknesses = self._thicknesses.copy()
+        taken._write_columns(0, len(rows), {name: self.column(name)[rows] for name, _ in _DTYPES})
+        taken._size = len(rows)
+        extra = dict(self._sparse("extra"))
+        ranges = dict(self._sparse("ranges"))
+        if ranges:
+            taken._vertex_blocks = list(self._vertex_blocks)
+            taken._vertex_owned = [False] * len(self._vertex_blocks)
+            self._vertex_owned = [False] * len(self._vertex_blocks)
+        if extra or ranges:
+            sparse = np.fromiter(set(extra) | set(ranges), dtype=np.int64)
+            for position in np.flatnonzero(np.isin(rows, sparse)).tolist():
+                row = int(rows[position])
+                block, offset = taken._locate(position)
+                if row in extra:
+                    block.extra[offset] = deepcopy(extra[row])
+                if row in ranges:
+                    block.ranges[offset] = ranges[row]
+        return taken
+
+    def set_coords(self, rows, x1, y1, x2, y2):
+        """Writes new endpoints for the line ops at rows, all arguments are arrays of equal length."""
+        rows = np.asarray(rows, dtype=np.int64)
+        blocks, offsets = np.divmod(rows, self.block_size)
+        order = np.argsort(blocks, kind="stable")
+        edges = np.flatnonzero(np.diff(blocks[order])) + 1
+        for group in np.split(order, edges):
+            if len(group) == 0:
+                continue
+            columns = self._writable_block(int(blocks[group[0]])).columns
+            for name, values in (("x1", x1), ("y1", y1), ("x2", x2), ("y2", y2)):
+                columns[name][offsets[group]] = np.asarray(values)[group]
+
+    def sort(self, key=None, reverse=False):
+        if key is None:
+            raise TypeError("ColumnarDrawStack.sort requires a key")
+        keys = [key(op) for op in self]
+        order = sorted(range(self._size), key=keys.__getitem__, reverse=reverse)
+        self._permute(np.asarray(order, dtype=np.int64))
+
+    # -- columnar access ---------------------------------------------------
+
+    def column(self, name, start=0, stop=None):
+        """
+        Returns the named column (x1, y1, x2, y2, type, color, thickness, pid)
+        for rows start:stop as a new array. Writes to it don't reach the stack.
+        """
+        stop = self._size if stop is None else min(stop, self._size)
+        parts = [self._blocks[block].columns[name][lo:hi] for block, lo, hi, _ in self._spans(start, stop)]
+        if not parts:
+            return np.empty(0, dict(_DTYPES)[name])
+        return np.concatenate(parts)
+
+    def type_code(self, type):
+        return self._types.codes.get(type)
+
+    def type_values(self):
+        return list(self._types.values)
+
+    def color_values(self):
+        return list(self._colors.values)
+
+    def thickness_values(self):
+        return list(self._thicknesses.values)
+
+    # -- internals ---------------------------------------------------------
+
+    def _reserve(self, size):
+        while len(self._blocks) * self.block_size < size:
+            self._blocks.append(_Block.empty(self.block_size))
+            self._owned.append(True)
+
+    def _spans(self, start, end):
+        """Yields (block, lo, hi, position in start:end) for each block overlapping rows start:end."""
+        position = start
+        while position < end:
+            block, lo = divmod(position, self.block_size)
+            hi = min(self.block_size, lo + end - position)
+            yield block, lo, hi, position - start
+            position += hi - lo
+
+    def _locate(self, index):
+        block, offset = divmod(index, self.block_size)
+        return self._blocks[block], offset
+
+    def _writable_block(self, block):
+        if not self._owned[block]:
+            self._blocks[block] = self._blocks[block].copy()
+            self._owned[block] = True
+        return self._blocks[block]
+
+    def _writable(self, index):
+        block, offset = divmod(index, self.block_size)
+        return self._writable_block(block), offset
+
+    def _write_columns(self, start, end, values):
+        """Writes rows start:end from a dict of scalars or arrays of length end - start."""
+        for block, lo, hi, position in self._spans(start, end):
+            columns = self._writable_block(block).columns
+            for name, value in values.items():
+                if np.ndim(value) == 0:
+                    columns[name][lo:hi] = value
+                else:
+                    columns[name][lo:hi] = value[position:position + hi - lo]
+
+    def _sparse(self, name):
+        """Yields (index, value) for the extra keys ("extra") or vertex ranges ("ranges") of all rows."""
+        for block_index, block in enumerate(self._blocks):
+            base = block_index * self.block_size
+            for offset, value in getattr(block, name).items():
+                if base + offset < self._size:
+                    yield base + offset, value
+
+    def _add_vertices(self, points):
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        count = len(points)
+        pools = self._vertex_blocks
+        # A polyline never straddles two pools, and shared pools are never appended to
+        if not pools or not self._vertex_owned[-1] or self._vertex_fill + count > len(pools[-1]):
+            pools.append(np.empty((max(self.vertex_block_size, count), 2), np.float64))
+            self._vertex_owned.append(True)
+            self._vertex_fill = 0
+        start = self._vertex_fill
+        pools[-1][start:start + count] = points
+        self._vertex_fill += count
+        return len(pools) - 1, start, count
+
+    def _points(self, block, offset):
+        pool, start, count = block.ranges[offset]
+        points = self._vertex_blocks[pool][start:start + count]
+        # Pools may be shared with a clone, changes go through op["points"] = ...
+        points.flags.writeable = False
+        return points
+
+    def _write(self, index, op):
+        block, offset = self._writable(index)
+        columns = block.columns
+        type = op.get("type", "line")
+        columns["type"][offset] = self._types.code(type)
+        if type == "point":
+            columns["x1"][offset] = columns["x2"][offset] = op["x"]
+            columns["y1"][offset] = columns["y2"][offset] = op["y"]
+        elif type == "line":
+            columns["x1"][offset] = op["x1"]
+            columns["y1"][offset] = op["y1"]
+            columns["x2"][offset] = op["x2"]
+            columns["y2"][offset] = op["y2"]
+        else:
+            columns["x1"][offset] = columns["y1"][offset] = np.nan
+            columns["x2"][offset] = columns["y2"][offset] = np.nan
+            if type == "polyline":
+                block.ranges[offset] = self._add_vertices(op["points"])
+        columns["color"][offset] = self._colors.code(op.get("color"))
+        columns["thickness"][offset] = self._thicknesses.code(op.get("thickness", 0.5))
+        pid = op.get("pid")
+        columns["pid"][offset] = NO_PID if pid is None else pid
+
+        known = self._known_keys(type)
+        extra = {k: v for k, v in op.items() if k not in known}
+        if extra:
+            block.extra[offset] = extra
+
+    def _extend_columnar(self, other):
+        n = len(other)
+        start = self._size
+        self._reserve(start + n)
+        values = {name: other.column(name) for name in ("x1", "y1", "x2", "y2", "pid")}
+        # Re-code the interned columns into this stack's tables
+        for name, mine, theirs in (("type", self._types, other._types),
+                                   ("color", self._colors, other._colors),
+                                   ("thickness", self._thicknesses, other._thicknesses)):
+            remap = np.array([mine.code(value) for value in theirs.values], dtype=np.int64)
+            if len(remap):
+                values[name] = remap[other.column(name)]
+        self._write_columns(start, start + n, values)
+        for index, extra in list(other._sparse("extra")):
+            block, offset = self._writable(start + index)
+            block.extra[offset] = deepcopy(extra)
+        for index, _ in list(other._sparse("ranges")):
+            points = other._points(*other._locate(index))
+            block, offset = self._writable(start + index)
+            block.ranges[offset] = self._add_vertices(points)
+        self._size += n
+
+    def _permute(self, order):
+        size = self._size
+        values = {name: self.column(name)[order] for name, _ in _DTYPES}
+        position = np.empty(size, dtype=np.int64)
+        position[order] = np.arange(size)
+        extra = [(int(position[index]), dict(value)) for index, value in self._sparse("extra")]
+        ranges = [(int(position[index]), value) for index, value in self._sparse("ranges")]
+        # Rebuild into fresh blocks, the vertex pools are left as they are
+        self._blocks = []
+        self._owned = []
+        self._reserve(size)
+        self._write_columns(0, size, values)
+        for index, value in extra:
+            block, offset = self._locate(index)
+            block.extra[offset] = value
+        for index, value in ranges:
+            block, offset = self._locate(index)
+            block.ranges[offset] = value
+
+    def _type(self, index):
+        block, offset = self._locate(index)
+        return self._types.values[block.columns["type"][offset]]
+
+    def _known_keys(self, type):
+        if type == "line":
+            return LINE_KEYS
+        if type == "point":
+            return POINT_KEYS
+        if type == "polyline":
+            return POLYLINE_KEYS
+        return OTHER_KEYS
+
+    def _keys(self, index):
+        keys = self._known_keys(self._type(index))
+        block, offset = self._locate(index)
+        extra = block.extra.get(offset)
+        if extra:
+            return keys + tuple(extra)
+        return keys
+
+    def _get(self, index, key):
+        block, offset = self._locate(index)
+        columns = block.columns
+        type = self._types.values[columns["type"][offset]]
+        if key == "type":
+            return type
+        column = _COORDS.get(type, {}).get(key)
+        if column is not None:
+            return float(columns[column][offset])
+        if key == "color":
+            return self._colors.values[columns["color"][offset]]
+        if key == "thickness":
+            return self._thicknesses.values[columns["thickness"][offset]]
+        if key == "pid":
+            pid = columns["pid"][offset]
+            return None if pid == NO_PID else int(pid)
+        if key == "points" and type == "polyline":
+            return self._points(block, offset)
+        extra = block.extra.get(offset)
+        if extra is not None and key in extra:
+            return extra[key]
+        raise KeyError(key)
+
+    def _set(self, index, key, value):
+        type = self._type(index)
+        if key == "type":
+            if value != type:
+                op = OpView(self, index).copy()
+                op["type"] = value
+                self[index] = op
+            return
+        block, offset = self._writable(index)
+        columns = block.columns
+        column = _COORDS.get(type, {}).get(key)
+        if column is not None:
+            columns[column][offset] = value
+            if type == "point":
+                columns[column.replace("1", "2")][offset] = value
+        elif key == "color":
+            columns["color"][offset] = self._colors.code(value)
+        elif key == "thickness":
+            columns["thickness"][offset] = self._thicknesses.code(value)
+        elif key == "pid":
+            columns["pid"][offset] = NO_PID if value is None else value
+        elif key == "points" and type == "polyline":
+            pool, start, count = block.ranges[offset]
+            value = np.asarray(value, dtype=np.float64).reshape(-1, 2)
+            if len(value) == count and self._vertex_owned[pool]:
+                self._vertex_blocks[pool][start:start + count] = value
+            else:
+                block.ranges[offset] = self._add_vertices(value)
+        else:
+            block.extra.setdefault(offset, {})[key] = value
+
+    def _delete(self, index, key):
+        block, offset = self._locate(index)
+        extra = block.extra.get(offset)
+        if extra is None or key not in extra:
+            raise KeyError(key)
+        block, offset = self._writable(index)
+        extra = block.extra[offset]
+        del extra[key]
+        if not extra:
+            del block.extra[offset]
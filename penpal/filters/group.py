@@ -10,11 +10,7 @@ class Group:
         return self
 
     def expand_pids(self):
-        ids = []
-        for op in self.ops:
-            ids.append(op["pid"])
-        pid_set = set(ids)
-        self.ops = [op for op in self.canvas.draw_stack if op["pid"] in pid_set]
+        self.ops = self.canvas.ops_with_pids([op["pid"] for op in self.ops])
         return self
 
     def remove_pids(self, pids):
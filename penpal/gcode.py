@@ -1,4 +1,5 @@
 import random, re
+import numpy as np
 from penpal.utils import hex_to_color_name
 
 class GCode:
@@ -68,6 +69,32 @@ class GCode:
                         self.state_x = line_end_x
                         self.state_y = line_end_y
 
+                if op["type"] == "polyline":
+                    # flip y vertically 
+                    points = [(x, self.canvas.canvas_size_mm[1] - y) for x, y in np.asarray(op["points"]).tolist()]
+                    start_x, start_y = points[0]
+
+                    if self.verbose:
+                        self.gcode.append(f"; Polyline from {start_x}, {start_y} through {len(points)} points")
+
+                    if not self._is_close_to(start_x, start_y, self.state_z):
+                        self.gcode.append(f"G0 Z{self.pen_up_z:.2f}")
+                        self.state_z = self.pen_up_z
+                        self._dwell()
+
+                        self.gcode.append(f"G0 X{start_x:.2f} Y{start_y:.2f} F{self.move_speed}")
+                        self.state_x = start_x
+                        self.state_y = start_y
+
+                        self.gcode.append(f"G0 Z{self.pen_down_z}")
+                        self.state_z = self.pen_down_z
+                        self._dwell()
+
+                    # The whole stroke is drawn with the pen down, no per-segment connectivity checks
+                    for x, y in points[1:]:
+                        self.gcode.append(f"G1 X{x:.2f} Y{y:.2f} F{self.draw_speed}")
+                    self.state_x, self.state_y = points[-1]
+
                 if op["type"] == "point":
                     point_x = op["x"]
                     point_y = self.canvas.canvas_size_mm[1] - op["y"] 
@@ -1,4 +1,5 @@
 from PIL import Image
+import numpy as np
 
 class ImageField:
     def __init__(self, canvas, image, dpi=300):
@@ -37,6 +38,7 @@ class ImageField:
         self.image = self.image.resize(self.canvas_size_px)
         # paste self.image onto self.field
         self.field.paste(self.image, (0, 0))
+        self._field_array = None
 
     def threshold(self, min_value, max_value):
         self.threshold_min_value = min_value
@@ -84,3 +86,19 @@ class ImageField:
         else:   
             return self._get_float(x, y)
 
+    def get_floats(self, xs_mm, ys_mm):
+        """get_float for arrays of coordinates."""
+        if self._field_array is None:
+            self._field_array = np.asarray(self.field, dtype=np.float64) / 255.0
+        x = np.asarray(xs_mm, dtype=np.float64) * self.dpi / 25.4
+        y = np.asarray(ys_mm, dtype=np.float64) * self.dpi / 25.4
+        x = np.trunc(x).astype(np.int64)
+        y = np.trunc(y).astype(np.int64)
+        inside = (x >= 0) & (y >= 0) & (x < self.canvas_size_px[0]) & (y < self.canvas_size_px[1])
+        values = np.zeros(x.shape)
+        value = self._field_array[y[inside], x[inside]]
+        values[inside] = np.where(value < self.threshold_min_value, 0.0,
+                                  np.where(value > self.threshold_max_value, 1.0, value ** self.gamma_value))
+        if self.is_inversed:
+            return 1.0 - values
+        return values
@@ -11,11 +11,7 @@ class PointGrid:
         self.hspacing = hspacing
         self.additional_margin = additional_margin
         self.hex_pattern = hex_pattern
-        self.start_id = 0 
-        for op in self.canvas.draw_stack:
-            if op["type"] == "point":
-                if op["pid"] > self.start_id:
-                    self.start_id = op["pid"]
+        self.start_id = self.canvas.max_pid(type="point")
 
 
     def generate(self, density=1.0):
@@ -35,11 +31,7 @@ class PointGrid:
 class AddPointTool:
     def __init__(self, canvas):
         self.canvas = canvas    
-        self.start_id = 0 
-        for op in self.canvas.draw_stack:
-            if op["type"] == "point":
-                if op["pid"] > self.start_id:
-                    self.start_id = op["pid"]
+        self.start_id = self.canvas.max_pid(type="point")
 
     def add_point(self, x, y):
         self.canvas.point(x, y, pid=self.start_id)
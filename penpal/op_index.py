@@ -0,0 +1,107 @@
+from penpal.draw_stack import ColumnarDrawStack, NO_PID
+
+# pid placeholder for ops that have no "pid" key at all
+_NO_KEY = object()
+
+
+class OpIndex:
+    """
+    pid -> ops and type -> ops lookup over a draw stack, plus the largest pid
+    in use overall and per type.
+
+    Works like SpatialIndex: ops appended since the last sync are indexed on
+    the next sync, and the index is rebuilt when the stack is replaced or
+    shrinks. Ops whose pid or type is changed in place are not tracked, call
+    rebuild() after those. Lists hold op indices in draw stack order, and
+    groups are ordered by the first op of each pid, like a scan of the stack.
+    Ops without a "pid" key are left out of the pid lookup.
+    """
+    def __init__(self):
+        self.stack = None
+        self.indexed = 0
+        self.clear()
+
+    def clear(self):
+        self.by_pid = {}
+        self.by_type = {}
+        self.by_type_pid = {}
+        self.max_pid_all = None
+        self.max_pid_by_type = {}
+
+    def rebuild(self, stack=None):
+        self.clear()
+        self.stack = stack if stack is not None else self.stack
+        self.indexed = 0
+        if self.stack is not None:
+            self.sync(self.stack)
+
+    def sync(self, stack):
+        if stack is not self.stack or len(stack) < self.indexed:
+            self.clear()
+            self.stack = stack
+            self.indexed = 0
+        if len(stack) == self.indexed:
+            return
+        start = self.indexed
+        self.indexed = len(stack)
+        self.insert(range(start, len(stack)), *self._columns(stack, start))
+
+    def insert(self, indices, types, pids):
+        by_pid = self.by_pid
+        by_type = self.by_type
+        by_type_pid = self.by_type_pid
+        max_pid_by_type = self.max_pid_by_type
+        for index, type, pid in zip(indices, types, pids):
+            of_type = by_type.get(type)
+            if of_type is None:
+                of_type = by_type[type] = []
+                by_type_pid[type] = {}
+            of_type.append(index)
+            if pid is _NO_KEY:
+                continue
+            group = by_pid.get(pid)
+            if group is None:
+                by_pid[pid] = [index]
+            else:
+                group.append(index)
+            group = by_type_pid[type].get(pid)
+            if group is None:
+                by_type_pid[type][pid] = [index]
+            else:
+                group.append(index)
+            if pid is not None:
+                if self.max_pid_all is None or pid > self.max_pid_all:
+                    self.max_pid_all = pid
+                current = max_pid_by_type.get(type)
+                if current is None or pid > current:
+                    max_pid_by_type[type] = pid
+
+    def max_pid(self, type=None):
+        """Largest pid in use (optionally among ops of one type), None if there is none."""
+        if type is None:
+            return self.max_pid_all
+        return self.max_pid_by_type.get(type)
+
+    def pid_groups(self, type=None):
+        """{pid: [op index, ...]}, optionally restricted to ops of one type."""
+        if type is None:
+            return self.by_pid
+        return self.by_type_pid.get(type, {})
+
+    def of_type(self, type):
+        return self.by_type.get(type, [])
+
+    def _columns(self, stack, start):
+        """Type and pid of ops[start:] as two lists."""
+        if isinstance(stack, ColumnarDrawStack):
+            values = stack.type_values()
+            types = [values[code] for code in stack.column("type", start).tolist()]
+            pids = [None if pid == NO_PID else pid for pid in stack.column("pid", start).tolist()]
+            return types, pids
+        types = []
+        pids = []
+        for index in range(start, len(stack)):
+            op = stack[index]
+            types.append(op["type"])
+            pids.append(op["pid"] if "pid" in op else _NO_KEY)
+        return types, pids
@@ -20,6 +20,9 @@ class ApplyColor:
                     field_step = 1.0 / num_colors
                     if draw_command["type"] == "line":
                         color_index = int(self.field.get_float(draw_command["x1"], draw_command["y1"]) / field_step) - 1
+                    elif draw_command["type"] == "polyline":
+                        x, y = draw_command["points"][0]
+                        color_index = int(self.field.get_float(x, y) / field_step) - 1
                     else:
                         color_index = int(self.field.get_float(draw_command["x"], draw_command["y"]) / field_step) - 1
                     draw_command["color"] = self.color[color_index]
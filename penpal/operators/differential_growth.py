@@ -1,5 +1,9 @@
 import math
 import random
+import numpy as np
+
+from penpal.draw_stack import op_identity
+
 class DifferentialGrowth:
     def __init__(
         self, 
@@ -28,19 +32,15 @@ class DifferentialGrowth:
         
         # Exclude ops that aren't in the group, if group is given
         if self.group is not None:
-            for op in self.canvas.draw_stack:
-                if op not in self.group.ops:
-                    self.excluded_ops.append(op)
+            members = {op_identity(op) for op in self.group.ops}
+            self.excluded_ops = [op for op in self.canvas.draw_stack if op_identity(op) not in members]
 
     def _group_by_pid(self):
         """Group elements by their pid."""
+        if not self.group:
+            return self.canvas.ops_by_pid()
         groups = {}
-        if self.group:
-            ops_to_process = self.group.ops
-        else:
-            ops_to_process = self.canvas.draw_stack
-
-        for op in ops_to_process:
+        for op in self.group.ops:
             # If lines don't have a "pid" at all, nothing gets grouped
             if "pid" in op:
                 pid = op["pid"]
@@ -59,6 +59,16 @@ class DifferentialGrowth:
         
         # First pass - collect all points
         for line in lines:
+            if line["type"] == "polyline":
+                # Polylines carry their vertices in order already
+                for x, y in np.asarray(line["points"]).tolist():
+                    key = get_point_key(x, y)
+                    if key not in seen_points:
+                        seen_points[key] = len(nodes)
+                        nodes.append({"pos": [x, y], "fixed": False})
+                continue
+            if line["type"] != "line":
+                continue
             p1 = get_point_key(line["x1"], line["y1"])
             p2 = get_point_key(line["x2"], line["y2"])
             
@@ -213,6 +223,9 @@ class DifferentialGrowth:
             return new_lines
         
         line_template = original_lines[0].copy()
+        if line_template["type"] == "polyline":
+            line_template["points"] = np.array([node["pos"] for node in nodes])
+            return [line_template]
         
         # Create lines between consecutive points
         for i in range(len(nodes) - 1):  # Note: -1 because we added an extra closing node
@@ -1,3 +1,4 @@
+import numpy as np
 class ApplyField:
     def __init__(self, canvas, field):
         self.canvas = canvas
@@ -14,6 +15,14 @@ class ApplyField:
                 op["x2"] += field_x * strength
                 op["y2"] += field_y * strength 
 
+            if op["type"] == "polyline":
+                points = [list(p) for p in op["points"]]
+                for p in points:
+                    field_x, field_y = self.field.get_vector(p[0], p[1])
+                    p[0] += field_x * strength
+                    p[1] += field_y * strength
+                op["points"] = np.array(points)
+
             if op["type"] == "point":
                 field_x, field_y = self.field.get_vector(op["x"], op["y"])
                 op["x"] += field_x * strength
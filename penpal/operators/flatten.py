@@ -1,3 +1,7 @@
+import numpy as np
+from penpal.draw_stack import op_identity
+
+
 class Flatten:
     def __init__(self, canvas, axis="x", strength=1.0, group=None):
         self.canvas = canvas
@@ -6,19 +10,15 @@ class Flatten:
         self.strength = strength
         self.excluded_ops = []
         if self.group is not None:
-            for op in self.canvas.draw_stack:
-                found = False
-                for opg in self.group.ops:
-                    if opg == op:
-                        found = True
-                        break
-                if not found:
-                    self.excluded_ops.append(op)
+            members = {op_identity(op) for op in self.group.ops}
+            self.excluded_ops = [op for op in self.canvas.draw_stack if op_identity(op) not in members]
 
     def _group_by_pid(self):
         """Group elements by their pid"""
+        if self.group is None:
+            return self.canvas.ops_by_pid()
         groups = {}
-        for op in self.group.ops if self.group is not None else self.canvas.draw_stack:
+        for op in self.group.ops:
             if "pid" in op:
                 pid = op["pid"]
                 if pid not in groups:
@@ -51,6 +51,11 @@ class Flatten:
                     else:
                         total += op["x"]
                     count += 1
+                elif op["type"] == "polyline":
+                    # Every vertex counts, like both ends of a line
+                    points = np.asarray(op["points"], dtype=np.float64).reshape(-1, 2)
+                    total += points[:, 1 if self.axis == "x" else 0].sum()
+                    count += len(points)
             
             if count == 0:
                 continue
@@ -74,6 +79,11 @@ class Flatten:
                         op["y"] = op["y"] + (target - op["y"]) * self.strength
                     else:
                         op["x"] = op["x"] + (target - op["x"]) * self.strength
+                elif op["type"] == "polyline":
+                    points = np.array(op["points"], dtype=np.float64).reshape(-1, 2)
+                    column = 1 if self.axis == "x" else 0
+                    points[:, column] += (target - points[:, column]) * self.strength
+                    op["points"] = points
         
         # Update canvas
         if self.group is not None:
@@ -1,3 +1,7 @@
+import numpy as np
+from penpal.draw_stack import op_identity, polyline_to_lines
+
+
 class LineRepel:
     def __init__(self, canvas, strength=1.0, radius=10.0, iterations=10, group=None):
         self.canvas = canvas
@@ -9,25 +13,28 @@ class LineRepel:
         self.cell_size = radius * 2
         
         if self.group is not None:
-            for op in self.canvas.draw_stack:
-                found = False
-                for opg in self.group.ops:
-                    if opg == op:
-                        found = True
-                        break
-                if not found:
-                    self.excluded_ops.append(op)
+            members = {op_identity(op) for op in self.group.ops}
+            self.excluded_ops = [op for op in self.canvas.draw_stack if op_identity(op) not in members]
 
-    def _group_lines_by_pid(self):
+    def _group_lines_by_pid(self, type="line"):
+        if self.group is None:
+            return self.canvas.ops_by_pid(type=type)
         lines_by_pid = {}
-        for op in self.canvas.draw_stack if self.group is None else self.group.ops:
-            if op["type"] == "line":
+        for op in self.group.ops:
+            if op["type"] == type:
                 pid = op["pid"]
                 if pid not in lines_by_pid:
                     lines_by_pid[pid] = []
                 lines_by_pid[pid].append(op)
         return lines_by_pid
 
+    def _segments_by_pid(self, lines_by_pid, polylines_by_pid):
+        """Lines and the segments of the polylines (as temporary line ops) per pid"""
+        segments = {pid: list(lines) for pid, lines in lines_by_pid.items()}
+        for pid, polylines in polylines_by_pid.items():
+            segments.setdefault(pid, []).extend(line for op in polylines for line in polyline_to_lines(op))
+        return segments
+
     def _get_cell_coords(self, x, y):
         return (int(x / self.cell_size), int(y / self.cell_size))
 
@@ -144,9 +151,11 @@ class LineRepel:
 
     def apply(self):
         lines_by_pid = self._group_lines_by_pid()
+        # Polylines repel with their segments and move as a whole with their pid
+        polylines_by_pid = self._group_lines_by_pid(type="polyline")
         
         for _ in range(self.iterations):
-            movements = self._calculate_repulsion(lines_by_pid)
+            movements = self._calculate_repulsion(self._segments_by_pid(lines_by_pid, polylines_by_pid))
             
             # Apply average movement to each pid group as a whole
             for pid, moves in movements.items():
@@ -158,13 +167,17 @@ class LineRepel:
                 avg_dy = sum(dy for dx, dy in moves) / len(moves)
                 
                 # Apply the same movement to all lines in the group
-                for line in lines_by_pid[pid]:
+                for line in lines_by_pid.get(pid, []):
                     line["x1"] += avg_dx
                     line["y1"] += avg_dy
                     line["x2"] += avg_dx
                     line["y2"] += avg_dy
+                for op in polylines_by_pid.get(pid, []):
+                    op["points"] = np.asarray(op["points"], dtype=np.float64).reshape(-1, 2) + (avg_dx, avg_dy)
         
         # Update canvas
-        self.canvas.draw_stack = self.excluded_ops + [op for op in self.canvas.draw_stack if op["type"] != "line"] + [
+        excluded = {op_identity(op) for op in self.excluded_ops}
+        self.canvas.draw_stack = self.excluded_ops + [op for op in self.canvas.draw_stack
+                                                      if op["type"] != "line" and op_identity(op) not in excluded] + [
             line for lines in lines_by_pid.values() for line in lines
         ]
\ No newline at end of file
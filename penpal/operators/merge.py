@@ -1,6 +1,6 @@
 import math
-from copy import deepcopy
 import tqdm
+from penpal.draw_stack import ColumnarDrawStack, polyline_to_lines
 class Merge:
     def __init__(self, margin = 0.0):
         self.margin = margin
@@ -61,15 +61,8 @@ class Merge:
     
     def _has_space_for_point(self, canvas, px, py):
         """Check if there's enough space around a point."""
-        for op in canvas.draw_stack:
-            if op["type"] == "point":
-                if Merge.distance_point_to_point(px, py, op["x"], op["y"]) <= self.margin:
-                    return False
-            elif op["type"] == "line":
-                if Merge.distance_point_to_line(px, py, op["x1"], op["y1"], 
-                                       op["x2"], op["y2"]) <= self.margin:
-                    return False
-        return True
+        return not canvas.query_radius(px, py, self.margin)
+
     def _split_line(self, x1, y1, x2, y2, step=1.0):
         """Split a line into smaller segments."""
         segments = []
@@ -94,31 +87,34 @@ class Merge:
     
     def _has_space_for_line_segment(self, canvas, x1, y1, x2, y2):
         """Check if there's enough space around a line segment."""
-        for op in canvas.draw_stack:
-            if op["type"] == "point":
-                if Merge.distance_point_to_line(op["x"], op["y"], x1, y1, x2, y2) <= self.margin:
-                    return False
-            elif op["type"] == "line":
-                if Merge.lines_intersect(x1, y1, x2, y2, 
-                                op["x1"], op["y1"], 
-                                op["x2"], op["y2"], 
-                                self.margin):
-                    return False
-        return True
+        return not canvas.query_segment(x1, y1, x2, y2, self.margin)
     
     
     def apply(self, canvas_1, canvas_2):
         new_canvas = canvas_1.clone()
+        # Segments are split to margin length, so a cell a few margins wide keeps candidate lists short
+        new_canvas.enable_spatial_index(cell_size=max(self.margin * 4, 1.0))
         
         if self.margin <= 0.0:
             # Simple merge without margin checking
-            new_canvas.draw_stack.extend(deepcopy(canvas_2.draw_stack))
+            if isinstance(new_canvas.draw_stack, ColumnarDrawStack) and isinstance(canvas_2.draw_stack, ColumnarDrawStack):
+                new_canvas.draw_stack.extend(canvas_2.draw_stack)
+            else:
+                new_canvas.draw_stack.extend(dict(op) for op in canvas_2.draw_stack)
             return new_canvas
             
-        for op in tqdm.tqdm(canvas_2.draw_stack):
+        ops = []
+        for op in canvas_2.draw_stack:
+            # Polylines are merged segment by segment, like any other line
+            if op["type"] == "polyline":
+                ops.extend(polyline_to_lines(op))
+            else:
+                ops.append(op)
+
+        for op in tqdm.tqdm(ops):
             if op["type"] == "point":
                 if self._has_space_for_point(new_canvas, op["x"], op["y"]):
-                    new_canvas.draw_stack.append(deepcopy(op))
+                    new_canvas.draw_stack.append(dict(op))
                     
             elif op["type"] == "line":
                 # Split the line into smaller segments
@@ -148,7 +144,7 @@ class Merge:
                 
                 # Create new line operations for valid segments
                 for seg_x1, seg_y1, seg_x2, seg_y2 in valid_segments:
-                    new_op = deepcopy(op)
+                    new_op = dict(op)
                     new_op.update({
                         "x1": seg_x1,
                         "y1": seg_y1,
@@ -1,4 +1,5 @@
 import random
+import numpy as np
 
 class Noise:
     def __init__(self, canvas, noise_x_level=0.5, noise_y_level=0.5):
@@ -21,6 +22,19 @@ class Noise:
                 prev_x_noise = new_noise_x
                 prev_y_noise = new_noise_y
             
+            if op["type"] == "polyline":
+                # The first vertex continues from the previous op like a line start, the others get their own noise
+                points = np.array(op["points"], dtype=np.float64).reshape(-1, 2)
+                if len(points):
+                    points[0] += (prev_x_noise, prev_y_noise)
+                    for vertex in points[1:]:
+                        new_noise_x = random.uniform(-self.noise_x_level, self.noise_x_level)
+                        new_noise_y = random.uniform(-self.noise_y_level, self.noise_y_level)
+                        vertex += (new_noise_x, new_noise_y)
+                        prev_x_noise = new_noise_x
+                        prev_y_noise = new_noise_y
+                    op["points"] = points
+
             if op["type"] == "point":
                 op["x"] += prev_x_noise
                 op["y"] += prev_y_noise
@@ -1,6 +1,7 @@
 import math
 import random
 from copy import deepcopy
+from penpal.draw_stack import polyline_to_lines
 
 class Offset:
     def __init__(self, canvas, offset_distance, count=1, continuity_threshold=0.1, rule=None, group=None):
@@ -72,6 +73,11 @@ class Offset:
             
         return groups
 
+    def _polyline_groups(self):
+        """Polylines are already connected, each one is a group of its segments."""
+        ops = self.group.ops if self.group else self.canvas.draw_stack
+        return [polyline_to_lines(op) for op in ops if op["type"] == "polyline" and len(op["points"]) >= 2]
+
     def _offset_line(self, x1, y1, x2, y2, offset_multiplier=1):
         """Offset a single line segment by the perpendicular distance."""
         nx, ny = self._get_line_normal(x1, y1, x2, y2)
@@ -133,7 +139,8 @@ class Offset:
     def apply(self, chance=1.0):
         max_pid = self.canvas.max_pid()
         # Process lines by connected groups
-        connected_groups = self._find_connected_lines()
+        connected_groups = [(group, False) for group in self._find_connected_lines()]
+        connected_groups += [(group, True) for group in self._polyline_groups()]
         final_connected_groups = []
         for group in connected_groups:
             if random.random() > chance:
@@ -143,7 +150,7 @@ class Offset:
         # Create and add offset lines for each count
         for offset_num in range(1, self.count + 1):
             # Create and add offset lines for each group
-            for group in connected_groups:
+            for group, is_polyline in connected_groups:
                 offset_lines = []
                 
                 # Handle single line case
@@ -189,6 +196,11 @@ class Offset:
                     offset_lines.append(new_line)
                 
                 # Add offset lines to the canvas
+                if is_polyline:
+                    points = [(line["x1"], line["y1"]) for line in offset_lines] + [(offset_lines[-1]["x2"], offset_lines[-1]["y2"])]
+                    self.canvas.polyline(points, offset_lines[0]["color"], offset_lines[0]["thickness"], pid=max_pid+1)
+                    max_pid += 1
+                    continue
                 for line in offset_lines:
                     self.canvas.line(line["x1"], line["y1"], line["x2"], line["y2"], line["color"], line["thickness"], pid=max_pid+1)
                 max_pid += 1
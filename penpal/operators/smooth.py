@@ -1,3 +1,7 @@
+import numpy as np
+from penpal.draw_stack import op_identity
+
+
 class Smooth:
     def __init__(self, canvas, strength=1.0, iterations=1, contraction=0.1, group=None):
         self.canvas = canvas
@@ -7,18 +11,14 @@ class Smooth:
         self.group = group
         self.excluded_ops = []
         if self.group is not None:
-            for op in self.canvas.draw_stack:
-                found = False
-                for opg in self.group.ops:
-                    if opg == op:
-                        found = True
-                        break
-                if not found:
-                    self.excluded_ops.append(op)
+            members = {op_identity(op) for op in self.group.ops}
+            self.excluded_ops = [op for op in self.canvas.draw_stack if op_identity(op) not in members]
 
     def _group_lines_by_pid(self):
+        if self.group is None:
+            return self.canvas.ops_by_pid(type="line")
         lines_by_pid = {}
-        for op in self.canvas.draw_stack if self.group is None else self.group.ops:
+        for op in self.group.ops:
             if op["type"] == "line":
                 pid = op["pid"]
                 if pid not in lines_by_pid:
@@ -123,5 +123,17 @@ class Smooth:
                     "pid": pid
                 })
         
+        # Polylines already store their vertices in stroke order, smooth them in place
+        for op in self.canvas.draw_stack if self.group is None else self.group.ops:
+            if op["type"] == "polyline":
+                points = [tuple(p) for p in np.asarray(op["points"]).tolist()]
+                if len(points) < 3:
+                    continue
+                for _ in range(self.iterations):
+                    points = self._smooth_points(points)
+                op["points"] = np.array(points)
+
         # Replace old lines with smoothed ones
-        self.canvas.draw_stack = self.excluded_ops + [op for op in self.canvas.draw_stack if op["type"] != "line"] + new_lines
\ No newline at end of file
+        excluded = {op_identity(op) for op in self.excluded_ops}
+        self.canvas.draw_stack = self.excluded_ops + [op for op in self.canvas.draw_stack
+                                                      if op["type"] != "line" and op_identity(op) not in excluded] + new_lines
\ No newline at end of file
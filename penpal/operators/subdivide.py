@@ -1,4 +1,5 @@
 import math
+import numpy as np
 
 class SubdivideLines:
     def __init__(self, canvas, min_length=1.0):
@@ -8,6 +9,19 @@ class SubdivideLines:
     def line_length(self, op):
         return math.sqrt((op["x2"] - op["x1"])**2 + (op["y2"] - op["y1"])**2)
 
+    def subdivide_points(self, points):
+        """Polyline vertices with every segment split like a line op, the stroke stays one polyline"""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if len(points) < 2:
+            return points
+        new_points = [points[:1]]
+        for start, end in zip(points[:-1], points[1:]):
+            length = math.dist(start, end)
+            num_segments = 1 if length < self.min_length else max(2, int(length / self.min_length))
+            t = np.arange(1, num_segments + 1)[:, None] / num_segments
+            new_points.append(start + t * (end - start))
+        return np.concatenate(new_points)
+
     def apply(self):
         new_stack = []
         for op in self.canvas.draw_stack:
@@ -44,6 +58,9 @@ class SubdivideLines:
                         "color": op["color"],
                         "thickness": op["thickness"]
                     })
+            elif op["type"] == "polyline":
+                op["points"] = self.subdivide_points(op["points"])
+                new_stack.append(op)
             else:
                 new_stack.append(op)  # Keep non-line operations as-is
                 
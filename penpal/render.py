@@ -22,6 +22,15 @@ class Render:
                     color = "#ffffff"
                 draw.line([start_point_px, end_point_px], fill=color, width=thickness_px)
 
+            elif op["type"] == "polyline":
+                points_px = np.rint(np.asarray(op["points"]) * self.dpi / 25.4).astype(int).tolist()
+                thickness_px = self._mm_to_pixels(op["thickness"])
+                draw = ImageDraw.Draw(self.image)
+                color = op["color"] if op["color"] else self.canvas.pen_color
+                if color == "none":
+                    color = "#ffffff"
+                draw.line([tuple(p) for p in points_px], fill=color, width=thickness_px)
+
             elif op["type"] == "point" and points:
                 point_px = (self._mm_to_pixels(op["x"]), self._mm_to_pixels(op["y"]))
                 thickness_px = self._mm_to_pixels(op["thickness"])
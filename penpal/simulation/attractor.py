@@ -1,4 +1,5 @@
 import math
+import numpy as np
 
 class Attractor:
     def __init__(self, attractor=(0.0, 0.0), strength=0.5, after_time=0.0, before_time=1000000000):
@@ -25,4 +26,15 @@ class Attractor:
             point["impulse"][0] + force * (self.attractor[0] - point["x"]) / distance, 
             point["impulse"][1] + force * (self.attractor[1] - point["y"]) / distance
         )
-        return point
\ No newline at end of file
+        return point
+
+    def apply_batch(self, state, time_step):
+        if time_step < self.after_time or time_step > self.before_time:
+            return
+        mask = state.active
+        dx = self.attractor[0] - state.x[mask]
+        dy = self.attractor[1] - state.y[mask]
+        distance = np.maximum(np.sqrt(dx**2 + dy**2), 1.0)
+        force = (state.mass[mask] * self.strength) / (distance * distance)
+        state.ix[mask] += force * dx / distance
+        state.iy[mask] += force * dy / distance
@@ -0,0 +1,126 @@
+import numpy as np
+
+MAX_DEPTH = 16
+
+
+def _spread_bits(v):
+    """Moves the 16 low bits of v to the even bit positions."""
+    v = v & 0xFFFF
+    v = (v | (v << 8)) & 0x00FF00FF
+    v = (v | (v << 4)) & 0x0F0F0F0F
+    v = (v | (v << 2)) & 0x33333333
+    v = (v | (v << 1)) & 0x55555555
+    return v
+
+
+class QuadTree:
+    """
+    Barnes-Hut quadtree over weighted 2D points, built bottom-up from Morton codes.
+
+    Level L has one node per occupied cell of a 2^L x 2^L grid over the
+    bounding square of the points, with the total weight, the weighted
+    centroid and the number of points in the cell. Nodes of a level are sorted
+    by key, so the children of a node (keys 4k..4k+3 on the next level) are a
+    contiguous run, stored as first child and child count. The whole tree is a
+    handful of arrays per level.
+    """
+    def __init__(self, x, y, weight, max_depth=MAX_DEPTH):
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        weight = np.asarray(weight, dtype=np.float64)
+        self.max_depth = max_depth
+        self.levels = []
+        if len(x) == 0:
+            return
+        self.min_x = x.min()
+        self.min_y = y.min()
+        self.size = max(x.max() - self.min_x, y.max() - self.min_y, 1e-9)
+
+        codes = self._codes(x, y)
+        order = np.argsort(codes, kind="stable")
+        codes = codes[order]
+        weight = weight[order]
+        weighted_x = weight * x[order]
+        weighted_y = weight * y[order]
+        for level in range(max_depth + 1):
+            keys = codes >> (2 * (max_depth - level))
+            starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+            total = np.add.reduceat(weight, starts)
+            self.levels.append((
+                keys[starts],
+                total,
+                np.add.reduceat(weighted_x, starts) / total,
+                np.add.reduceat(weighted_y, starts) / total,
+                np.diff(np.r_[starts, len(codes)]),
+            ))
+        self.children = []
+        for level in range(max_depth):
+            keys = self.levels[level][0] << 2
+            child_keys = self.levels[level + 1][0]
+            first = np.searchsorted(child_keys, keys, "left")
+            self.children.append((first, np.searchsorted(child_keys, keys + 4, "left") - first))
+
+    def _cells(self, x, y):
+        scale = (1 << self.max_depth) / self.size
+        return np.floor((x - self.min_x) * scale).astype(np.int64), np.floor((y - self.min_y) * scale).astype(np.int64)
+
+    def _codes(self, x, y):
+        cx, cy = self._cells(x, y)
+        top = (1 << self.max_depth) - 1
+        # Points on the far edge of the bounding square land in the last cell
+        return _spread_bits(np.clip(cx, 0, top)) | (_spread_bits(np.clip(cy, 0, top)) << 1)
+
+    def pull(self, x, y, theta=0.5, chunk=16384):
+        """
+        Sum of weight * (c - p) / max(|c - p|, 1)^3 over the points c of the
+        tree, for every query point p: the pull of Attractor.apply without the
+        mass of p. A node is taken as a whole when the query point is outside
+        of it and node size < theta * distance to its centroid, theta=0 only
+        takes single points and the deepest cells.
+        """
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        pull_x = np.zeros(len(x))
+        pull_y = np.zeros(len(x))
+        if not self.levels:
+            return pull_x, pull_y
+        for start in range(0, len(x), chunk):
+            stop = min(start + chunk, len(x))
+            pull_x[start:stop], pull_y[start:stop] = self._pull_chunk(x[start:stop], y[start:stop], theta)
+        return pull_x, pull_y
+
+    def _pull_chunk(self, x, y, theta):
+        cx, cy = self._cells(x, y)
+        top = 1 << self.max_depth
+        query_codes = np.where((cx >= 0) & (cx < top) & (cy >= 0) & (cy < top), self._codes(x, y), -1)
+        pull_x = np.zeros(len(x))
+        pull_y = np.zeros(len(x))
+        # (query, node) pairs still to visit on the current level, starting at the root
+        query = np.arange(len(x))
+        node = np.zeros(len(x), dtype=np.int64)
+        for level, (keys, weight, centroid_x, centroid_y, count) in enumerate(self.levels):
+            dx = centroid_x[node] - x[query]
+            dy = centroid_y[node] - y[query]
+            distance = np.maximum(np.hypot(dx, dy), 1.0)
+            if level == self.max_depth:
+                accept = np.ones(len(query), dtype=bool)
+            else:
+                # query_codes of -1 (outside the tree) shift to -1 and never match a key
+                inside = (query_codes[query] >> (2 * (self.max_depth - level))) == keys[node]
+                accept = (count[node] == 1) | (~inside & (self.size / (1 << level) < theta * distance))
+            force = weight[node[accept]] / distance[accept] ** 3
+            pull_x += np.bincount(query[accept], weights=force * dx[accept], minlength=len(x))
+            pull_y += np.bincount(query[accept], weights=force * dy[accept], minlength=len(x))
+
+            query = query[~accept]
+            node = node[~accept]
+            if len(query) == 0:
+                break
+            # Open the remaining nodes
+            first, counts = self.children[level]
+            first = first[node]
+            counts = counts[node]
+            offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            query = np.repeat(query, counts)
+            node = np.repeat(first, counts) + offsets
+        return pull_x, pull_y
@@ -0,0 +1,221 @@
+import hashlib
+import os
+import random
+import sys
+import sysconfig
+import types
+import numpy as np
+from PIL import Image
+
+from penpal.canvas import Canvas
+from penpal.simulation.snapshot import (OpRecorder, point_arrays, random_arrays, read_npz, replay_ops,
+                                        restore_points, restore_random, write_npz)
+
+# Bumped whenever the file layout or what goes into the key changes
+CACHE_VERSION = 3
+
+# Simulation attributes that don't change the result
+_IGNORED_OPTIONS = ("canvas", "grid", "workers", "cache_dir", "on_step_end",
+                    "checkpoint_path", "checkpoint_every", "resume_from", "progress")
+
+
+# Code from here comes with Python or an installed package, it is keyed by name
+_LIBRARY_PATHS = tuple({os.path.abspath(sysconfig.get_path(name)) for name in ("stdlib", "platstdlib", "purelib", "platlib")})
+
+# Class attributes that don't describe behaviour, other dunder values than functions are skipped too
+_CLASS_SKIP = ("__dict__", "__weakref__", "__doc__", "__module__", "__qualname__")
+
+
+class _Unfingerprintable(Exception):
+    """A value the key can't describe by content, the run isn't cached"""
+
+
+def _is_library(module_name):
+    module = sys.modules.get(module_name or "")
+    if module is None:
+        return False
+    path = getattr(module, "__file__", None)
+    return path is None or os.path.abspath(path).startswith(_LIBRARY_PATHS)
+
+
+def _code_names(code):
+    """Global and attribute names read by code and the functions nested in it"""
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names |= _code_names(const)
+    return names
+
+
+def _function_globals(function):
+    """
+    The globals function reads, by name. For modules that aren't library
+    code (a sketch's config module) the attributes it may read from them.
+    """
+    names = _code_names(function.__code__)
+    used = {}
+    for name in sorted(names):
+        if name not in function.__globals__:
+            continue
+        item = function.__globals__[name]
+        if isinstance(item, types.ModuleType) and not _is_library(item.__name__):
+            item = {attr: getattr(item, attr) for attr in sorted(names) if hasattr(item, attr)}
+        used[name] = item
+    return used
+
+
+def _class_items(cls):
+    items = {}
+    for name, item in vars(cls).items():
+        if isinstance(item, (staticmethod, classmethod)):
+            item = item.__func__
+        elif isinstance(item, property):
+            item = (item.fget, item.fset, item.fdel)
+        if name in _CLASS_SKIP or (name.startswith("__") and not isinstance(item, (types.FunctionType, tuple))):
+            continue
+        items[name] = item
+    return items
+
+
+def _fingerprint(value, digest, seen=None):
+    """
+    Feeds a stable description of value into digest: numbers, strings,
+    containers, arrays and PIL images by content, functions by name, code,
+    defaults, closure and the globals they read (other functions and classes
+    among them by content too), classes by their methods and attributes,
+    other objects by class and public attributes. Functions, classes and
+    modules of Python itself and of installed packages only contribute their
+    name. Canvases only contribute their class, forces keep a reference to
+    the canvas they were made for but don't read its draw stack. Raises
+    _Unfingerprintable for values that only have a default repr().
+    """
+    if seen is None:
+        seen = set()
+    if value is None or isinstance(value, (bool, int, float, complex, str, bytes, np.generic)):
+        digest.update(repr(value).encode())
+    elif isinstance(value, np.ndarray):
+        digest.update(f"ndarray{value.dtype}{value.shape}".encode())
+        digest.update(np.ascontiguousarray(value).tobytes() if value.dtype != object else repr(value.tolist()).encode())
+    elif isinstance(value, (list, tuple)):
+        digest.update(f"{type(value).__name__}{len(value)}(".encode())
+        for item in value:
+            _fingerprint(item, digest, seen)
+        digest.update(b")")
+    elif isinstance(value, (set, frozenset)):
+        digest.update(f"set{len(value)}(".encode())
+        for item in sorted(value, key=repr):
+            _fingerprint(item, digest, seen)
+        digest.update(b")")
+    elif isinstance(value, dict):
+        digest.update(f"dict{len(value)}(".encode())
+        for key in sorted(value, key=repr):
+            _fingerprint(key, digest, seen)
+            _fingerprint(value[key], digest, seen)
+        digest.update(b")")
+    elif isinstance(value, Canvas):
+        digest.update(b"Canvas")
+    elif isinstance(value, Image.Image):
+        digest.update(f"Image{value.mode}{value.size}".encode())
+        digest.update(value.tobytes())
+    elif isinstance(value, types.CodeType):
+        digest.update(value.co_code)
+        _fingerprint((value.co_consts, value.co_names), digest, seen)
+    elif isinstance(value, types.ModuleType):
+        digest.update(f"module {value.__name__}".encode())
+    elif id(value) in seen:
+        digest.update(b"<cycle>")
+    elif isinstance(value, type):
+        seen.add(id(value))
+        digest.update(f"type {value.__module__}.{value.__qualname__}".encode())
+        if not _is_library(value.__module__):
+            _fingerprint((value.__bases__, _class_items(value)), digest, seen)
+    elif isinstance(value, types.FunctionType):
+        seen.add(id(value))
+        digest.update(f"function {value.__module__}.{value.__qualname__}".encode())
+        if _is_library(value.__module__):
+            return
+        try:
+            closure = [cell.cell_contents for cell in value.__closure__ or ()]
+        except ValueError:
+            # A closure variable that isn't assigned yet
+            raise _Unfingerprintable(value)
+        _fingerprint((value.__code__, value.__defaults__, value.__kwdefaults__, closure, _function_globals(value)),
+                     digest, seen)
+    elif isinstance(value, types.MethodType):
+        seen.add(id(value))
+        digest.update(b"method")
+        _fingerprint((value.__func__, value.__self__), digest, seen)
+    elif callable(value) and not hasattr(value, "__dict__"):
+        digest.update(f"{getattr(value, '__module__', '')}.{getattr(value, '__qualname__', repr(value))}".encode())
+    elif hasattr(value, "__dict__"):
+        seen.add(id(value))
+        _fingerprint(type(value), digest, seen)
+        _fingerprint({key: item for key, item in vars(value).items() if not key.startswith("_")}, digest, seen)
+    elif hasattr(value, "tobytes"):
+        digest.update(value.tobytes())
+    elif type(value).__repr__ is object.__repr__:
+        raise _Unfingerprintable(value)
+    else:
+        digest.update(repr(value).encode())
+
+
+class TrajectoryCache:
+    """
+    On-disk cache of simulation results, one compressed .npz file per key.
+
+    The key hashes the simulated point ops, the forces and events with all of
+    their public attributes, the simulation options, the step count and the
+    state of both random generators, which covers the seed. key() is None
+    when one of them can't be described by content, such runs aren't cached.
+
+    A file holds the trail ops the run appended to the draw stack (after the
+    canvas transform and margin clipping), the point values the run changed
+    and the random states at the end, so a hit leaves the canvas and the
+    generators as the simulation would have.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+
+    def key(self, simulation, points, steps):
+        digest = hashlib.sha256(f"penpal-trajectory-{CACHE_VERSION}".encode())
+        options = {name: value for name, value in vars(simulation).items()
+                   if not name.startswith("_") and name not in _IGNORED_OPTIONS + ("forces", "events")}
+        canvas = simulation.canvas
+        try:
+            _fingerprint([dict(point) for point in points], digest)
+            _fingerprint(simulation.forces, digest)
+            _fingerprint(simulation.events, digest)
+            _fingerprint(options, digest)
+        except _Unfingerprintable:
+            return None
+        _fingerprint((canvas.current_matrix, canvas.respect_margin, canvas.margin, canvas.canvas_size_mm), digest)
+        _fingerprint((steps, random.getstate(), np.random.get_state()), digest)
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.npz")
+
+    def load(self, key, canvas, points):
+        """Replays the cached run for key onto canvas and points, False when there is none."""
+        data = read_npz(self.path(key))
+        if data is None:
+            return False
+        restore_points(data, points)
+        replay_ops(data, canvas)
+        restore_random(data)
+        return True
+
+    def save(self, key, canvas, start, points, before):
+        """
+        Writes the run that appended canvas.draw_stack[start:] and changed
+        points (before holds their dicts from before the run). Runs with
+        values that can't be stored are not cached, returns whether it was.
+        """
+        data = point_arrays(points, before)
+        recorder = OpRecorder(canvas.draw_stack, start)
+        if data is None or not recorder.update():
+            return False
+        data.update(recorder.arrays())
+        data.update(random_arrays())
+        write_npz(self.path(key), data)
+        return True
@@ -0,0 +1,36 @@
+import threading
+
+from penpal.simulation.snapshot import write_npz
+
+
+class CheckpointWriter:
+    """
+    Writes checkpoint files on a background thread, so the simulation only
+    pays for collecting the arrays. A new write() waits for the previous one,
+    checkpoints land in order and at most one is held in memory. Files are
+    replaced atomically, a crash mid-write leaves the last complete one.
+    Errors of a write are raised by the next write() or wait().
+    """
+    def __init__(self, path):
+        self.path = path
+        self._thread = None
+        self._error = None
+
+    def write(self, data):
+        self.wait()
+        self._thread = threading.Thread(target=self._write, args=(data,), name="penpal-checkpoint")
+        self._thread.start()
+
+    def _write(self, data):
+        try:
+            write_npz(self.path, data)
+        except BaseException as error:
+            self._error = error
+
+    def wait(self):
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
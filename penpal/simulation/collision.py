@@ -7,3 +7,14 @@ class Collision:
             return
         if self.canvas.check_collision(point["x"] + point["impulse"][0]*radius, point["y"] + point["impulse"][1]*radius, radius):
             point["impulse"] = (0, 0)
+
+    def apply_many(self, points, radius=0.5):
+        """apply() for a whole population, resolved with a single check_collision_many call."""
+        moving = [point for point in points if not (point["impulse"][0] < 0.0001 and point["impulse"][1] < 0.0001)]
+        if not moving:
+            return
+        xs = [point["x"] + point["impulse"][0]*radius for point in moving]
+        ys = [point["y"] + point["impulse"][1]*radius for point in moving]
+        for point, hit in zip(moving, self.canvas.check_collision_many(xs, ys, radius).tolist()):
+            if hit:
+                point["impulse"] = (0, 0)
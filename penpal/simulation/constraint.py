@@ -1,4 +1,5 @@
 import math
+import numpy as np
 
 class IsometricConstraint:
     def __init__(self, canvas, angle_degrees=30, threshold=0.2, strength=1.0, after_time=0.0, before_time=1000000000):
@@ -76,6 +77,30 @@ class IsometricConstraint:
         
         return point
 
+    def apply_batch(self, state, time_step):
+        if time_step < self.after_time or time_step > self.before_time:
+            return
+        mask = state.active.copy()
+        x, y = state.ix, state.iy
+        magnitude = np.sqrt(x*x + y*y)
+        mask &= magnitude >= 1e-6
+        x, y, magnitude = x[mask], y[mask], magnitude[mask]
+
+        # Circular distance from every impulse angle to every preferred angle, then the closest one
+        current_angle = np.arctan2(y, x) % (2 * math.pi)
+        preferred = np.array(self.preferred_angles)
+        diff = np.abs((current_angle[:, None] - preferred[None, :]) % (2 * math.pi))
+        diff = np.minimum(diff, 2*math.pi - diff)
+        closest = np.argmin(diff, axis=1)
+        snap = diff[np.arange(len(closest)), closest] <= self.threshold
+
+        angle = preferred[closest[snap]]
+        new_x = magnitude[snap] * np.cos(angle)
+        new_y = magnitude[snap] * np.sin(angle)
+        index = np.flatnonzero(mask)[snap]
+        state.ix[index] = x[snap] * (1.0-self.strength) + new_x * self.strength
+        state.iy[index] = y[snap] * (1.0-self.strength) + new_y * self.strength
+
 class MinImpulseConstraint:
     def __init__(self, canvas, after_time=0.0, before_time=1000000000):
         self.canvas = canvas
@@ -83,7 +108,7 @@ class MinImpulseConstraint:
         self.before_time = before_time
 
 
-    def apply(self, point, time_step):
+    def apply(self, point, time_step, all_points=[]):
         if time_step < self.after_time or time_step > self.before_time:
             return point
         if point["impulse"][0] < point["impulse"][1]:
@@ -91,6 +116,13 @@ class MinImpulseConstraint:
         else:
             point["impulse"] = (0.0, point["impulse"][1])
         return point    
+
+    def apply_batch(self, state, time_step):
+        if time_step < self.after_time or time_step > self.before_time:
+            return
+        keep_x = state.ix < state.iy
+        state.iy[state.active & keep_x] = 0.0
+        state.ix[state.active & ~keep_x] = 0.0
     
 class MaxImpulseConstraint:
     def __init__(self, canvas, after_time=0.0, before_time=1000000000):
@@ -98,11 +130,18 @@ class MaxImpulseConstraint:
         self.after_time = after_time
         self.before_time = before_time
 
-    def apply(self, point, time_step):
+    def apply(self, point, time_step, all_points=[]):
         if time_step < self.after_time or time_step > self.before_time:
             return point
         if point["impulse"][0] > point["impulse"][1]:
             point["impulse"] = (point["impulse"][0] , 0.0)
         else:
             point["impulse"] = (0.0, point["impulse"][1])
-        return point    
\ No newline at end of file
+        return point    
+
+    def apply_batch(self, state, time_step):
+        if time_step < self.after_time or time_step > self.before_time:
+            return
+        keep_x = state.ix > state.iy
+        state.iy[state.active & keep_x] = 0.0
+        state.ix[state.active & ~keep_x] = 0.0
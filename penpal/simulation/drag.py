@@ -1,3 +1,6 @@
+import numpy as np
+
+
 class Drag:
     def __init__(self, canvas, drag=0.5, field=None, after_time=0.0, before_time=1000000000):
         self.canvas = canvas
@@ -18,6 +21,11 @@ class Drag:
         drag = min(drag, 1.0)
         point["impulse"] = (point["impulse"][0] * (1.0 - drag), point["impulse"][1] * (1.0 - drag))
         return point    
+
+    def apply_batch(self, state, time_step):
+        if time_step < self.after_time or time_step > self.before_time:
+            return
+        _apply_drag(state, state.active, self.drag, self.field)
     
 class BorderDrag:
     def __init__(self, canvas, drag=0.5, field=None, after_time=0.0, before_time=1000000000):
@@ -42,6 +50,23 @@ class BorderDrag:
         drag = min(drag, 1.0)
 
         point["impulse"] = (point["impulse"][0] * (1.0 - drag), point["impulse"][1] * (1.0 - drag))
-        return point    
+        return point
+
+    def apply_batch(self, state, time_step):
+        if time_step < self.after_time or time_step > self.before_time:
+            return
+        inside = (state.x > self.canvas.top_left[0]) & (state.x < self.canvas.bottom_right[0]) & (state.y > self.canvas.top_left[1]) & (state.y < self.canvas.bottom_right[1])
+        _apply_drag(state, state.active & ~inside, self.drag, self.field)
 
 
+def _apply_drag(state, mask, drag, field):
+    """Scales the impulse of the masked particles by 1 - drag, drag clamped to [0, 1]."""
+    if field is not None:
+        xs, ys = state.x[mask], state.y[mask]
+        if hasattr(field, "get_floats"):
+            drag = field.get_floats(xs, ys) * drag
+        else:
+            drag = np.array([field.get_float(x, y) for x, y in zip(xs.tolist(), ys.tolist())]) * drag
+    keep = 1.0 - np.clip(drag, 0.0, 1.0)
+    state.ix[mask] *= keep
+    state.iy[mask] *= keep
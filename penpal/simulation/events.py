@@ -28,4 +28,17 @@ class FlipMass:
                 point["impulse"] = (-point["impulse"][0], -point["impulse"][1])
                 self.last_flip = time_step
 
+    def apply_batch(self, state, indices, time_step, with_points=None):
+        # Same as calling apply for indices in order: once a point flips, the
+        # rest of the step is within max_time_between_flips
+        if time_step - self.last_flip <= self.max_time_between_flips:
+            return
+        for i in indices.tolist():
+            if random.random() < self.chance:
+                state.mass[i] = -state.mass[i]
+                state.ix[i] = -state.ix[i]
+                state.iy[i] = -state.iy[i]
+                self.last_flip = time_step
+                return
+
 
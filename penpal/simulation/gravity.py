@@ -5,8 +5,14 @@ class Gravity:
         self.after_time = after_time
         self.before_time = before_time
 
-    def apply(self, point, time_step):
+    def apply(self, point, time_step, all_points=[]):
         if time_step < self.after_time or time_step > self.before_time:
             return point
         point["impulse"] = (point["impulse"][0] + self.gravity, point["impulse"][1] + self.gravity)
-        return point    
\ No newline at end of file
+        return point
+
+    def apply_batch(self, state, time_step):
+        if time_step < self.after_time or time_step > self.before_time:
+            return
+        state.ix[state.active] += self.gravity
+        state.iy[state.active] += self.gravity
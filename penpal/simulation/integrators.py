@@ -0,0 +1,118 @@
+import numpy as np
+
+INTEGRATORS = ("semi_implicit", "euler", "verlet", "rk4", "adaptive")
+
+# Bogacki-Shampine 3(2) tableau, the step is taken with the 3rd order solution
+# and its distance to the 2nd order one is the error estimate
+_BS_C2, _BS_C3 = 0.5, 0.75
+_BS_B = (2 / 9, 1 / 3, 4 / 9)
+_BS_E = (2 / 9 - 7 / 24, 1 / 3 - 1 / 4, 4 / 9 - 1 / 3, -1 / 8)
+
+
+def euler(accel, x, y, vx, vy, h):
+    """Explicit Euler: moves with the velocity from the start of the step, then updates it."""
+    ax, ay = accel(x, y, vx, vy)
+    return x + vx * h, y + vy * h, vx + ax * h, vy + ay * h
+
+
+def verlet(accel, x, y, vx, vy, h):
+    """
+    Velocity Verlet. Forces that depend on the velocity (drag) see a
+    predicted velocity at the end of the step.
+    """
+    ax, ay = accel(x, y, vx, vy)
+    nx = x + vx * h + 0.5 * ax * h * h
+    ny = y + vy * h + 0.5 * ay * h * h
+    bx, by = accel(nx, ny, vx + ax * h, vy + ay * h)
+    return nx, ny, vx + 0.5 * (ax + bx) * h, vy + 0.5 * (ay + by) * h
+
+
+def rk4(accel, x, y, vx, vy, h):
+    """Classic 4th order Runge-Kutta on (position, velocity)."""
+    a1x, a1y = accel(x, y, vx, vy)
+    v2x, v2y = vx + 0.5 * h * a1x, vy + 0.5 * h * a1y
+    a2x, a2y = accel(x + 0.5 * h * vx, y + 0.5 * h * vy, v2x, v2y)
+    v3x, v3y = vx + 0.5 * h * a2x, vy + 0.5 * h * a2y
+    a3x, a3y = accel(x + 0.5 * h * v2x, y + 0.5 * h * v2y, v3x, v3y)
+    v4x, v4y = vx + h * a3x, vy + h * a3y
+    a4x, a4y = accel(x + h * v3x, y + h * v3y, v4x, v4y)
+    return (x + h / 6 * (vx + 2 * v2x + 2 * v3x + v4x),
+            y + h / 6 * (vy + 2 * v2y + 2 * v3y + v4y),
+            vx + h / 6 * (a1x + 2 * a2x + 2 * a3x + a4x),
+            vy + h / 6 * (a1y + 2 * a2y + 2 * a3y + a4y))
+
+
+def _bogacki_shampine(accel, x, y, vx, vy, h):
+    """One Bogacki-Shampine step, returns the new state and the position error estimate."""
+    k1 = (vx, vy) + accel(x, y, vx, vy)
+    s2 = [v + _BS_C2 * h * k for v, k in zip((x, y, vx, vy), k1)]
+    k2 = (s2[2], s2[3]) + accel(*s2)
+    s3 = [v + _BS_C3 * h * k for v, k in zip((x, y, vx, vy), k2)]
+    k3 = (s3[2], s3[3]) + accel(*s3)
+    new = [v + h * (_BS_B[0] * a + _BS_B[1] * b + _BS_B[2] * c) for v, a, b, c in zip((x, y, vx, vy), k1, k2, k3)]
+    k4 = (new[2], new[3]) + accel(*new)
+    error_x, error_y = (h * (_BS_E[0] * a + _BS_E[1] * b + _BS_E[2] * c + _BS_E[3] * d)
+                        for a, b, c, d in list(zip(k1, k2, k3, k4))[:2])
+    return new, np.hypot(error_x, error_y)
+
+
+def _adaptive_step(accel, x, y, vx, vy, h, tolerance, max_tries, min_step, max_growth):
+    """
+    One accepted Bogacki-Shampine step per particle: a step whose position
+    error is above tolerance is retried with a smaller h (the last try, or
+    one at min_step, is taken as it is). Returns the new state, the step
+    sizes taken and the error-controlled step sizes for the next step.
+    """
+    taken = h.copy()
+    next_h = h.copy()
+    pending = np.arange(len(x))
+    for attempt in range(max_tries):
+        index = pending
+        new, error = _bogacki_shampine(lambda *s: accel(*s, index), x[index], y[index], vx[index], vy[index], h[index])
+        with np.errstate(divide="ignore"):
+            factor = np.clip(0.9 * (tolerance / error) ** (1 / 3), 0.2, max_growth)
+        factor[error == 0] = max_growth
+        accept = (error <= tolerance) | (attempt == max_tries - 1) | (h[index] <= min_step)
+        done = index[accept]
+        x[done], y[done], vx[done], vy[done] = (v[accept] for v in new)
+        taken[done] = h[done]
+        next_h[done] = h[done] * factor[accept]
+        h[index[~accept]] = np.maximum(h[index[~accept]] * factor[~accept], min_step)
+        pending = index[~accept]
+        if len(pending) == 0:
+            break
+    return x, y, vx, vy, taken, next_h
+
+
+def adaptive(accel, x, y, vx, vy, h, tolerance, span, max_tries=8, min_step=None, max_growth=5.0):
+    """
+    Adaptive Bogacki-Shampine 3(2) integration of arrays of particles over
+    span (one time step), so every particle covers the same simulated time.
+    Each particle sub-steps with its own step size h, between min_step
+    (span / 64 by default) and span: sub-steps whose position error is above
+    tolerance are retried with a smaller h, accepted ones grow h by the error
+    ratio for the next one.
+
+    accel(x, y, vx, vy, index) gets the positions into the arrays the stage
+    is for, so sub-steps and retries only evaluate the particles they move.
+    Returns the new state and the step sizes to start the next span with.
+    """
+    if min_step is None:
+        min_step = span / 64
+    x, y, vx, vy = (np.array(v, dtype=np.float64) for v in (x, y, vx, vy))
+    h = np.clip(np.array(h, dtype=np.float64), min_step, span)
+    remaining = np.full(len(x), float(span))
+    moving = np.arange(len(x))
+    while len(moving):
+        index = moving
+        sub_h = np.minimum(h[index], remaining[index])
+        nx, ny, nvx, nvy, taken, next_h = _adaptive_step(lambda *s: accel(*s[:4], index[s[4]]),
+                                                         x[index], y[index], vx[index], vy[index], sub_h,
+                                                         tolerance, max_tries, min_step, max_growth)
+        x[index], y[index], vx[index], vy[index] = nx, ny, nvx, nvy
+        remaining[index] -= taken
+        # A sub-step cut short by the end of the span and taken at once doesn't shrink the next one
+        cut = (sub_h < h[index]) & (taken == sub_h)
+        h[index] = np.clip(np.where(cut, np.maximum(next_h, h[index]), next_h), min_step, span)
+        moving = index[remaining[index] > span * 1e-9]
+    return x, y, vx, vy, h
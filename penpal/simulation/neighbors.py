@@ -0,0 +1,99 @@
+import numpy as np
+
+
+class CellList:
+    """
+    Uniform grid over a set of 2D points for fixed-radius neighbour searches.
+
+    build() sorts the points by cell, so every cell is a contiguous range of
+    `order` that is found with a binary search. With cell_size equal to the
+    search radius, all neighbours of a point are in the 3x3 cells around it.
+    """
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.order = np.empty(0, np.int64)
+        self.sorted_keys = np.empty(0, np.int64)
+
+    def build(self, x, y):
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+        if len(self.x) == 0:
+            self.order = np.empty(0, np.int64)
+            self.sorted_keys = np.empty(0, np.int64)
+            return self
+        self.cx = np.floor(self.x / self.cell_size).astype(np.int64)
+        self.cy = np.floor(self.y / self.cell_size).astype(np.int64)
+        self.min_cx, self.max_cx = int(self.cx.min()), int(self.cx.max())
+        self.min_cy, self.max_cy = int(self.cy.min()), int(self.cy.max())
+        # One spare row on both sides, so neighbouring cells never wrap into the next column
+        self.rows = self.max_cy - self.min_cy + 3
+        keys = self._key(self.cx, self.cy)
+        self.order = np.argsort(keys, kind="stable")
+        self.sorted_keys = keys[self.order]
+        return self
+
+    def _key(self, cx, cy):
+        return (cx - self.min_cx + 1) * self.rows + (cy - self.min_cy + 1)
+
+    def candidates(self, x, y):
+        """Sorted indices of the points in the 3x3 cells around (x, y)."""
+        if len(self.order) == 0:
+            return self.order
+        cx = int(np.floor(x / self.cell_size))
+        cy = int(np.floor(y / self.cell_size))
+        low_y = max(cy - 1, self.min_cy)
+        high_y = min(cy + 1, self.max_cy)
+        if low_y > high_y:
+            return np.empty(0, np.int64)
+        found = []
+        for column in range(max(cx - 1, self.min_cx), min(cx + 1, self.max_cx) + 1):
+            # The three cells of a column are consecutive keys
+            start = np.searchsorted(self.sorted_keys, self._key(column, low_y), "left")
+            end = np.searchsorted(self.sorted_keys, self._key(column, high_y), "right")
+            found.append(self.order[start:end])
+        if not found:
+            return np.empty(0, np.int64)
+        return np.sort(np.concatenate(found))
+
+    def pairs(self, radius, rows=None, chunk=8192):
+        """
+        (i, j) arrays of all pairs of built points closer than radius, for i in
+        rows (all points by default) and any j != i. Both (i, j) and (j, i) are
+        returned when both are in rows.
+        """
+        if rows is None:
+            rows = np.arange(len(self.order))
+        rows = np.asarray(rows, dtype=np.int64)
+        found_i = []
+        found_j = []
+        for begin in range(0, len(rows), chunk):
+            i, j = self._candidate_pairs(rows[begin:begin + chunk])
+            dx = self.x[i] - self.x[j]
+            dy = self.y[i] - self.y[j]
+            keep = (i != j) & (dx * dx + dy * dy < radius * radius)
+            found_i.append(i[keep])
+            found_j.append(j[keep])
+        if not found_i:
+            return np.empty(0, np.int64), np.empty(0, np.int64)
+        return np.concatenate(found_i), np.concatenate(found_j)
+
+    def _candidate_pairs(self, rows):
+        cx = self.cx[rows]
+        cy = self.cy[rows]
+        pairs_i = []
+        pairs_j = []
+        for offset in (-1, 0, 1):
+            start = np.searchsorted(self.sorted_keys, self._key(cx + offset, cy - 1), "left")
+            end = np.searchsorted(self.sorted_keys, self._key(cx + offset, cy + 1), "right")
+            counts = end - start
+            total = int(counts.sum())
+            if total == 0:
+                continue
+            # Expand every (row, start:end) range into one flat list of candidates
+            first = np.cumsum(counts) - counts
+            position = np.repeat(start - first, counts) + np.arange(total)
+            pairs_i.append(np.repeat(rows, counts))
+            pairs_j.append(self.order[position])
+        if not pairs_i:
+            return np.empty(0, np.int64), np.empty(0, np.int64)
+        return np.concatenate(pairs_i), np.concatenate(pairs_j)
@@ -0,0 +1,79 @@
+import random
+import numpy as np
+
+
+class ParticleState:
+    """
+    Struct-of-arrays copy of the simulated points, used by the "array" engine.
+
+    x, y, ix, iy (the impulse), mass and attractor are float64 arrays and live
+    is a bool array, one entry per point in the order of `points`. Forces that
+    implement apply_batch(state, time_step) update these arrays directly for
+    the entries selected by `active`. rng is a NumPy generator seeded from
+    `random`, so random.seed() keeps batch runs reproducible.
+
+    The point dicts are only touched by to_points() / from_points(), which the
+    simulation calls around forces and events that only have a per-point apply
+    and at the end of the run.
+    """
+    def __init__(self, points, rng=None):
+        self.points = points
+        n = len(points)
+        self.x = np.fromiter((p["x"] for p in points), dtype=np.float64, count=n)
+        self.y = np.fromiter((p["y"] for p in points), dtype=np.float64, count=n)
+        self.ix = np.fromiter((p["impulse"][0] for p in points), dtype=np.float64, count=n)
+        self.iy = np.fromiter((p["impulse"][1] for p in points), dtype=np.float64, count=n)
+        self.mass = np.fromiter((p["mass"] for p in points), dtype=np.float64, count=n)
+        self.attractor = np.fromiter((p["attractor"] for p in points), dtype=np.float64, count=n)
+        self.live = np.fromiter((bool(p["live"]) for p in points), dtype=bool, count=n)
+        self.color = [p["color"] for p in points]
+        self.thickness = [p["thickness"] for p in points]
+        self.pid = [p["pid"] for p in points]
+        # Drawn trail length, for Simulation(max_trail_length=...)
+        self.trail_length = np.zeros(n)
+        # End of the last drawn trail segment (NaN before the first), for Simulation(trail_min_length=...)
+        self.trail_x = np.full(n, np.nan)
+        self.trail_y = np.full(n, np.nan)
+        # Step size per particle (NaN until the first step), for Simulation(integrator="adaptive")
+        self.step_size = np.full(n, np.nan)
+        # Particles advanced in the current step, set by the simulation at the start of every step
+        self.active = self.live.copy()
+        self.rng = rng if rng is not None else np.random.default_rng(random.getrandbits(64))
+        # Everything above, extra_arrays() is what forces add later
+        self._builtin = frozenset(vars(self)) | {"_builtin"}
+
+    def __len__(self):
+        return len(self.x)
+
+    def extra_arrays(self):
+        """Per-particle arrays that batch forces attached to the state (e.g. Rule's original_y), by name."""
+        return {name: value for name, value in vars(self).items()
+                if name not in self._builtin and isinstance(value, np.ndarray) and value.shape[:1] == (len(self),)}
+
+    def to_points(self, indices=None):
+        """Writes the arrays back into the point dicts (all of them, or only indices)."""
+        if indices is None:
+            indices = range(len(self.points))
+        x, y, ix, iy = self.x, self.y, self.ix, self.iy
+        mass, attractor, live = self.mass, self.attractor, self.live
+        for i in indices:
+            point = self.points[i]
+            point["x"] = float(x[i])
+            point["y"] = float(y[i])
+            point["impulse"] = (float(ix[i]), float(iy[i]))
+            point["mass"] = float(mass[i])
+            point["attractor"] = float(attractor[i])
+            point["live"] = bool(live[i])
+
+    def from_points(self, indices=None):
+        """Reads the point dicts back into the arrays after a per-point apply changed them."""
+        if indices is None:
+            indices = range(len(self.points))
+        for i in indices:
+            point = self.points[i]
+            self.x[i] = point["x"]
+            self.y[i] = point["y"]
+            self.ix[i], self.iy[i] = point["impulse"]
+            self.mass[i] = point["mass"]
+            self.attractor[i] = point["attractor"]
+            self.live[i] = point["live"]
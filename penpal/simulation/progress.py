@@ -0,0 +1,111 @@
+from dataclasses import asdict, dataclass, field
+import json
+import time
+
+import tqdm
+
+
+@dataclass
+class StepStats:
+    """
+    What a progress hook gets. step counts time steps, or whole points for
+    sequential runs, total is where it ends. segments is the number of trail
+    segments produced so far (before trail_simplify), force_time the seconds
+    spent in each force (and "attractors") so far, only filled for hooks
+    with timing = True.
+    """
+    step: int
+    total: int
+    elapsed: float
+    steps_per_second: float
+    live: int
+    segments: int
+    force_time: dict = field(default_factory=dict)
+
+
+class NullProgress:
+    """
+    Progress hook of a Simulation that reports nothing, the default.
+    Subclasses override report(), it is called every `every` steps, when
+    `interval` seconds passed since the last call, and at the end of the run.
+    """
+    # Whether the simulation should time every force call for StepStats.force_time
+    timing = False
+
+    def __init__(self, every=None, interval=None):
+        self.every = every
+        self.interval = interval
+
+    def start(self, total, first=0):
+        self.total = total
+        self.first = first
+        self.started = self.reported = time.perf_counter()
+
+    def due(self, step):
+        if self.every is None and self.interval is None:
+            return False
+        if step >= self.total:
+            return True
+        if self.every is not None and step % self.every == 0:
+            return True
+        return self.interval is not None and time.perf_counter() - self.reported >= self.interval
+
+    def stats(self, step, live, segments, force_time):
+        self.reported = time.perf_counter()
+        elapsed = self.reported - self.started
+        return StepStats(step, self.total, elapsed, (step - self.first) / elapsed if elapsed > 0 else 0.0,
+                         live, segments, dict(force_time))
+
+    def report(self, stats):
+        pass
+
+    def close(self):
+        pass
+
+
+class TqdmProgress(NullProgress):
+    """One tqdm bar over the run, with the live particles and trail segments next to it."""
+    def __init__(self, every=1, interval=None, **tqdm_options):
+        super().__init__(every, interval)
+        self.tqdm_options = tqdm_options
+        self.bar = None
+
+    def start(self, total, first=0):
+        super().start(total, first)
+        self.bar = tqdm.tqdm(total=total, initial=first, **self.tqdm_options)
+
+    def report(self, stats):
+        self.bar.set_postfix(live=stats.live, segments=stats.segments, refresh=False)
+        self.bar.update(stats.step - self.bar.n)
+
+    def close(self):
+        if self.bar is not None:
+            self.bar.close()
+            self.bar = None
+
+
+class JsonLinesProgress(NullProgress):
+    """
+    Appends every report as one JSON object per line to a file (a path or an
+    open text file, which is left open), for headless batch runs. Times the
+    forces.
+    """
+    timing = True
+
+    def __init__(self, file, every=None, interval=1.0):
+        super().__init__(every, interval)
+        self.file = file
+        self._handle = None
+
+    def start(self, total, first=0):
+        super().start(total, first)
+        self._handle = self.file if hasattr(self.file, "write") else open(self.file, "a")
+
+    def report(self, stats):
+        self._handle.write(json.dumps(asdict(stats)) + "\n")
+        self._handle.flush()
+
+    def close(self):
+        if self._handle is not None and self._handle is not self.file:
+            self._handle.close()
+        self._handle = None
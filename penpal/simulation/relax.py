@@ -1,4 +1,6 @@
 import math
+import numpy as np
+from penpal.simulation.neighbors import CellList
 
 class Relax:
     def __init__(self, canvas, strength=0.1, radius=10.0, min_distance=2.0, after_time=0.0, before_time=1000000000):
@@ -8,17 +10,21 @@ class Relax:
         self.min_distance = min_distance  # Minimum desired distance between points
         self.after_time = after_time
         self.before_time = before_time
+        # Neighbour grid of all_points, built on the first apply() after new_step()
+        self._cells = None
 
     def apply(self, point, time_step, all_points=[]):
-        if time_step < self.after_time or time_step > self.before_time:
+        if time_step < self.after_time or time_step > self.before_time or self.radius <= 0:
             return point
         
         # Initialize accumulated force
         force_x = 0.0
         force_y = 0.0
         
-        # For each nearby point, calculate repulsion force
-        for other in all_points:
+        # For each nearby point, calculate repulsion force. Candidates come from
+        # the grid built at the start of the step, in all_points order
+        for index in self._neighbor_cells(all_points).candidates(point["x"], point["y"]).tolist():
+            other = all_points[index]
             if other is point:  # Skip self
                 continue
                 
@@ -52,6 +58,38 @@ class Relax:
         
         return point
 
+    def apply_batch(self, state, time_step):
+        if time_step < self.after_time or time_step > self.before_time or self.radius <= 0:
+            return
+        cells = CellList(self.radius).build(state.x, state.y)
+        i, j = cells.pairs(self.radius, rows=np.flatnonzero(state.active))
+        dx = state.x[i] - state.x[j]
+        dy = state.y[i] - state.y[j]
+        distance = np.sqrt(dx * dx + dy * dy)
+        apart = distance > 0
+        i, dx, dy, distance = i[apart], dx[apart], dy[apart], distance[apart]
+
+        force_magnitude = self.strength * (1.0 - distance / self.radius)
+        close = distance < self.min_distance
+        force_magnitude[close] *= (self.min_distance / distance[close]) * 2.0
+
+        state.ix += np.bincount(i, weights=dx / distance * force_magnitude, minlength=len(state))
+        state.iy += np.bincount(i, weights=dy / distance * force_magnitude, minlength=len(state))
+
+    def new_step(self):
+        """
+        Called by Simulation when the points moved (every concurrent step and
+        before every point of a sequential run), apply() rebuilds its grid.
+        """
+        self._cells = None
+
+    def _neighbor_cells(self, all_points):
+        if self._cells is None:
+            xs = np.fromiter((p["x"] for p in all_points), dtype=np.float64, count=len(all_points))
+            ys = np.fromiter((p["y"] for p in all_points), dtype=np.float64, count=len(all_points))
+            self._cells = CellList(self.radius).build(xs, ys)
+        return self._cells
+
     def get_ideal_radius(self, num_points, area):
         """Calculate ideal radius based on number of points and area"""
         # Approximate ideal radius as sqrt(area / num_points)
@@ -1,10 +1,16 @@
+import numpy as np
+
+
 class Rule:
-    def __init__(self, canvas, rule, strength=1.0, after_time=0.0, before_time=1000000000):
+    def __init__(self, canvas, rule, strength=1.0, after_time=0.0, before_time=1000000000, batch_rule=None):
         self.canvas = canvas
         self.rule = rule
         self.strength = strength
         self.after_time = after_time
         self.before_time = before_time
+        # batch_rule(state, time_step, rule) is the array version of rule, used by the array engine.
+        # Built-in rules bring their own, custom rules without one run per point
+        self.batch_rule = batch_rule if batch_rule is not None else BATCH_RULES.get(rule)
 
     def apply(self, point, time_step, all_points=[]):
         if time_step < self.after_time or time_step > self.before_time:
@@ -12,6 +18,18 @@ class Rule:
         self.rule(point, time_step, all_points, self)
         return point
 
+    def apply_batch(self, state, time_step):
+        if time_step < self.after_time or time_step > self.before_time:
+            return
+        if self.batch_rule is not None:
+            self.batch_rule(state, time_step, self)
+            return
+        active = np.flatnonzero(state.active).tolist()
+        state.to_points()
+        for i in active:
+            self.rule(state.points[i], time_step, state.points, self)
+        state.from_points(active)
+
     ## Rules
     def rule_to_return_to_original_y(point, time_step, all_points, rule):
         # Store original y position on first step
@@ -39,4 +57,20 @@ class Rule:
                 point["impulse"] = (
                     point["impulse"][0],
                     point["impulse"][1] + correction_force
-                )
\ No newline at end of file
+                )
+
+    def batch_rule_to_return_to_original_y(state, time_step, rule):
+        if time_step == 0 or not hasattr(state, "original_y"):
+            state.original_y = state.y.copy()
+            return
+        canvas_width = rule.canvas.right - rule.canvas.left
+        distance_from_right = np.maximum(0, canvas_width - (state.x - rule.canvas.left))
+        right_edge_influence = 1.0 - (distance_from_right / canvas_width)
+        pull = state.active & (right_edge_influence > 0.5)
+        scaled_strength = rule.strength * ((right_edge_influence[pull] - 0.5) * 2) ** 2
+        state.iy[pull] += (state.original_y[pull] - state.y[pull]) * scaled_strength
+
+
+BATCH_RULES = {
+    Rule.rule_to_return_to_original_y: Rule.batch_rule_to_return_to_original_y,
+}
@@ -0,0 +1,44 @@
+from bisect import bisect_right
+import math
+
+
+def _window(force):
+    """First step a force is active on and the step after its last one, None for unbounded."""
+    after_time = getattr(force, "after_time", None)
+    before_time = getattr(force, "before_time", None)
+    start = math.ceil(after_time) if after_time is not None and math.isfinite(after_time) else None
+    stop = math.floor(before_time) + 1 if before_time is not None and math.isfinite(before_time) else None
+    return start, stop
+
+
+class ForceSchedule:
+    """
+    The forces of a simulation sorted into spans of steps with the same
+    active set, forces are active for after_time <= time_step <= before_time.
+
+    The window edges of all forces are kept in a sorted list. at() returns the
+    forces active at a step in their original order, the list is only rebuilt
+    when a step crosses an edge, so forces outside their window are never
+    called.
+    """
+    def __init__(self, forces):
+        self.forces = list(forces)
+        self.windows = [_window(force) for force in self.forces]
+        self.edges = sorted({edge for window in self.windows for edge in window if edge is not None})
+        self._span = None
+        self._active = []
+
+    def _is_active(self, window, time_step):
+        start, stop = window
+        return (start is None or start <= time_step) and (stop is None or time_step < stop)
+
+    def at(self, time_step):
+        span = self._span
+        if span is not None and span[0] <= time_step < span[1]:
+            return self._active
+        i = bisect_right(self.edges, time_step)
+        start = self.edges[i - 1] if i > 0 else -math.inf
+        stop = self.edges[i] if i < len(self.edges) else math.inf
+        self._span = (start, stop)
+        self._active = [force for force, window in zip(self.forces, self.windows) if self._is_active(window, time_step)]
+        return self._active
@@ -3,9 +3,23 @@ from itertools import cycle
 from typing import List, Tuple
 import random
 import math
-import tqdm
+import multiprocessing
+import time
+import numpy as np
 
-from penpal.simulation.attractor import Attractor
+from penpal.simulation.barnes_hut import QuadTree
+from penpal.simulation.cache import TrajectoryCache
+from penpal.simulation.checkpoint import CheckpointWriter
+from penpal.simulation import integrators
+from penpal.simulation.neighbors import CellList
+from penpal.simulation.particles import ParticleState
+from penpal.simulation.progress import NullProgress
+from penpal.simulation.relax import Relax
+from penpal.simulation.schedule import ForceSchedule
+from penpal.simulation.snapshot import (OpRecorder, literal_array, point_arrays, random_arrays, read_literal, read_npz,
+                                        replay_ops, restore_points, restore_random)
+from penpal.simulation.trail_grid import TrailGrid
+from penpal.simulation.trails import TrailBuffer, simplify_path
 
 class SetMass:
     def __init__(self, canvas, mass=1.0, chance=1.0, mode="set", field=None):
@@ -78,6 +92,26 @@ class SetAsAttractor:
                     if self.attractor > 0.01:
                         op["live"] = True
 
+# (simulation, all_points, steps, seeds) of the running _simulate_workers call,
+# set before the pool forks so the workers inherit it instead of unpickling it
+_worker_job = None
+
+
+def _simulate_points(indices):
+    """Pool task: simulates all_points[indices] one after the other."""
+    simulation, all_points, steps, seeds = _worker_job
+    return [simulation._simulate_point(all_points[i], all_points, steps, seeds[i]) for i in indices]
+
+
+@dataclass
+class _Checkpoints:
+    """Checkpoint writing of a running simulate(): the writer, the setup key and what the run started from"""
+    writer: CheckpointWriter
+    key: str
+    recorder: OpRecorder
+    before: list
+
+
 class Simulation:
     def __init__(self, canvas, forces=[], events=[], on_step_end=[], dt=0.1, start_lines_at=0, type="sequential",
                  collision_detection=False,
@@ -86,11 +120,121 @@ class Simulation:
                  collision_flip_mass=False,
                  repel=False,
                  repel_force=1.0,
-                 repel_radius=10.0):
+                 repel_radius=10.0,
+                 engine="dict",
+                 attractor_method="direct",
+                 theta=0.5,
+                 workers=None,
+                 kill_outside=None,
+                 min_speed=None,
+                 max_trail_length=None,
+                 trails="lines",
+                 trail_flush_every=None,
+                 trail_simplify=None,
+                 cache_dir=None,
+                 checkpoint_path=None,
+                 checkpoint_every=None,
+                 resume_from=None,
+                 integrator="semi_implicit",
+                 tolerance=0.01,
+                 trail_min_length=None,
+                 progress=None):
         self.canvas = canvas
         self.forces = forces
         self.events = events
         self.type = type
+        # engine="array" runs concurrent simulations on NumPy arrays (see ParticleState)
+        # instead of stepping point dicts one at a time
+        if engine not in ("dict", "array"):
+            raise ValueError(f"Unknown engine {engine!r}, expected 'dict' or 'array'")
+        if engine == "array" and type != "concurrent":
+            raise ValueError("engine='array' only supports type='concurrent'")
+        self.engine = engine
+        # Pull of attractor points: "direct" sums over all of them, "barnes_hut"
+        # approximates far groups through a quadtree with opening angle theta
+        if attractor_method not in ("direct", "barnes_hut"):
+            raise ValueError(f"Unknown attractor_method {attractor_method!r}, expected 'direct' or 'barnes_hut'")
+        if attractor_method == "barnes_hut" and type != "concurrent":
+            raise ValueError("attractor_method='barnes_hut' only supports type='concurrent'")
+        self.attractor_method = attractor_method
+        self.theta = theta
+        # workers=N runs a sequential simulation in N forked processes. Every
+        # point gets its own seed, so the result is the same for any N
+        if workers is not None:
+            if workers < 1:
+                raise ValueError(f"workers must be at least 1, got {workers}")
+            if type != "sequential":
+                raise ValueError("workers only supports type='sequential'")
+            if collision_detection or repel or events:
+                raise ValueError("workers needs collision_detection, repel and events off, they couple the points")
+            if any(isinstance(force, Relax) for force in forces):
+                raise ValueError("workers can't be used with Relax, it couples the points")
+        self.workers = workers
+
+        # Kill conditions, checked after every move: leaving a box (True for
+        # the canvas margins, or (min_x, min_y, max_x, max_y)), an impulse
+        # slower than min_speed, or a drawn trail longer than max_trail_length
+        if kill_outside is not None and kill_outside is not True and len(kill_outside) != 4:
+            raise ValueError("kill_outside must be True or a (min_x, min_y, max_x, max_y) box")
+        self.kill_outside = kill_outside
+        self.min_speed = min_speed
+        self.max_trail_length = max_trail_length
+
+        # Trails are drawn as line segments or as one "polyline" op per point.
+        # By default lines go to the canvas every step, polylines (or lines
+        # with trail_flush_every / trail_simplify) are collected in a
+        # TrailBuffer and drawn every trail_flush_every steps and at the end.
+        # Sequential runs draw each point's trail when it is done.
+        # trail_simplify drops vertices within that tolerance of a straight run
+        if trails not in ("lines", "polyline"):
+            raise ValueError(f"Unknown trails {trails!r}, expected 'lines' or 'polyline'")
+        self.trails = trails
+        self.trail_flush_every = trail_flush_every
+        self.trail_simplify = trail_simplify
+        self._trail_buffer = None
+
+        # cache_dir keeps the result of every run in a TrajectoryCache, a run
+        # with the same points, forces, options, steps and random state is
+        # restored from it instead of simulated. on_step_end callbacks would
+        # be skipped on a hit, so they can't be combined with it
+        if cache_dir is not None and on_step_end:
+            raise ValueError("cache_dir can't be used with on_step_end callbacks, they don't run on a cache hit")
+        self.cache_dir = cache_dir
+
+        # checkpoint_path gets the state of the run every checkpoint_every
+        # steps (after whole points for sequential runs), written on a
+        # background thread. resume_from continues the run saved in such a
+        # file, simulate() has to be called on the same setup it was made from
+        if (checkpoint_path is None) != (checkpoint_every is None):
+            raise ValueError("checkpoint_path and checkpoint_every have to be given together")
+        if checkpoint_every is not None and checkpoint_every < 1:
+            raise ValueError(f"checkpoint_every must be at least 1, got {checkpoint_every}")
+        if workers is not None and (checkpoint_path is not None or resume_from is not None):
+            raise ValueError("workers can't be used with checkpoints")
+        # How a step moves the points. "semi_implicit" adds the force kicks to
+        # the impulse and moves with the new impulse. The others take the
+        # impulse change the forces and attractors give in one step as an
+        # acceleration of (change / dt): "euler", "verlet" (velocity Verlet) and
+        # "rk4" with fixed dt, and "adaptive" (Bogacki-Shampine 3(2)), which
+        # covers every dt in sub-steps of a size per point that keeps the
+        # position error per sub-step under tolerance. Forces are evaluated
+        # several times per step there
+        if integrator not in integrators.INTEGRATORS:
+            raise ValueError(f"Unknown integrator {integrator!r}, expected one of {', '.join(integrators.INTEGRATORS)}")
+        if integrator != "semi_implicit" and attractor_method == "barnes_hut":
+            raise ValueError("attractor_method='barnes_hut' only supports integrator='semi_implicit'")
+        self.integrator = integrator
+        self.tolerance = tolerance
+        # Draw a trail segment once the point is trail_min_length away from
+        # the end of its last one (and when it stops), instead of every step
+        self.trail_min_length = trail_min_length
+        # progress gets the StepStats of the run (see NullProgress), e.g.
+        # TqdmProgress() for a progress bar or JsonLinesProgress(path) for logs
+        self.progress = progress if progress is not None else NullProgress()
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_every = checkpoint_every
+        self.resume_from = resume_from
+        self._checkpoints = None
         self.collision_detection = collision_detection
         self.collision_type = collision_type
         self.collision_damping = collision_damping
@@ -108,11 +252,37 @@ class Simulation:
 
         # Add grid parameters
         self.cell_size = 10  # Adjust based on your typical line lengths
-        self.grid = {}  # Dictionary of (cell_x, cell_y) -> list of line segments
+        self.grid = TrailGrid(self.cell_size)  # Trail segments for collision detection and repulsion
         self.collision_buffer_steps = 5
         self.collision_flip_mass = collision_flip_mass
 
+        # Trail segments produced by _step, handed to the canvas in bulk by _flush_segments
+        self._segments = []
+        # Trail segments produced and seconds per force for progress reports, see _start_progress
+        self._segment_count = 0
+        self._force_time = None
+        self._set_attractors([])
+        # event distance -> CellList of all points for near_point events, dropped by _new_step
+        self._near_point_cells = {}
+
     def simulate(self, steps=200):
+        if self.cache_dir is None:
+            self._simulate(steps)
+            return
+        cache = TrajectoryCache(self.cache_dir)
+        points = [op for op in self.canvas.draw_stack if op["type"] == "point"]
+        key = cache.key(self, points, steps)
+        if key is None:
+            self._simulate(steps)
+            return
+        if cache.load(key, self.canvas, points):
+            return
+        start = len(self.canvas.draw_stack)
+        before = [dict(point) for point in points]
+        self._simulate(steps)
+        cache.save(key, self.canvas, start, points, before)
+
+    def _simulate(self, steps):
         all_points = []
         all_attractor_points = []
         for point in self.canvas.draw_stack:
@@ -121,10 +291,41 @@ class Simulation:
                 all_points.append(point)
                 if "attractor" in point and point["attractor"] > 0.01 and point["mass"] > 0.01:
                     all_attractor_points.append(point)
+        # Forces outside their after_time/before_time window are skipped for all points
+        self._schedule = ForceSchedule(self.forces)
+        # Drawn trail length per id(point), for max_trail_length
+        self._trail_length = {}
+        # End of the last drawn trail segment per id(point), for trail_min_length
+        self._trail_anchor = {}
+        # Step size per id(point), for integrator="adaptive"
+        self._step_size = {}
+        self._point_index = {id(point): i for i, point in enumerate(all_points)}
+        resume = self._start_checkpoints(all_points)
+        self._set_attractors(all_attractor_points)
+        self._start_progress(steps, all_points, resume)
+        try:
+            self._run(steps, all_points, all_attractor_points, resume)
+        finally:
+            self.progress.close()
+            if self._checkpoints is not None:
+                self._checkpoints.writer.wait()
+                self._checkpoints = None
+
+    def _run(self, steps, all_points, all_attractor_points, resume):
+        if resume is not None and not (self.type == "concurrent" and self.engine == "array"):
+            restore_random(resume)
+
+        if self.type == "sequential" and self.workers is not None:
+            if all_attractor_points:
+                raise ValueError("workers can't be used with attractor points, they couple the points")
+            self._simulate_workers(steps, all_points)
+
+        elif self.type == "sequential":
+            first = 0 if resume is None else int(resume["next_point"])
+            done_steps = 0
+            for index in range(first, len(all_points)):
+                point = all_points[index]
 
-        if self.type == "sequential":
-            for point in tqdm.tqdm(all_points):
-    
                 if "impulse" not in point:
                     point["impulse"] = (0, 0)
 
@@ -134,14 +335,37 @@ class Simulation:
                 if "attractor" not in point:
                     point["attractor"] = 0.0
 
+                # Only this point moves until the next one
+                self._new_step()
                 for time_step in range(steps):    
-                    self._step(point, all_points, all_attractor_points, time_step)
+                    done_steps += 1
+                    if self._step(point, all_points, all_attractor_points, time_step):
+                        break
+                self._finish_trails([point])
+                self._flush_segments()
+                if self._checkpoints is not None and done_steps >= self.checkpoint_every:
+                    done_steps = 0
+                    self._checkpoint(all_points, next_point=index + 1)
+                self._report(index + 1, lambda: sum(1 for point in all_points if point["live"]))
+
+        elif self.type == "concurrent" and self.engine == "array":
+            self._simulate_array(steps, all_points, all_attractor_points, resume)
 
         elif self.type == "concurrent":
-            for time_step in tqdm.tqdm(range(steps), desc="Time Step", position=0):
-                for point in tqdm.tqdm(all_points, desc="Points", position=1, leave=False):
-                    if not point["live"]:
-                        continue
+            # Points are only ever killed in their own _step, so the live ones can be kept in a list
+            active = [point for point in all_points if point["live"]]
+            self._trail_buffer = self._make_trail_buffer(len(all_points),
+                                                         [point["color"] for point in all_points],
+                                                         [point["thickness"] for point in all_points],
+                                                         [point["pid"] for point in all_points])
+            if resume is not None and self._trail_buffer is not None:
+                self._trail_buffer.load_state(self._unprefix(resume, "trails_"))
+            first = 0 if resume is None else int(resume["time_step"])
+            for time_step in range(first, steps):
+                self._new_step()
+                if self.attractor_method == "barnes_hut" and all_attractor_points:
+                    self._tree_attractor_pull(all_points)
+                for point in active:
                     if "impulse" not in point:
                         point["impulse"] = (0, 0)
 
@@ -151,21 +375,137 @@ class Simulation:
                     if "attractor" not in point:
                         point["attractor"] = 0.0
                     self._step(point, all_points, all_attractor_points, time_step)
+                self._flush_segments()
+                self._flush_trails(time_step)
 
                 for function in self.on_step_end:
                     function(time_step)
+                self._checkpoint_step(time_step, all_points)
 
-    def _step(self, point, all_points, all_attractor_points, time_step):
-        # Apply all regular forces
-        for force in self.forces:
-            force.apply(point, time_step, all_points=all_points)
+                active = [point for point in active if point["live"]]
+                self._report(time_step + 1, lambda: len(active), final=not active)
+                if not active:
+                    break
+            self._finish_trails(active)
+            self._flush_segments()
+            self._flush_trails()
 
-        # Apply attractor forces
-        for attractor_point in all_attractor_points:
-            if attractor_point == point:
-                continue
-            attractor = Attractor.from_point(attractor_point)
-            attractor.apply(point, time_step)
+    def _start_progress(self, steps, all_points, resume):
+        """Starts the progress hook and, for hooks that want it, the time per force"""
+        self._segment_count = 0
+        self._force_time = None
+        if self.progress.timing:
+            self._force_time = {}
+            # Class names, numbered from the second force of a class on
+            self._force_labels = {}
+            counts = {}
+            for force in self.forces:
+                name = type(force).__name__
+                counts[name] = counts.get(name, 0) + 1
+                self._force_labels[id(force)] = name if counts[name] == 1 else f"{name}#{counts[name]}"
+        if self.type == "sequential":
+            self.progress.start(len(all_points), 0 if resume is None else int(resume["next_point"]))
+        else:
+            self.progress.start(steps, 0 if resume is None else int(resume["time_step"]))
+
+    def _time_force(self, label, start):
+        self._force_time[label] = self._force_time.get(label, 0.0) + time.perf_counter() - start
+
+    def _report(self, step, live, final=False):
+        """Hands StepStats to the progress hook when it is due, live is a function counting the live points"""
+        if final or self.progress.due(step):
+            self.progress.report(self.progress.stats(step, live(), self._segment_count, self._force_time or {}))
+
+    def _start_checkpoints(self, all_points):
+        """
+        Sets up checkpoint writing and restores the run in resume_from, returns
+        its arrays (None without resume_from). The random state is left to the
+        engine, the array engine draws its generator seed first.
+        """
+        if self.checkpoint_path is None and self.resume_from is None:
+            return None
+        # Identifies the setup, the same as a TrajectoryCache key but for any number of steps.
+        # Empty when the setup can't be fingerprinted, it isn't checked on resume then
+        key = TrajectoryCache(None).key(self, all_points, None) or ""
+        if self.checkpoint_path is not None:
+            self._checkpoints = _Checkpoints(CheckpointWriter(self.checkpoint_path), key,
+                                             OpRecorder(self.canvas.draw_stack, len(self.canvas.draw_stack)),
+                                             [dict(point) for point in all_points])
+        if self.resume_from is None:
+            return None
+
+        resume = read_npz(self.resume_from)
+        if resume is None:
+            raise ValueError(f"Can't read checkpoint {self.resume_from!r}")
+        if key and str(resume["key"]) and str(resume["key"]) != key:
+            raise ValueError(f"Checkpoint {self.resume_from!r} was written by a different simulation setup")
+        restore_points(resume, all_points)
+        replay_ops(resume, self.canvas)
+        self.grid.load_state(self._unprefix(resume, "grid_"))
+        self._trail_length = {id(point): length for point, length in zip(all_points, resume["trail_length"].tolist())
+                              if not math.isnan(length)}
+        self._trail_anchor = {id(point): (x, y) for point, (x, y) in zip(all_points, resume["trail_anchor"].tolist())
+                              if not math.isnan(x)}
+        self._step_size = {id(point): h for point, h in zip(all_points, resume["step_size"].tolist()) if not math.isnan(h)}
+        for component, values in zip(self.forces + self.events, read_literal(resume["components"])):
+            for name, value in values.items():
+                setattr(component, name, value)
+        return resume
+
+    def _checkpoint_step(self, time_step, all_points, state=None):
+        """Writes a checkpoint after every checkpoint_every-th step of a concurrent run"""
+        if self._checkpoints is not None and (time_step + 1) % self.checkpoint_every == 0:
+            self._checkpoint(all_points, time_step=time_step + 1, state=state)
+
+    def _checkpoint(self, all_points, state=None, **position):
+        """
+        Collects everything the rest of the run depends on and hands it to the
+        background writer: point values and trail ops since the start, the
+        trail grid and buffer, trail lengths, the scalar attributes of forces
+        and events, arrays batch forces attached to the ParticleState and the
+        random states. position is where to continue.
+        """
+        checkpoints = self._checkpoints
+        if state is not None:
+            state.to_points()
+        data = point_arrays(all_points, checkpoints.before)
+        components = literal_array([{name: value for name, value in vars(component).items()
+                                     if not name.startswith("_") and isinstance(value, (bool, int, float, str, type(None)))}
+                                    for component in self.forces + self.events])
+        if data is None or components is None or not checkpoints.recorder.update():
+            raise ValueError("The simulation state has values that can't be stored in a checkpoint")
+        data.update(checkpoints.recorder.arrays())
+        data.update(random_arrays())
+        data.update({f"grid_{name}": value for name, value in self.grid.state().items()})
+        if self._trail_buffer is not None:
+            data.update({f"trails_{name}": value for name, value in self._trail_buffer.state().items()})
+        if state is not None:
+            data["trail_length"] = state.trail_length.copy()
+            data["trail_anchor"] = np.column_stack([state.trail_x, state.trail_y])
+            data["step_size"] = state.step_size.copy()
+            data["rng"] = literal_array(state.rng.bit_generator.state)
+            data.update({f"extra_{name}": value.copy() for name, value in state.extra_arrays().items()})
+        else:
+            data["trail_length"] = np.array([self._trail_length.get(id(point), np.nan) for point in all_points])
+            data["trail_anchor"] = np.array([self._trail_anchor.get(id(point), (np.nan, np.nan)) for point in all_points]).reshape(-1, 2)
+            data["step_size"] = np.array([self._step_size.get(id(point), np.nan) for point in all_points])
+        data["components"] = components
+        data["key"] = np.array(checkpoints.key)
+        for name, value in position.items():
+            data[name] = np.array(value)
+        checkpoints.writer.write(data)
+
+    @staticmethod
+    def _unprefix(data, prefix):
+        return {name[len(prefix):]: value for name, value in data.items() if name.startswith(prefix)}
+
+    def _step(self, point, all_points, all_attractor_points, time_step):
+        if self.integrator == "semi_implicit":
+            # Apply all regular forces and the attractor pull
+            self._apply_forces(point, all_points, all_attractor_points, time_step)
+            move = None
+        else:
+            move = self._integrate(point, all_points, all_attractor_points, time_step)
 
         # Calculate repulsion force from nearby lines
         if self.repel:
@@ -174,21 +514,26 @@ class Simulation:
                 point["impulse"][0] + repel_force_x * self.dt,
                 point["impulse"][1] + repel_force_y * self.dt
             )
+            if move is not None:
+                move = (move[0] + repel_force_x * self.dt * self.dt, move[1] + repel_force_y * self.dt * self.dt)
 
         start_x = point["x"]
         start_y = point["y"]
 
         event_collision = False
         if self.collision_detection:
+            move_x, move_y = (point["impulse"][0] * self.dt, point["impulse"][1] * self.dt) if move is None else move[:2]
             if self._check_collision(point["x"], point["y"],
-                                   point["x"] + point["impulse"][0] * self.dt,
-                                   point["y"] + point["impulse"][1] * self.dt,
+                                   point["x"] + move_x,
+                                   point["y"] + move_y,
                                    time_step):
                 point["impulse"] = (-point["impulse"][0] * (1.0-self.collision_damping),
                                   -point["impulse"][1] * (1.0-self.collision_damping))
                 if abs(point["impulse"][0]) < 0.0001 and abs(point["impulse"][1]) < 0.0001:
                     point["live"] = False
                 event_collision = True
+                if move is not None:
+                    move = (point["impulse"][0] * self.dt, point["impulse"][1] * self.dt)
 
         # Handle events
         for event in self.events:
@@ -196,185 +541,662 @@ class Simulation:
                 if event_reason == "collision" and event_collision:
                     event.apply(point, time_step)
                 elif event_reason == "near_point":
-                    for point_to_check in all_points:
-                        if point_to_check == point:
-                            continue
-                        if math.dist((point["x"], point["y"]),
-                                   (point_to_check["x"], point_to_check["y"])) < event.distance:
-                            event.apply(point, time_step, with_point=point_to_check)
-                            break
+                    point_to_check = self._near_point(point, all_points, event.distance, time_step)
+                    if point_to_check is not None:
+                        event.apply(point, time_step, with_point=point_to_check)
 
         # Update position
-        point["x"] += point["impulse"][0] * self.dt
-        point["y"] += point["impulse"][1] * self.dt
+        if move is None:
+            point["x"] += point["impulse"][0] * self.dt
+            point["y"] += point["impulse"][1] * self.dt
+        else:
+            point["x"] += move[0]
+            point["y"] += move[1]
 
         end_x = point["x"]
         end_y = point["y"]
+        slot = self._attractor_slot.get(id(point))
+        if slot is not None:
+            self._attractor_x[slot] = end_x
+            self._attractor_y[slot] = end_y
 
+        killed = self._kill(point, start_x, start_y, time_step)
         if time_step >= self.start_lines_at:
-            self.canvas.line(start_x, start_y, end_x, end_y,
-                           color=point["color"],
-                           thickness=point["thickness"],
-                           pid=point["pid"])
+            if self.trail_min_length is None:
+                self._segments.append((start_x, start_y, end_x, end_y, point["color"], point["thickness"], point["pid"], id(point)))
+            else:
+                self._thin_trail(point, start_x, start_y, killed or not point["live"])
             if self.collision_flip_mass:
                 point["mass"] = -point["mass"]
-            self._add_line_to_grid(start_x, start_y, end_x, end_y, time_step)
+            # The line grid is only read by collision detection and repulsion
+            if self.collision_detection or self.repel:
+                self._add_line_to_grid(start_x, start_y, end_x, end_y, time_step)
 
-    def _get_cells_for_line(self, x1, y1, x2, y2):
-        """Get all grid cells that a line segment passes through"""
-        # Convert to grid coordinates
-        start_cell = (int(x1 / self.cell_size), int(y1 / self.cell_size))
-        end_cell = (int(x2 / self.cell_size), int(y2 / self.cell_size))
-        
-        cells = set()
-        dx = abs(end_cell[0] - start_cell[0])
-        dy = abs(end_cell[1] - start_cell[1])
-        
-        # Handle straight lines
-        if dx == 0:  # Vertical line
-            y_start = min(start_cell[1], end_cell[1])
-            y_end = max(start_cell[1], end_cell[1])
-            return {(start_cell[0], y) for y in range(y_start, y_end + 1)}
-            
-        if dy == 0:  # Horizontal line
-            x_start = min(start_cell[0], end_cell[0])
-            x_end = max(start_cell[0], end_cell[0])
-            return {(x, start_cell[1]) for x in range(x_start, x_end + 1)}
-        
-        # Handle diagonal and other lines
-        if dx > dy:
-            step = 1 if end_cell[0] > start_cell[0] else -1
-            slope = dy / dx  # Won't divide by zero since dx > dy > 0
-            for x in range(start_cell[0], end_cell[0] + step, step):
-                y = int(start_cell[1] + slope * (x - start_cell[0]))
-                cells.add((x, y))
+        if killed:
+            point["live"] = False
+            return True
+        return False
+
+    def _apply_forces(self, point, all_points, all_attractor_points, time_step):
+        if self._force_time is None:
+            for force in self._schedule.at(time_step):
+                force.apply(point, time_step, all_points=all_points)
+            if all_attractor_points:
+                self._attract(point)
+            return
+        for force in self._schedule.at(time_step):
+            start = time.perf_counter()
+            force.apply(point, time_step, all_points=all_points)
+            self._time_force(self._force_labels[id(force)], start)
+        if all_attractor_points:
+            start = time.perf_counter()
+            self._attract(point)
+            self._time_force("attractors", start)
+
+    def _integrate(self, point, all_points, all_attractor_points, time_step):
+        """
+        Advances the impulse of point with self.integrator, the forces and
+        attractor pull giving the acceleration. Forces are applied to copies of
+        the point at the stage positions, which take the point's place in
+        all_points meanwhile so forces skipping the point itself (Relax) skip
+        the copy. Keys they set besides the motion (e.g. Rule's original_y) are
+        kept from the first stage, which is at the start of the step. Returns
+        the move.
+        """
+        stages = []
+        slot = self._point_index.get(id(point))
+        if slot is not None and all_points[slot] is not point:
+            slot = None
+
+        def accel(x, y, vx, vy, index=None):
+            probe = dict(point)
+            if index is not None:
+                x, y, vx, vy = float(x[0]), float(y[0]), float(vx[0]), float(vy[0])
+            probe["x"], probe["y"], probe["impulse"] = x, y, (vx, vy)
+            if slot is not None:
+                all_points[slot] = probe
+            try:
+                self._apply_forces(probe, all_points, all_attractor_points, time_step)
+            finally:
+                if slot is not None:
+                    all_points[slot] = point
+            stages.append(probe)
+            ax, ay = (probe["impulse"][0] - vx) / self.dt, (probe["impulse"][1] - vy) / self.dt
+            return (np.array([ax]), np.array([ay])) if index is not None else (ax, ay)
+
+        x, y = point["x"], point["y"]
+        vx, vy = point["impulse"]
+        if self.integrator == "adaptive":
+            h = self._step_size.get(id(point), self.dt)
+            nx, ny, nvx, nvy, next_h = integrators.adaptive(accel, [x], [y], [vx], [vy], [h], self.tolerance, self.dt)
+            nx, ny, nvx, nvy = float(nx[0]), float(ny[0]), float(nvx[0]), float(nvy[0])
+            self._step_size[id(point)] = float(next_h[0])
         else:
-            step = 1 if end_cell[1] > start_cell[1] else -1
-            slope = dx / dy  # Won't divide by zero since dy >= dx > 0
-            for y in range(start_cell[1], end_cell[1] + step, step):
-                x = int(start_cell[0] + slope * (y - start_cell[1]))
-                cells.add((x, y))
-                
-        return cells
-    
-    def _line_segment_intersection(self, x1, y1, x2, y2, x3, y3, x4, y4):
-        """Check if two line segments intersect"""
-        denominator = (x1 - x2) * (y3 - y4) - (y1 - y2) * (x3 - x4)
-        if denominator == 0:
-            return False
-            
-        t = ((x1 - x3) * (y3 - y4) - (y1 - y3) * (x3 - x4)) / denominator
-        u = -((x1 - x2) * (y1 - y3) - (y1 - y2) * (x1 - x3)) / denominator
-        
-        return 0 <= t <= 1 and 0 <= u <= 1
-        
+            nx, ny, nvx, nvy = getattr(integrators, self.integrator)(accel, x, y, vx, vy, self.dt)
+        for key, value in stages[0].items():
+            if key not in ("x", "y", "impulse"):
+                point[key] = value
+        point["impulse"] = (nvx, nvy)
+        return nx - x, ny - y
+
+    def _thin_trail(self, point, start_x, start_y, final):
+        """Queues the segment from the end of the point's last one once it is trail_min_length long, or final"""
+        anchor_x, anchor_y = self._trail_anchor.get(id(point), (start_x, start_y))
+        if final or math.dist((anchor_x, anchor_y), (point["x"], point["y"])) >= self.trail_min_length:
+            self._segments.append((anchor_x, anchor_y, point["x"], point["y"], point["color"], point["thickness"], point["pid"], id(point)))
+            self._trail_anchor[id(point)] = (point["x"], point["y"])
+        else:
+            self._trail_anchor[id(point)] = (anchor_x, anchor_y)
+
+    def _finish_trails(self, points):
+        """Queues the rest of the trail of points whose last move wasn't drawn yet under trail_min_length"""
+        for point in points:
+            anchor = self._trail_anchor.get(id(point))
+            if anchor is not None and anchor != (point["x"], point["y"]):
+                self._segments.append((*anchor, point["x"], point["y"], point["color"], point["thickness"], point["pid"], id(point)))
+                self._trail_anchor[id(point)] = (point["x"], point["y"])
+
+    def _kill(self, point, start_x, start_y, time_step):
+        """Whether a kill condition hits point after its move from (start_x, start_y)"""
+        if self.kill_outside is not None:
+            min_x, min_y, max_x, max_y = self._kill_box()
+            if not (min_x <= point["x"] <= max_x and min_y <= point["y"] <= max_y):
+                return True
+        if self.min_speed is not None and math.hypot(*point["impulse"]) < self.min_speed:
+            return True
+        if self.max_trail_length is not None and time_step >= self.start_lines_at:
+            length = self._trail_length.get(id(point), 0.0) + math.dist((start_x, start_y), (point["x"], point["y"]))
+            self._trail_length[id(point)] = length
+            if length >= self.max_trail_length:
+                return True
+        return False
+
+    def _kill_mask(self, state, active, start_x, start_y, time_step):
+        """_kill for the active points of a ParticleState"""
+        x = state.x[active]
+        y = state.y[active]
+        dead = np.zeros(len(active), dtype=bool)
+        if self.kill_outside is not None:
+            min_x, min_y, max_x, max_y = self._kill_box()
+            dead |= ~((x >= min_x) & (x <= max_x) & (y >= min_y) & (y <= max_y))
+        if self.min_speed is not None:
+            dead |= np.hypot(state.ix[active], state.iy[active]) < self.min_speed
+        if self.max_trail_length is not None and time_step >= self.start_lines_at:
+            state.trail_length[active] += np.hypot(x - start_x, y - start_y)
+            dead |= state.trail_length[active] >= self.max_trail_length
+        return dead
+
+    def _kill_box(self):
+        if self.kill_outside is True:
+            return (*self.canvas.top_left, *self.canvas.bottom_right)
+        return self.kill_outside
+
+    def _simulate_workers(self, steps, all_points):
+        """
+        Sequential simulation sharded over a pool of forked processes. Seeds
+        for every point are drawn up front, the workers send back the final
+        point and its trail, and trails are drawn in point order. Without fork
+        (Windows) or with workers=1 the same work runs in this process.
+        """
+        global _worker_job
+        seeds = [random.getrandbits(64) for _ in all_points]
+        chunk = max(1, math.ceil(len(all_points) / (self.workers * 4)))
+        chunks = [range(start, min(start + chunk, len(all_points))) for start in range(0, len(all_points), chunk)]
+        _worker_job = (self, all_points, steps, seeds)
+        try:
+            # Forces run in the workers, their time isn't in the reports
+            live = lambda: sum(1 for point in all_points if point["live"])
+            if self.workers > 1 and "fork" in multiprocessing.get_all_start_methods():
+                with multiprocessing.get_context("fork").Pool(self.workers) as pool:
+                    for indices, results in zip(chunks, pool.imap(_simulate_points, chunks)):
+                        self._merge_points(all_points, indices, results)
+                        self._report(indices.stop, live)
+            else:
+                # Keep the caller's random state as it would be after a pool run
+                random_state = random.getstate()
+                numpy_state = np.random.get_state()
+                try:
+                    for indices in chunks:
+                        self._merge_points(all_points, indices, _simulate_points(indices))
+                        self._report(indices.stop, live)
+                finally:
+                    random.setstate(random_state)
+                    np.random.set_state(numpy_state)
+        finally:
+            _worker_job = None
+
+    def _simulate_point(self, point, all_points, steps, seed):
+        """
+        Runs all steps of one point on a copy of it, with random and np.random
+        seeded from seed. Returns the final point and its trail as arrays.
+        """
+        random.seed(seed)
+        np.random.seed(seed & 0xFFFFFFFF)
+        point = dict(point)
+        if "impulse" not in point:
+            point["impulse"] = (0, 0)
+        if "mass" not in point:
+            point["mass"] = 1.0
+        if "attractor" not in point:
+            point["attractor"] = 0.0
+        for time_step in range(steps):
+            if self._step(point, all_points, [], time_step):
+                break
+        self._finish_trails([point])
+        self._trail_length.pop(id(point), None)
+        self._trail_anchor.pop(id(point), None)
+        self._step_size.pop(id(point), None)
+        segments = self._segments
+        self._segments = []
+        coords = np.array([segment[:4] for segment in segments], dtype=np.float64).reshape(-1, 4)
+        return point, coords, [segment[4] for segment in segments], [segment[5] for segment in segments], [segment[6] for segment in segments]
+
+    def _merge_points(self, all_points, indices, results):
+        """Copies the simulated points back and draws their trails in one Canvas.lines call"""
+        for i, (point, *_) in zip(indices, results):
+            all_points[i].update(point)
+        self._segment_count += sum(len(result[1]) for result in results)
+        if self._trails_buffered():
+            for _, coords, colors, thicknesses, pids in results:
+                if len(coords):
+                    self._draw_trail(coords, colors[0], thicknesses[0], pids[0])
+            return
+        coords = np.concatenate([result[1] for result in results])
+        if len(coords):
+            self.canvas.lines(coords[:, 0], coords[:, 1], coords[:, 2], coords[:, 3],
+                              color=[color for result in results for color in result[2]],
+                              thickness=[thickness for result in results for thickness in result[3]],
+                              pid=[pid for result in results for pid in result[4]])
+
+    def _trails_buffered(self):
+        return self.trails != "lines" or self.trail_flush_every is not None or self.trail_simplify is not None
+
+    def _make_trail_buffer(self, n, color, thickness, pid):
+        if not self._trails_buffered():
+            return None
+        return TrailBuffer(n, color, thickness, pid, mode=self.trails, simplify=self.trail_simplify)
+
+    def _flush_trails(self, time_step=None):
+        """Draws the trail buffer every trail_flush_every steps, or now when time_step is None"""
+        if self._trail_buffer is None:
+            return
+        if time_step is None or (self.trail_flush_every is not None and (time_step + 1) % self.trail_flush_every == 0):
+            self._trail_buffer.flush(self.canvas)
+
+    def _draw_trail(self, coords, color, thickness, pid):
+        """Draws the (N, 4) segments of one point's trail as set by trails and trail_simplify"""
+        vertices = simplify_path(np.vstack([coords[:1, :2], coords[:, 2:]]), self.trail_simplify)
+        if self.trails == "polyline":
+            self.canvas.polyline(vertices, color=color, thickness=thickness, pid=pid)
+        else:
+            self.canvas.lines(vertices[:-1, 0], vertices[:-1, 1], vertices[1:, 0], vertices[1:, 1],
+                              color=color, thickness=thickness, pid=pid)
+
+    def _set_attractors(self, all_attractor_points):
+        """Positions and strengths of the attractor points as arrays, _step keeps the positions current"""
+        self._attractor_x = np.array([point["x"] for point in all_attractor_points], dtype=np.float64)
+        self._attractor_y = np.array([point["y"] for point in all_attractor_points], dtype=np.float64)
+        self._attractor_strength = np.array([point["attractor"] for point in all_attractor_points], dtype=np.float64)
+        self._attractor_slot = {id(point): slot for slot, point in enumerate(all_attractor_points)}
+        # id(point) -> pull for the current step, filled by _tree_attractor_pull
+        self._attractor_pull = None
+
+    def _tree_attractor_pull(self, all_points):
+        """
+        Barnes-Hut pull on every live point from the attractor positions at the
+        start of the step, for _attract to pick up during the step.
+        """
+        live = [point for point in all_points if point["live"]]
+        tree = QuadTree(self._attractor_x, self._attractor_y, self._attractor_strength)
+        pull_x, pull_y = tree.pull([point["x"] for point in live], [point["y"] for point in live], self.theta)
+        self._attractor_pull = {id(point): pull for point, pull in zip(live, zip(pull_x.tolist(), pull_y.tolist()))}
+
+    def _attract(self, point):
+        """Pull of all attractor points on point, the same sum as Attractor.apply over each of them"""
+        if self._attractor_pull is not None:
+            pull_x, pull_y = self._attractor_pull[id(point)]
+        else:
+            # The point's pull on itself has dx = dy = 0 and drops out
+            dx = self._attractor_x - point["x"]
+            dy = self._attractor_y - point["y"]
+            distance = np.maximum(np.hypot(dx, dy), 1.0)
+            pull = self._attractor_strength / (distance * distance * distance)
+            pull_x = float(np.dot(pull, dx))
+            pull_y = float(np.dot(pull, dy))
+        point["impulse"] = (
+            point["impulse"][0] + point["mass"] * pull_x,
+            point["impulse"][1] + point["mass"] * pull_y
+        )
+
+    def _simulate_array(self, steps, all_points, all_attractor_points, resume=None):
+        """
+        Concurrent simulation on a ParticleState. Every step applies the same
+        stages as _step, in the same order, but to the whole population at once.
+        Forces see the positions from the start of the step, where the dict
+        engine lets a point see the points already moved earlier in the step.
+        """
+        for point in all_points:
+            if "impulse" not in point:
+                point["impulse"] = (0, 0)
+            if "mass" not in point:
+                point["mass"] = 1.0
+            if "attractor" not in point:
+                point["attractor"] = 0.0
+        state = ParticleState(all_points)
+        self._trail_buffer = self._make_trail_buffer(len(state), state.color, state.thickness, state.pid)
+        index_of = {id(point): i for i, point in enumerate(all_points)}
+        attractors = np.array([index_of[id(point)] for point in all_attractor_points], dtype=np.int64)
+        first = 0
+        if resume is not None:
+            # After ParticleState, it draws the seed of its generator from random
+            restore_random(resume)
+            state.rng.bit_generator.state = read_literal(resume["rng"])
+            state.trail_length[:] = resume["trail_length"]
+            state.trail_x[:], state.trail_y[:] = resume["trail_anchor"].T
+            state.step_size[:] = resume["step_size"]
+            for name, value in self._unprefix(resume, "extra_").items():
+                setattr(state, name, value)
+            if self._trail_buffer is not None:
+                self._trail_buffer.load_state(self._unprefix(resume, "trails_"))
+            first = int(resume["time_step"])
+
+        for time_step in range(first, steps):
+            self._array_step(state, attractors, time_step)
+            if self.on_step_end:
+                # Callbacks (snapshots etc.) look at the point dicts
+                state.to_points()
+                for function in self.on_step_end:
+                    function(time_step)
+                state.from_points()
+            self._flush_trails(time_step)
+            self._checkpoint_step(time_step, all_points, state)
+            live = state.live.any()
+            self._report(time_step + 1, lambda: int(state.live.sum()), final=not live)
+            if not live:
+                break
+        self._finish_array_trails(state)
+        self._flush_trails()
+        state.to_points()
+
+    def _array_step(self, state, attractors, time_step):
+        self._new_step()
+        state.active = state.live.copy()
+        active = np.flatnonzero(state.active)
+        if len(active) == 0:
+            return
+        if self.integrator == "semi_implicit":
+            self._array_kick(state, active, attractors, time_step)
+            move = None
+        else:
+            move = self._array_integrate(state, active, attractors, time_step)
+
+        if self.repel:
+            x, y = state.x[active], state.y[active]
+            query, segment = self.grid.segments_near(x, y, self.repel_radius, time_step - self.collision_buffer_steps)
+            repel_force_x, repel_force_y = self._repulsion(x, y, query, segment)
+            state.ix[active] += repel_force_x * self.dt
+            state.iy[active] += repel_force_y * self.dt
+            if move is not None:
+                move[0] += repel_force_x * self.dt * self.dt
+                move[1] += repel_force_y * self.dt * self.dt
+
+        collided = np.zeros(len(state), dtype=bool)
+        if self.collision_detection:
+            x, y = state.x[active], state.y[active]
+            move_x, move_y = (state.ix[active] * self.dt, state.iy[active] * self.dt) if move is None else move[:2]
+            collided[active] = self.grid.collides(x, y, x + move_x, y + move_y,
+                                                  time_step - self.collision_buffer_steps)
+            state.ix[collided] = -state.ix[collided] * (1.0 - self.collision_damping)
+            state.iy[collided] = -state.iy[collided] * (1.0 - self.collision_damping)
+            state.live[collided & (np.abs(state.ix) < 0.0001) & (np.abs(state.iy) < 0.0001)] = False
+            if move is not None:
+                bounced = collided[active]
+                move[0][bounced] = state.ix[active[bounced]] * self.dt
+                move[1][bounced] = state.iy[active[bounced]] * self.dt
+
+        # Events don't move points, so events with the same distance share one cell list
+        cells_by_distance = {}
+        for event in self.events:
+            for event_reason in event.on:
+                if event_reason == "collision":
+                    self._fire_event(state, event, np.flatnonzero(collided), time_step)
+                elif event_reason == "near_point":
+                    self._fire_near_point_event(state, event, active, time_step, cells_by_distance)
+
+        start_x = state.x[active]
+        start_y = state.y[active]
+        if move is None:
+            state.x[active] += state.ix[active] * self.dt
+            state.y[active] += state.iy[active] * self.dt
+        else:
+            state.x[active] += move[0]
+            state.y[active] += move[1]
+
+        if self.kill_outside is not None or self.min_speed is not None or self.max_trail_length is not None:
+            state.live[active[self._kill_mask(state, active, start_x, start_y, time_step)]] = False
+
+        if time_step >= self.start_lines_at:
+            end_x = state.x[active]
+            end_y = state.y[active]
+            if self.trail_min_length is None:
+                self._draw_array_segments(state, active, start_x, start_y, end_x, end_y)
+            else:
+                self._thin_array_trails(state, active, start_x, start_y)
+            if self.collision_flip_mass:
+                state.mass[active] = -state.mass[active]
+            # The line grid is only read by collision detection and repulsion
+            if self.collision_detection or self.repel:
+                self._add_line_to_grid(start_x, start_y, end_x, end_y, time_step)
+
+    def _array_kick(self, state, active, attractors, time_step):
+        """Adds the impulse changes of the forces and attractor points for one step"""
+        points = state.points
+
+        # Forces with a batch implementation work on the arrays, the rest get the point dicts
+        for force in self._schedule.at(time_step):
+            start = time.perf_counter() if self._force_time is not None else None
+            if hasattr(force, "apply_batch"):
+                force.apply_batch(state, time_step)
+            else:
+                state.to_points()
+                for i in active.tolist():
+                    force.apply(points[i], time_step, all_points=points)
+                state.from_points(active.tolist())
+            if start is not None:
+                self._time_force(self._force_labels[id(force)], start)
+
+        if len(attractors):
+            start = time.perf_counter() if self._force_time is not None else None
+            if self.attractor_method == "barnes_hut":
+                self._attract_barnes_hut(state, active, attractors)
+            else:
+                self._attract_direct(state, active, attractors)
+            if start is not None:
+                self._time_force("attractors", start)
+
+    def _array_integrate(self, state, active, attractors, time_step):
+        """
+        The array version of _integrate: every stage puts the stage positions
+        and impulses of the particles into the state, applies _array_kick to
+        them and puts the step start back. Returns [move_x, move_y] of the
+        active particles and leaves the new impulse in the state.
+        """
+        x, y = state.x[active], state.y[active]
+        vx, vy = state.ix[active], state.iy[active]
+        live = state.live.copy()
+
+        def accel(sx, sy, svx, svy, index=None):
+            stage = active if index is None else active[index]
+            saved = state.x.copy(), state.y.copy(), state.ix.copy(), state.iy.copy()
+            state.x[stage], state.y[stage], state.ix[stage], state.iy[stage] = sx, sy, svx, svy
+            state.active = np.zeros(len(state), dtype=bool)
+            state.active[stage] = True
+            self._array_kick(state, stage, attractors, time_step)
+            ax = (state.ix[stage] - svx) / self.dt
+            ay = (state.iy[stage] - svy) / self.dt
+            state.x, state.y, state.ix, state.iy = saved
+            return ax, ay
+
+        if self.integrator == "adaptive":
+            h = np.where(np.isnan(state.step_size[active]), self.dt, state.step_size[active])
+            nx, ny, nvx, nvy, next_h = integrators.adaptive(accel, x, y, vx, vy, h, self.tolerance, self.dt)
+            state.step_size[active] = next_h
+        else:
+            nx, ny, nvx, nvy = getattr(integrators, self.integrator)(accel, x, y, vx, vy, self.dt)
+        state.active = live
+        state.ix[active] = nvx
+        state.iy[active] = nvy
+        return [nx - x, ny - y]
+
+    def _draw_array_segments(self, state, indices, start_x, start_y, end_x, end_y):
+        self._segment_count += len(indices)
+        if self._trail_buffer is not None:
+            self._trail_buffer.add(indices, start_x, start_y, end_x, end_y)
+        else:
+            self.canvas.lines(start_x, start_y, end_x, end_y,
+                              color=[state.color[i] for i in indices.tolist()],
+                              thickness=[state.thickness[i] for i in indices.tolist()],
+                              pid=[state.pid[i] for i in indices.tolist()])
+
+    def _thin_array_trails(self, state, active, start_x, start_y):
+        """The array version of _thin_trail, particles killed in this step draw the rest of their trail"""
+        anchor_x = np.where(np.isnan(state.trail_x[active]), start_x, state.trail_x[active])
+        anchor_y = np.where(np.isnan(state.trail_y[active]), start_y, state.trail_y[active])
+        end_x, end_y = state.x[active], state.y[active]
+        emit = ~state.live[active] | (np.hypot(end_x - anchor_x, end_y - anchor_y) >= self.trail_min_length)
+        self._draw_array_segments(state, active[emit], anchor_x[emit], anchor_y[emit], end_x[emit], end_y[emit])
+        state.trail_x[active] = np.where(emit, end_x, anchor_x)
+        state.trail_y[active] = np.where(emit, end_y, anchor_y)
+
+    def _finish_array_trails(self, state):
+        """Draws the rest of the trails that weren't drawn yet under trail_min_length"""
+        rest = np.flatnonzero(~np.isnan(state.trail_x) & ((state.trail_x != state.x) | (state.trail_y != state.y)))
+        self._draw_array_segments(state, rest, state.trail_x[rest], state.trail_y[rest], state.x[rest], state.y[rest])
+        state.trail_x[rest] = state.x[rest]
+        state.trail_y[rest] = state.y[rest]
+
+    def _attract_direct(self, state, active, attractors):
+        """Pull of every attractor point on every active point, summed directly in chunks."""
+        ax = state.x[attractors]
+        ay = state.y[attractors]
+        strength = state.attractor[attractors]
+        chunk = max(1, (1 << 22) // len(attractors))
+        for start in range(0, len(active), chunk):
+            i = active[start:start + chunk]
+            dx = ax[None, :] - state.x[i, None]
+            dy = ay[None, :] - state.y[i, None]
+            distance = np.maximum(np.hypot(dx, dy), 1.0)
+            # Same as Attractor.apply; a point's pull on itself has dx = dy = 0 and drops out
+            force = state.mass[i, None] * strength[None, :] / (distance * distance * distance)
+            state.ix[i] += (force * dx).sum(axis=1)
+            state.iy[i] += (force * dy).sum(axis=1)
+
+    def _attract_barnes_hut(self, state, active, attractors):
+        """Pull of the attractor points on every active point through a quadtree built for this step."""
+        tree = QuadTree(state.x[attractors], state.y[attractors], state.attractor[attractors])
+        pull_x, pull_y = tree.pull(state.x[active], state.y[active], self.theta)
+        state.ix[active] += state.mass[active] * pull_x
+        state.iy[active] += state.mass[active] * pull_y
+
+    def _fire_event(self, state, event, indices, time_step, with_points=None):
+        """
+        Fires event for indices, in order. Events with apply_batch(state, indices,
+        time_step, with_points=None) get the arrays, the rest a per-point
+        event.apply on the point dicts.
+        """
+        if len(indices) == 0:
+            return
+        if hasattr(event, "apply_batch"):
+            event.apply_batch(state, indices, time_step, with_points=with_points)
+            return
+        points = state.points
+        partners = None if with_points is None else np.asarray(with_points).tolist()
+        for n, i in enumerate(indices.tolist()):
+            if partners is None:
+                state.to_points([i])
+                event.apply(points[i], time_step)
+            else:
+                state.to_points([i, partners[n]])
+                event.apply(points[i], time_step, with_point=points[partners[n]])
+            state.from_points([i])
+
+    def _fire_near_point_event(self, state, event, active, time_step, cells_by_distance):
+        """Fires event for every active point with another point closer than event.distance, paired with the nearest one."""
+        if event.distance <= 0:
+            return
+        cells = cells_by_distance.get(event.distance)
+        if cells is None:
+            cells = cells_by_distance[event.distance] = CellList(event.distance).build(state.x, state.y)
+        i, j = cells.pairs(event.distance, rows=active)
+        if len(i) == 0:
+            return
+        distance_sq = (state.x[i] - state.x[j]) ** 2 + (state.y[i] - state.y[j]) ** 2
+        # Sort by point, then distance; the first pair of every point has its nearest neighbour
+        order = np.lexsort((j, distance_sq, i))
+        i = i[order]
+        j = j[order]
+        first = np.r_[True, i[1:] != i[:-1]]
+        self._fire_event(state, event, i[first], time_step, with_points=j[first])
+
+    def _new_step(self):
+        """
+        The points moved since the last neighbour lookups (a new concurrent
+        step or the next point of a sequential run): drops the near_point cell
+        lists and has forces with new_step() (Relax) drop theirs.
+        """
+        self._near_point_cells = {}
+        for force in self.forces:
+            if hasattr(force, "new_step"):
+                force.new_step()
+
+    def _near_point(self, point, all_points, distance, time_step):
+        """
+        Nearest other point closer than distance, None if there is none.
+        Candidates come from a cell list of all_points built on the first
+        lookup after _new_step().
+        """
+        if distance <= 0:
+            return None
+        cells = self._near_point_cells.get(distance)
+        if cells is None:
+            xs = np.fromiter((p["x"] for p in all_points), dtype=np.float64, count=len(all_points))
+            ys = np.fromiter((p["y"] for p in all_points), dtype=np.float64, count=len(all_points))
+            cells = self._near_point_cells[distance] = CellList(distance).build(xs, ys)
+        nearest = None
+        nearest_distance = distance
+        for index in cells.candidates(point["x"], point["y"]).tolist():
+            other = all_points[index]
+            if other is point:
+                continue
+            other_distance = math.dist((point["x"], point["y"]), (other["x"], other["y"]))
+            if other_distance < nearest_distance:
+                nearest = other
+                nearest_distance = other_distance
+        return nearest
+
+    def _flush_segments(self):
+        """
+        Hands the queued trail segments to the canvas with a single Canvas.lines
+        call, to the trail buffer, or as one point's trail in sequential runs.
+        """
+        if not self._segments:
+            return
+        self._segment_count += len(self._segments)
+        x1, y1, x2, y2, colors, thicknesses, pids, ids = zip(*self._segments)
+        self._segments = []
+        if self._trail_buffer is not None:
+            self._trail_buffer.add([self._point_index[i] for i in ids], np.array(x1), np.array(y1), np.array(x2), np.array(y2))
+        elif self._trails_buffered():
+            self._draw_trail(np.column_stack([x1, y1, x2, y2]), colors[0], thicknesses[0], pids[0])
+        else:
+            self.canvas.lines(x1, y1, x2, y2, color=list(colors), thickness=list(thicknesses), pid=list(pids))
+
     def _add_line_to_grid(self, x1, y1, x2, y2, time_step):
-        """Add a line segment to the spatial grid"""
-        cells = self._get_cells_for_line(x1, y1, x2, y2)
-        # Store the timestep along with the line coordinates
-        line_segment = (x1, y1, x2, y2, time_step)
-        
-        for cell in cells:
-            if cell not in self.grid:
-                self.grid[cell] = []
-            self.grid[cell].append(line_segment)
-            
+        """Add line segments (scalars or arrays) to the spatial grid"""
+        self.grid.add(x1, y1, x2, y2, time_step)
+
     def _check_collision(self, x1, y1, x2, y2, current_time_step):
         """Check if a new line segment would collide with existing lines"""
-        cells = self._get_cells_for_line(x1, y1, x2, y2)
-        
-        for cell in cells:
-            if cell in self.grid:
-                for line in self.grid[cell]:
-                    # Unpack the line data including its timestep
-                    x3, y3, x4, y4, line_time_step = line
-                    
-                    # Only check collision if the line is old enough
-                    if current_time_step - line_time_step > self.collision_buffer_steps:
-                        if self._line_segment_intersection(x1, y1, x2, y2, x3, y3, x4, y4):
-                            return True
-        return False
+        # Only lines older than collision_buffer_steps count
+        return self.grid.collides_one(x1, y1, x2, y2, current_time_step - self.collision_buffer_steps)
     
-    def _calculate_line_point_distance(self, px, py, x1, y1, x2, y2):
-        """Calculate the shortest distance from a point to a line segment"""
-        A = px - x1
-        B = py - y1
-        C = x2 - x1
-        D = y2 - y1
-
-        dot = A * C + B * D
-        len_sq = C * C + D * D
-
-        if len_sq == 0:
-            # x1 and x2 are the same point
-            return math.sqrt(A * A + B * B)
-
-        param = dot / len_sq
-
-        if param < 0:
-            # point is nearest to the start of the line segment
-            return math.sqrt(A * A + B * B)
-        elif param > 1:
-            # point is nearest to the end of the line segment
-            return math.sqrt((px - x2) * (px - x2) + (py - y2) * (py - y2))
-        else:
-            # normal case - project the point onto the line segment
-            x = x1 + param * C
-            y = y1 + param * D
-            return math.sqrt((px - x) * (px - x) + (py - y) * (py - y))
-
     def _calculate_repulsion_force(self, point, current_time_step):
         """Calculate the repulsion force from nearby line segments"""
         if not self.repel:
             return (0, 0)
 
-        cells = self._get_cells_for_line(
-            point["x"] - self.repel_radius,
-            point["y"] - self.repel_radius,
-            point["x"] + self.repel_radius,
-            point["y"] + self.repel_radius
-        )
+        # Only lines older than collision_buffer_steps count
+        segment = self.grid.segments_near_one(point["x"], point["y"], self.repel_radius,
+                                              current_time_step - self.collision_buffer_steps)
+        total_force_x, total_force_y = self._repulsion(np.array([point["x"]]), np.array([point["y"]]),
+                                                       np.zeros(len(segment), dtype=np.int64), segment)
+        return (float(total_force_x[0]), float(total_force_y[0]))
+
+    def _repulsion(self, x, y, query, segment):
+        """
+        Summed push of grid segments on points: every segment pushes the
+        point (x[query], y[query]) it is paired with away from its closest
+        point, (1 - distance / repel_radius)^2 * repel_force within repel_radius.
+        """
+        x1, y1, x2, y2 = self.grid.coords[segment].T
+        px = x[query]
+        py = y[query]
+        dx = x2 - x1
+        dy = y2 - y1
+        length_sq = dx * dx + dy * dy
+        with np.errstate(divide="ignore", invalid="ignore"):
+            param = np.where(length_sq != 0, ((px - x1) * dx + (py - y1) * dy) / length_sq, 0.0)
+        param = np.clip(param, 0.0, 1.0)
+
+        # Direction from the closest point on the line to the point
+        dir_x = px - (x1 + param * dx)
+        dir_y = py - (y1 + param * dy)
+        distance = np.hypot(dir_x, dir_y)
+        near = (distance < self.repel_radius) & (distance > 0)
+        query, dir_x, dir_y, distance = query[near], dir_x[near], dir_y[near], distance[near]
 
-        total_force_x = 0
-        total_force_y = 0
-
-        for cell in cells:
-            if cell in self.grid:
-                for line in self.grid[cell]:
-                    x1, y1, x2, y2, line_time_step = line
-                    
-                    # Only consider lines that are old enough
-                    if current_time_step - line_time_step > self.collision_buffer_steps:
-                        distance = self._calculate_line_point_distance(point["x"], point["y"], x1, y1, x2, y2)
-                        
-                        if distance < self.repel_radius:
-                            # Calculate the closest point on the line
-                            A = point["x"] - x1
-                            B = point["y"] - y1
-                            C = x2 - x1
-                            D = y2 - y1
-                            
-                            dot = A * C + B * D
-                            len_sq = C * C + D * D
-                            param = max(0, min(1, dot / len_sq if len_sq != 0 else 0))
-                            
-                            closest_x = x1 + param * C
-                            closest_y = y1 + param * D
-                            
-                            # Calculate direction from line to point
-                            dir_x = point["x"] - closest_x
-                            dir_y = point["y"] - closest_y
-                            
-                            # Normalize direction
-                            length = math.sqrt(dir_x * dir_x + dir_y * dir_y)
-                            if length > 0:
-                                dir_x /= length
-                                dir_y /= length
-                                
-                                # Force decreases with distance (inverse square law)
-                                force_magnitude = self.repel_force * (1 - distance / self.repel_radius) ** 2
-                                
-                                total_force_x += dir_x * force_magnitude
-                                total_force_y += dir_y * force_magnitude
-
-        return (total_force_x, total_force_y)
\ No newline at end of file
+        # Force decreases with distance
+        force_magnitude = self.repel_force * (1 - distance / self.repel_radius) ** 2
+        force_x = np.bincount(query, weights=dir_x / distance * force_magnitude, minlength=len(x))
+        force_y = np.bincount(query, weights=dir_y / distance * force_magnitude, minlength=len(x))
+        return force_x, force_y
@@ -0,0 +1,311 @@
+import ast
+import os
+import random
+import tempfile
+import numpy as np
+
+from penpal.draw_stack import ColumnarDrawStack, NO_PID
+
+# Shared by TrajectoryCache and the simulation checkpoints: the parts of a
+# run's result (trail ops, point values, random states) as flat NumPy
+# arrays for np.savez, and back.
+
+
+def _literal(value):
+    """value with NumPy scalars (also inside lists and tuples) turned into Python ones."""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, (list, tuple)):
+        items = [_literal(item) for item in value]
+        return type(value)(items)
+    return value
+
+
+def _readable(value):
+    try:
+        return ast.literal_eval(repr(value)) == value
+    except (ValueError, SyntaxError, TypeError, MemoryError, RecursionError):
+        return False
+
+
+def _same(a, b):
+    try:
+        return bool(a == b)
+    except (ValueError, TypeError):
+        return a is b
+
+
+def _is_numpy_float(value):
+    if isinstance(value, tuple):
+        return len(value) > 0 and all(isinstance(v, np.float64) for v in value)
+    return isinstance(value, np.float64)
+
+
+def _column(values):
+    """
+    (kind, array) for a list of point values with None for missing ones:
+    bools, ints, floats and equal length number tuples become arrays, other
+    values a repr() string. None when they can't be stored.
+    """
+    values = [_literal(value) for value in values]
+    filled = [value for value in values if value is not None]
+    number = lambda value: isinstance(value, (int, float)) and not isinstance(value, bool)
+    if filled and all(isinstance(value, bool) for value in filled):
+        return "bool", np.array([bool(value) for value in values])
+    if filled and all(isinstance(value, int) and not isinstance(value, bool) for value in filled):
+        return "int", np.array([0 if value is None else value for value in values], dtype=np.int64)
+    if filled and all(number(value) for value in filled):
+        return "float", np.array([0.0 if value is None else value for value in values], dtype=np.float64)
+    if filled and all(isinstance(value, tuple) and len(value) == len(filled[0]) and all(number(v) for v in value)
+                      for value in filled):
+        empty = (0.0,) * len(filled[0])
+        return "tuple", np.array([empty if value is None else value for value in values], dtype=np.float64)
+    if not _readable(values):
+        return None
+    return "literal", np.array(repr(values))
+
+
+def literal_array(value):
+    """value as a 0-d string array, None if repr() doesn't read back to it."""
+    value = _literal(value)
+    if not _readable(value):
+        return None
+    return np.array(repr(value))
+
+
+def read_literal(array):
+    return ast.literal_eval(str(array))
+
+
+class OpRecorder:
+    """
+    Collects the line and polyline ops appended to a draw stack after start.
+    update() picks up the ops added since the last call, so a long run can be
+    saved again and again without reading its earlier ops twice. Columnar
+    stacks are read column-wise.
+    """
+    def __init__(self, stack, start):
+        self.stack = stack
+        self.start = start
+        self.styles = {}
+        self.kind = []
+        self.lines = []
+        self.line_style = []
+        self.vertices = []
+        self.offsets = [0]
+        self.polyline_style = []
+
+    def _style(self, color, thickness, pid):
+        style = (_literal(color), _literal(thickness), _literal(pid))
+        code = self.styles.get(style)
+        if code is None:
+            if not _readable(style):
+                return None
+            code = self.styles[style] = len(self.styles)
+        return code
+
+    def update(self):
+        """Reads the new ops, False if one of them can't be stored."""
+        stop = len(self.stack)
+        if stop <= self.start:
+            return True
+        if isinstance(self.stack, ColumnarDrawStack):
+            done = self._update_columnar(self.start, stop)
+        else:
+            done = self._update_ops(self.stack[self.start:stop])
+        self.start = stop
+        return done
+
+    def _update_ops(self, ops):
+        kind, lines, line_style = [], [], []
+        for op in ops:
+            style = self._style(op.get("color"), op.get("thickness"), op.get("pid"))
+            if style is None:
+                return False
+            if op["type"] == "line":
+                kind.append(0)
+                lines.append((op["x1"], op["y1"], op["x2"], op["y2"]))
+                line_style.append(style)
+            elif op["type"] == "polyline":
+                kind.append(1)
+                self._add_polyline(op["points"], style)
+            else:
+                return False
+        self.kind.append(np.array(kind, dtype=np.uint8))
+        self.lines.append(np.array(lines, dtype=np.float64).reshape(-1, 4))
+        self.line_style.append(np.array(line_style, dtype=np.int64))
+        return True
+
+    def _update_columnar(self, start, stop):
+        stack = self.stack
+        types = stack.column("type", start, stop)
+        line = types == stack.type_code("line")
+        polyline = types == stack.type_code("polyline")
+        if not (line | polyline).all():
+            return False
+        self.kind.append(np.where(line, 0, 1).astype(np.uint8))
+
+        colors, thicknesses = stack.color_values(), stack.thickness_values()
+        codes = np.column_stack([stack.column("color", start, stop), stack.column("thickness", start, stop),
+                                 stack.column("pid", start, stop)])
+        unique, inverse = np.unique(codes, axis=0, return_inverse=True)
+        style = np.empty(len(unique), dtype=np.int64)
+        for i, (color, thickness, pid) in enumerate(unique.tolist()):
+            code = self._style(colors[color], thicknesses[thickness], None if pid == NO_PID else pid)
+            if code is None:
+                return False
+            style[i] = code
+        style = style[inverse.reshape(-1)]
+
+        self.lines.append(np.column_stack([stack.column(name, start, stop)[line] for name in ("x1", "y1", "x2", "y2")]))
+        self.line_style.append(style[line])
+        for row, code in zip((np.flatnonzero(polyline) + start).tolist(), style[polyline].tolist()):
+            self._add_polyline(stack[row]["points"], code)
+        return True
+
+    def _add_polyline(self, points, style):
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        self.vertices.append(points)
+        self.offsets.append(self.offsets[-1] + len(points))
+        self.polyline_style.append(style)
+
+    def arrays(self):
+        return {
+            "op_kind": np.concatenate(self.kind) if self.kind else np.empty(0, np.uint8),
+            "lines": np.concatenate(self.lines) if self.lines else np.empty((0, 4)),
+            "line_style": np.concatenate(self.line_style) if self.line_style else np.empty(0, np.int64),
+            "polyline_vertices": np.concatenate(self.vertices) if self.vertices else np.empty((0, 2)),
+            "polyline_offsets": np.array(self.offsets, dtype=np.int64),
+            "polyline_style": np.array(self.polyline_style, dtype=np.int64),
+            "styles": np.array(repr(list(self.styles))),
+        }
+
+
+def replay_ops(data, canvas):
+    """Adds the ops of OpRecorder.arrays() to canvas, they are already transformed and clipped."""
+    styles = read_literal(data["styles"])
+    kind = data["op_kind"]
+    if len(kind) == 0:
+        return
+    lines = data["lines"]
+    line_style = data["line_style"].tolist()
+    vertices = data["polyline_vertices"]
+    offsets = data["polyline_offsets"].tolist()
+    polyline_style = data["polyline_style"].tolist()
+    # Consecutive ops of one kind, lines are added a run at a time
+    starts = np.flatnonzero(np.r_[True, kind[1:] != kind[:-1]])
+    lengths = np.diff(np.r_[starts, len(kind)])
+
+    matrix, respect_margin = canvas.current_matrix, canvas.respect_margin
+    canvas.current_matrix = np.identity(3)
+    canvas.respect_margin = False
+    try:
+        line = polyline = 0
+        for run_kind, length in zip(kind[starts].tolist(), lengths.tolist()):
+            if run_kind == 0:
+                run = lines[line:line + length]
+                style = [styles[i] for i in line_style[line:line + length]]
+                canvas.lines(run[:, 0], run[:, 1], run[:, 2], run[:, 3],
+                             color=[color for color, _, _ in style],
+                             thickness=[thickness for _, thickness, _ in style],
+                             pid=[pid for _, _, pid in style])
+                line += length
+            else:
+                for i in range(polyline, polyline + length):
+                    color, thickness, pid = styles[polyline_style[i]]
+                    canvas.polyline(vertices[offsets[i]:offsets[i + 1]], color=color, thickness=thickness, pid=pid)
+                polyline += length
+    finally:
+        canvas.current_matrix = matrix
+        canvas.respect_margin = respect_margin
+
+
+def point_arrays(points, before):
+    """
+    The values points gained or changed since before (their dicts at the
+    start of the run), as number columns where possible. None if a value
+    can't be stored.
+    """
+    data = {}
+    # In the order the run added them, restored keys end up in the same order
+    names = list(dict.fromkeys(name for point, old in zip(points, before) for name in point
+                               if name not in old or not _same(point[name], old[name])))
+    point_keys = []
+    for column, name in enumerate(names):
+        stored = _column([point.get(name) for point in points])
+        if stored is None:
+            return None
+        data[f"point_{column}_kind"] = np.array(stored[0])
+        data[f"point_{column}"] = stored[1]
+        data[f"point_{column}_present"] = np.array([name in point for point in points], dtype=bool)
+        # Floats (or tuples of them) that were NumPy floats, they read back as such
+        data[f"point_{column}_numpy"] = np.array([_is_numpy_float(point.get(name)) for point in points], dtype=bool)
+        point_keys.append((name, column))
+    data["point_keys"] = np.array(repr(point_keys))
+    return data
+
+
+def restore_points(data, points):
+    for name, column in read_literal(data["point_keys"]):
+        values = data[f"point_{column}"]
+        kind = str(data[f"point_{column}_kind"])
+        if kind == "literal":
+            values = read_literal(values)
+        else:
+            values = values.tolist()
+        for point, value, present, numpy in zip(points, values, data[f"point_{column}_present"].tolist(),
+                                                data[f"point_{column}_numpy"].tolist()):
+            if not present:
+                continue
+            if kind == "tuple":
+                value = tuple(np.float64(v) for v in value) if numpy else tuple(value)
+            elif numpy:
+                value = np.float64(value)
+            point[name] = value
+
+
+def random_arrays():
+    """State of random and np.random."""
+    version, state, gauss = random.getstate()
+    _, keys, pos, has_gauss, cached = np.random.get_state()
+    return {
+        "random_version": np.array(version),
+        "random_state": np.array(state, dtype=np.int64),
+        "random_gauss": np.array(np.nan if gauss is None else gauss),
+        "numpy_state": keys,
+        "numpy_pos": np.array(pos),
+        "numpy_has_gauss": np.array(has_gauss),
+        "numpy_gauss": np.array(cached),
+    }
+
+
+def restore_random(data):
+    random.setstate((int(data["random_version"]), tuple(data["random_state"].tolist()),
+                     None if np.isnan(data["random_gauss"]) else float(data["random_gauss"])))
+    np.random.set_state(("MT19937", data["numpy_state"], int(data["numpy_pos"]),
+                         int(data["numpy_has_gauss"]), float(data["numpy_gauss"])))
+
+
+def write_npz(path, data):
+    """Writes data as a compressed .npz next to path and renames it, readers never see a partial file."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    handle, temp = tempfile.mkstemp(dir=directory, suffix=".npz.tmp")
+    try:
+        with os.fdopen(handle, "wb") as file:
+            np.savez_compressed(file, **data)
+        # mkstemp files are private to the user
+        os.chmod(temp, 0o644)
+        os.replace(temp, path)
+    except BaseException:
+        os.unlink(temp)
+        raise
+
+
+def read_npz(path):
+    """All arrays of an .npz file, None if it's missing or unreadable."""
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            return dict(data)
+    except (OSError, ValueError, EOFError):
+        return None
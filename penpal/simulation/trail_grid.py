@@ -0,0 +1,326 @@
+import math
+import numpy as np
+
+# Cell coordinates are clamped to +-_CELL_LIMIT so a cell fits in one int64 key
+_CELL_LIMIT = 1 << 30
+
+
+def _cell_keys(cx, cy):
+    cx = np.clip(cx, -_CELL_LIMIT, _CELL_LIMIT - 1) + _CELL_LIMIT
+    cy = np.clip(cy, -_CELL_LIMIT, _CELL_LIMIT - 1) + _CELL_LIMIT
+    return cx * (2 * _CELL_LIMIT) + cy
+
+
+def _expand(starts, counts):
+    """Concatenation of range(start, start + count) for every start/count pair."""
+    total = int(counts.sum())
+    first = np.cumsum(counts) - counts
+    return np.repeat(starts - first, counts) + np.arange(total)
+
+
+class TrailGrid:
+    """
+    Uniform grid of trail segments for collision and repulsion queries.
+
+    Segments are stored once in NumPy arrays (coordinates and the time step
+    they were drawn at), every cell a segment passes through gets a
+    (cell key, segment) entry. Entries live in runs sorted by cell key: every
+    flush of newly added segments makes a run, and runs of similar size are
+    merged, so there are O(log n) runs and a cell lookup is a binary search
+    per run. Runs hold consecutive batches of segments, so a query for
+    segments drawn before some time step skips runs that are too recent and
+    only filters the run that straddles the limit.
+
+    collides() and segments_near() answer many queries at once. The _one
+    variants serve point-at-a-time callers: they visit the cells in Python
+    and keep the segments found per cell until the next flush.
+    """
+    def __init__(self, cell_size=10):
+        self.cell_size = cell_size
+        self.clear()
+
+    def clear(self):
+        self.coords = np.empty((0, 4))
+        self.time = np.empty(0, np.int64)
+        self.count = 0
+        # (keys, segments, first time step, last time step), oldest first
+        self.runs = []
+        self._pending = []
+        self._pending_time = None
+        # cell key -> (segments, coords, time) of its stored segments, for collides_one
+        self._cell_cache = {}
+
+    def __len__(self):
+        return self.count + sum(len(batch[0]) for batch in self._pending)
+
+    def state(self):
+        """Copies of the stored segments, runs and queued segments as flat arrays, see load_state()."""
+        runs = self.runs or [(np.empty(0, np.int64), np.empty(0, np.int64), 0, 0)]
+        return {
+            "coords": self.coords[:self.count].copy(),
+            "time": self.time[:self.count].copy(),
+            "run_keys": np.concatenate([run[0] for run in runs]),
+            "run_segments": np.concatenate([run[1] for run in runs]),
+            "run_length": np.array([len(run[0]) for run in self.runs], dtype=np.int64),
+            "run_time": np.array([run[2:] for run in self.runs], dtype=np.int64).reshape(-1, 2),
+            "pending": np.concatenate([batch[0] for batch in self._pending]) if self._pending else np.empty((0, 4)),
+            "pending_length": np.array([len(batch[0]) for batch in self._pending], dtype=np.int64),
+            "pending_time": np.array([batch[1] for batch in self._pending], dtype=np.int64),
+        }
+
+    def load_state(self, state):
+        """Restores a state() exactly, runs included, so later queries see the segments in the same order."""
+        self.clear()
+        self.count = len(state["coords"])
+        self.coords = np.array(state["coords"], dtype=np.float64).reshape(-1, 4)
+        self.time = np.array(state["time"], dtype=np.int64)
+        edges = np.cumsum(state["run_length"])[:-1]
+        for keys, segments, (first_time, last_time) in zip(np.split(state["run_keys"], edges),
+                                                          np.split(state["run_segments"], edges),
+                                                          state["run_time"].tolist()):
+            self.runs.append((keys, segments, first_time, last_time))
+        edges = np.cumsum(state["pending_length"])[:-1]
+        for coords, time_step in zip(np.split(state["pending"], edges), state["pending_time"].tolist()):
+            self.add(*coords.T, time_step)
+
+    def add(self, x1, y1, x2, y2, time_step):
+        """Queues segments drawn at time_step, they are indexed by the first query that can see them."""
+        coords = np.column_stack([np.atleast_1d(np.asarray(v, dtype=np.float64)) for v in (x1, y1, x2, y2)])
+        if len(coords) == 0:
+            return
+        self._pending.append((coords, time_step))
+        if self._pending_time is None or time_step < self._pending_time:
+            self._pending_time = time_step
+
+    def collides(self, x1, y1, x2, y2, before):
+        """
+        For every query segment, whether it intersects a stored segment drawn
+        before time step `before`: both intersection parameters within [0, 1],
+        parallel segments never collide.
+        """
+        x1, y1, x2, y2 = (np.atleast_1d(np.asarray(v, dtype=np.float64)) for v in (x1, y1, x2, y2))
+        hit = np.zeros(len(x1), dtype=bool)
+        owners, keys = self._traverse(x1, y1, x2, y2)
+        for query, segment in self._candidates(owners, keys, before):
+            x3, y3, x4, y4 = self.coords[segment].T
+            qx1, qy1, qx2, qy2 = x1[query], y1[query], x2[query], y2[query]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                denominator = (qx1 - qx2) * (y3 - y4) - (qy1 - qy2) * (x3 - x4)
+                t = ((qx1 - x3) * (y3 - y4) - (qy1 - y3) * (x3 - x4)) / denominator
+                u = -((qx1 - qx2) * (qy1 - y3) - (qy1 - qy2) * (qx1 - x3)) / denominator
+            crossing = (denominator != 0) & (t >= 0) & (t <= 1) & (u >= 0) & (u <= 1)
+            hit[query[crossing]] = True
+        return hit
+
+    def collides_one(self, x1, y1, x2, y2, before):
+        """collides() for a single query segment given as floats."""
+        for _, coords, time in self._cached_cells(self._walk(x1, y1, x2, y2), before):
+            if len(time) == 0:
+                continue
+            old = time < before
+            if not old.any():
+                continue
+            x3, y3, x4, y4 = coords[old].T
+            with np.errstate(divide="ignore", invalid="ignore"):
+                denominator = (x1 - x2) * (y3 - y4) - (y1 - y2) * (x3 - x4)
+                t = ((x1 - x3) * (y3 - y4) - (y1 - y3) * (x3 - x4)) / denominator
+                u = -((x1 - x2) * (y1 - y3) - (y1 - y2) * (x1 - x3)) / denominator
+            if ((denominator != 0) & (t >= 0) & (t <= 1) & (u >= 0) & (u <= 1)).any():
+                return True
+        return False
+
+    def segments_near(self, x, y, radius, before):
+        """
+        (query, segment) pairs, each pair once, for the stored segments drawn
+        before time step `before` in the cells within radius of every query
+        point. Segments in those cells can still be further than radius away,
+        callers measure the distance.
+        """
+        x = np.atleast_1d(np.asarray(x, dtype=np.float64))
+        y = np.atleast_1d(np.asarray(y, dtype=np.float64))
+        size = self.cell_size
+        low_x = np.floor((x - radius) / size).astype(np.int64)
+        low_y = np.floor((y - radius) / size).astype(np.int64)
+        columns = np.floor((x + radius) / size).astype(np.int64) - low_x + 1
+        rows = np.floor((y + radius) / size).astype(np.int64) - low_y + 1
+        cells = columns * rows
+        owners = np.repeat(np.arange(len(x)), cells)
+        within = _expand(np.zeros(len(x), np.int64), cells)
+        keys = _cell_keys(low_x[owners] + within // rows[owners], low_y[owners] + within % rows[owners])
+        found = list(self._candidates(owners, keys, before))
+        if not found:
+            return np.empty(0, np.int64), np.empty(0, np.int64)
+        # A segment crossing several of the cells is listed once per cell
+        pairs = np.sort(np.concatenate([query * self.count + segment for query, segment in found]))
+        pairs = pairs[np.r_[True, pairs[1:] != pairs[:-1]]]
+        return pairs // self.count, pairs % self.count
+
+    def segments_near_one(self, x, y, radius, before):
+        """segments_near() for a single query point, returns the segments."""
+        size = self.cell_size
+        keys = [
+            self._key(cx, cy)
+            for cx in range(math.floor((x - radius) / size), math.floor((x + radius) / size) + 1)
+            for cy in range(math.floor((y - radius) / size), math.floor((y + radius) / size) + 1)
+        ]
+        found = [segments[time < before] for segments, _, time in self._cached_cells(keys, before)]
+        if not found:
+            return np.empty(0, np.int64)
+        return np.unique(np.concatenate(found))
+
+    def _cached_cells(self, keys, before):
+        """(segments, coords, time) stored in each of the cells, from the cell cache."""
+        if self._pending_time is not None and self._pending_time < before:
+            self._flush()
+        cells = []
+        for key in keys:
+            cached = self._cell_cache.get(key)
+            if cached is None:
+                cached = self._cell_cache[key] = self._cell_segments(key)
+            cells.append(cached)
+        return cells
+
+    def _traverse(self, x1, y1, x2, y2):
+        """
+        (segment, cell key) for every cell each segment passes through, found
+        with the Amanatides-Woo walk vectorized over all segments: the cell
+        boundary crossings of a segment sorted by their position along it.
+        """
+        size = self.cell_size
+        cx1 = np.floor(x1 / size).astype(np.int64)
+        cy1 = np.floor(y1 / size).astype(np.int64)
+        cx2 = np.floor(x2 / size).astype(np.int64)
+        cy2 = np.floor(y2 / size).astype(np.int64)
+        step_x = np.sign(cx2 - cx1)
+        step_y = np.sign(cy2 - cy1)
+        count_x = np.abs(cx2 - cx1)
+        count_y = np.abs(cy2 - cy1)
+        segments = np.arange(len(x1))
+
+        owner_x = np.repeat(segments, count_x)
+        rank_x = _expand(np.ones(len(x1), np.int64), count_x)
+        # Boundary between the cells crossed by the rank-th step, counted from 1
+        boundary_x = cx1[owner_x] + np.where(step_x[owner_x] > 0, rank_x, 1 - rank_x)
+        owner_y = np.repeat(segments, count_y)
+        rank_y = _expand(np.ones(len(x1), np.int64), count_y)
+        boundary_y = cy1[owner_y] + np.where(step_y[owner_y] > 0, rank_y, 1 - rank_y)
+        position = np.concatenate([
+            (boundary_x * size - x1[owner_x]) / (x2 - x1)[owner_x],
+            (boundary_y * size - y1[owner_y]) / (y2 - y1)[owner_y],
+        ])
+        owner = np.concatenate([owner_x, owner_y])
+        move_x = np.concatenate([step_x[owner_x], np.zeros(len(owner_y), np.int64)])
+        move_y = np.concatenate([np.zeros(len(owner_x), np.int64), step_y[owner_y]])
+
+        order = np.lexsort((position, owner))
+        owner = owner[order]
+        # Running cell offset of every crossing within its own segment
+        crossings = count_x + count_y
+        offset_x = np.cumsum(move_x[order])
+        offset_y = np.cumsum(move_y[order])
+        first = np.cumsum(crossings) - crossings
+        walked = crossings > 0
+        offset_x -= np.repeat((offset_x - move_x[order])[first[walked]], crossings[walked])
+        offset_y -= np.repeat((offset_y - move_y[order])[first[walked]], crossings[walked])
+
+        owners = np.concatenate([segments, owner])
+        keys = _cell_keys(np.concatenate([cx1, cx1[owner] + offset_x]), np.concatenate([cy1, cy1[owner] + offset_y]))
+        return owners, keys
+
+    def _walk(self, x1, y1, x2, y2):
+        """Cell keys a single segment passes through, in the same order and with the same ties as _traverse."""
+        size = self.cell_size
+        cx1 = math.floor(x1 / size)
+        cy1 = math.floor(y1 / size)
+        count_x = abs(math.floor(x2 / size) - cx1)
+        count_y = abs(math.floor(y2 / size) - cy1)
+        step_x = 1 if x2 > x1 else -1
+        step_y = 1 if y2 > y1 else -1
+        keys = [self._key(cx1, cy1)]
+        cx, cy = cx1, cy1
+        rank_x = rank_y = 1
+        while rank_x <= count_x or rank_y <= count_y:
+            if rank_x <= count_x:
+                boundary = cx1 + rank_x if step_x > 0 else cx1 + 1 - rank_x
+                position_x = (boundary * size - x1) / (x2 - x1)
+            if rank_y <= count_y:
+                boundary = cy1 + rank_y if step_y > 0 else cy1 + 1 - rank_y
+                position_y = (boundary * size - y1) / (y2 - y1)
+            # On a tie the x crossing goes first, like the stable lexsort in _traverse
+            if rank_x <= count_x and (rank_y > count_y or position_x <= position_y):
+                cx += step_x
+                rank_x += 1
+            else:
+                cy += step_y
+                rank_y += 1
+            keys.append(self._key(cx, cy))
+        return keys
+
+    @staticmethod
+    def _key(cx, cy):
+        cx = min(max(cx, -_CELL_LIMIT), _CELL_LIMIT - 1) + _CELL_LIMIT
+        cy = min(max(cy, -_CELL_LIMIT), _CELL_LIMIT - 1) + _CELL_LIMIT
+        return cx * (2 * _CELL_LIMIT) + cy
+
+    def _cell_segments(self, key):
+        """(segments, coords, time) of all stored segments in one cell."""
+        found = []
+        for run_keys, run_segments, _, _ in self.runs:
+            start = np.searchsorted(run_keys, key, "left")
+            stop = np.searchsorted(run_keys, key, "right")
+            if stop > start:
+                found.append(run_segments[start:stop])
+        segments = np.concatenate(found) if found else np.empty(0, np.int64)
+        return segments, self.coords[segments], self.time[segments]
+
+    def _candidates(self, owners, keys, before):
+        """
+        Yields (owner, segment) arrays per run, for every stored segment drawn
+        before time step `before` that shares a cell key with an owner.
+        """
+        if self._pending_time is not None and self._pending_time < before:
+            self._flush()
+        for run_keys, run_segments, first_time, last_time in self.runs:
+            if first_time >= before:
+                continue
+            start = np.searchsorted(run_keys, keys, "left")
+            counts = np.searchsorted(run_keys, keys, "right") - start
+            if not counts.any():
+                continue
+            owner = np.repeat(owners, counts)
+            segment = run_segments[_expand(start, counts)]
+            if last_time >= before:
+                old = self.time[segment] < before
+                owner = owner[old]
+                segment = segment[old]
+            yield owner, segment
+
+    def _flush(self):
+        """Moves the queued segments into storage and indexes them as a new run."""
+        coords = np.concatenate([batch[0] for batch in self._pending])
+        time = np.concatenate([np.full(len(batch[0]), batch[1], dtype=np.int64) for batch in self._pending])
+        self._pending = []
+        self._pending_time = None
+        self._cell_cache = {}
+
+        first = self.count
+        self.count += len(coords)
+        if self.count > len(self.coords):
+            capacity = max(self.count, 2 * len(self.coords), 1024)
+            self.coords = np.resize(self.coords, (capacity, 4))
+            self.time = np.resize(self.time, capacity)
+        self.coords[first:self.count] = coords
+        self.time[first:self.count] = time
+
+        owners, keys = self._traverse(*coords.T)
+        order = np.argsort(keys, kind="stable")
+        self.runs.append((keys[order], owners[order] + first, int(time.min()), int(time.max())))
+        # Keep run sizes decreasing geometrically. The stable sort keeps the
+        # older run's entries first, and finds the two sorted halves in linear time
+        while len(self.runs) > 1 and len(self.runs[-2][0]) <= 2 * len(self.runs[-1][0]):
+            newer = self.runs.pop()
+            older = self.runs.pop()
+            keys = np.concatenate([older[0], newer[0]])
+            order = np.argsort(keys, kind="stable")
+            segments = np.concatenate([older[1], newer[1]])[order]
+            self.runs.append((keys[order], segments, min(older[2], newer[2]), max(older[3], newer[3])))
@@ -0,0 +1,176 @@
+import math
+import numpy as np
+
+
+def _strip_direction(dx, dy):
+    length = math.hypot(dx, dy)
+    if length == 0:
+        return None, 0.0
+    return (dx / length, dy / length), length
+
+
+def simplify_path(xy, tolerance):
+    """
+    Drops the vertices of an (N, 2) path that lie on a straight run, one
+    vertex at a time like TrailBuffer does for running simulations.
+
+    From the last kept vertex (the anchor) the direction to the next vertex
+    defines a strip tolerance wide. Vertices are skipped while the path stays
+    in the strip and keeps moving forward along it, the vertex before the one
+    that leaves becomes the next anchor. Every dropped vertex is within
+    tolerance of the simplified path.
+    """
+    xy = np.asarray(xy, dtype=float).reshape(-1, 2)
+    if tolerance is None or len(xy) < 3:
+        return xy
+    half = tolerance / 2
+    kept = [0]
+    anchor_x, anchor_y = xy[0]
+    direction, pending_along = _strip_direction(xy[1, 0] - anchor_x, xy[1, 1] - anchor_y)
+    for index in range(2, len(xy)):
+        x, y = xy[index]
+        dx = x - anchor_x
+        dy = y - anchor_y
+        if direction is not None:
+            along = direction[0] * dx + direction[1] * dy
+            if abs(direction[0] * dy - direction[1] * dx) <= half and along >= pending_along:
+                pending_along = along
+                continue
+            # The pending vertex (index - 1) is kept and becomes the anchor
+            kept.append(index - 1)
+            anchor_x, anchor_y = xy[index - 1]
+        direction, pending_along = _strip_direction(x - anchor_x, y - anchor_y)
+    kept.append(len(xy) - 1)
+    return xy[kept]
+
+
+class TrailBuffer:
+    """
+    Trails of n particles, collected step by step and handed to the canvas in
+    bulk, as "polyline" ops (one per particle and flush) or as line segments.
+
+    add() takes one move per particle and step, vectorized over the particles.
+    Vertices are stored as flat per-step arrays and grouped per particle by
+    a stable sort on flush, so a particle's vertices stay in time order. With
+    a simplify tolerance, add() applies the simplify_path rule as the steps
+    come in and vertices on straight runs are never stored.
+
+    color, thickness and pid are lists with one value per particle, taken as
+    they are when the buffer is made.
+    """
+    def __init__(self, n, color, thickness, pid, mode="lines", simplify=None):
+        self.mode = mode
+        self.simplify = simplify
+        self.color = color
+        self.thickness = thickness
+        self.pid = pid
+        # Whether the particle has vertices since the last flush
+        self.open = np.zeros(n, dtype=bool)
+        # Simplification state: last kept vertex, last vertex not kept yet,
+        # strip direction from the anchor and how far along it the pending vertex is
+        self.anchor_x = np.zeros(n)
+        self.anchor_y = np.zeros(n)
+        self.pending_x = np.zeros(n)
+        self.pending_y = np.zeros(n)
+        self.has_pending = np.zeros(n, dtype=bool)
+        self.direction_x = np.zeros(n)
+        self.direction_y = np.zeros(n)
+        self.has_direction = np.zeros(n, dtype=bool)
+        self.pending_along = np.zeros(n)
+        self._vertices = []
+
+    def add(self, indices, x1, y1, x2, y2):
+        """Moves of the particles indices from (x1, y1) to (x2, y2) in this step."""
+        indices = np.asarray(indices, dtype=np.int64)
+        if len(indices) == 0:
+            return
+        opening = ~self.open[indices]
+        if opening.any():
+            start = indices[opening]
+            self.open[start] = True
+            self.anchor_x[start] = x1[opening]
+            self.anchor_y[start] = y1[opening]
+            self.has_pending[start] = False
+            self._vertices.append((start, x1[opening], y1[opening]))
+        if self.simplify is None:
+            self._vertices.append((indices, x2, y2))
+            return
+
+        i = indices
+        pending = self.has_pending[i]
+        dx = x2 - self.anchor_x[i]
+        dy = y2 - self.anchor_y[i]
+        along = self.direction_x[i] * dx + self.direction_y[i] * dy
+        off = np.abs(self.direction_x[i] * dy - self.direction_y[i] * dx)
+        in_strip = pending & self.has_direction[i] & (off <= self.simplify / 2) & (along >= self.pending_along[i])
+        commit = pending & self.has_direction[i] & ~in_strip
+        if commit.any():
+            kept = i[commit]
+            self._vertices.append((kept, self.pending_x[kept], self.pending_y[kept]))
+            self.anchor_x[kept] = self.pending_x[kept]
+            self.anchor_y[kept] = self.pending_y[kept]
+
+        # Every vertex that doesn't extend the strip starts a new one from the anchor
+        restart = i[~in_strip]
+        dx = x2[~in_strip] - self.anchor_x[restart]
+        dy = y2[~in_strip] - self.anchor_y[restart]
+        length = np.hypot(dx, dy)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.direction_x[restart] = np.where(length > 0, dx / length, 0.0)
+            self.direction_y[restart] = np.where(length > 0, dy / length, 0.0)
+        self.has_direction[restart] = length > 0
+        self.pending_along[restart] = length
+        self.pending_along[i[in_strip]] = along[in_strip]
+        self.pending_x[i] = x2
+        self.pending_y[i] = y2
+        self.has_pending[i] = True
+
+    _STATE = ("open", "anchor_x", "anchor_y", "pending_x", "pending_y", "has_pending",
+              "direction_x", "direction_y", "has_direction", "pending_along")
+
+    def state(self):
+        """Copies of the per-particle arrays and the vertices collected since the last flush, see load_state()."""
+        state = {name: getattr(self, name).copy() for name in self._STATE}
+        blocks = self._vertices or [(np.empty(0, np.int64), np.empty(0), np.empty(0))]
+        state["vertex_index"] = np.concatenate([block[0] for block in blocks])
+        state["vertex_x"] = np.concatenate([block[1] for block in blocks])
+        state["vertex_y"] = np.concatenate([block[2] for block in blocks])
+        return state
+
+    def load_state(self, state):
+        for name in self._STATE:
+            getattr(self, name)[:] = state[name]
+        self._vertices = [(state["vertex_index"], state["vertex_x"], state["vertex_y"])]
+
+    def flush(self, canvas):
+        """Draws everything collected since the last flush, trails continue from their last vertex."""
+        pending = np.flatnonzero(self.open & self.has_pending)
+        if len(pending):
+            self._vertices.append((pending, self.pending_x[pending], self.pending_y[pending]))
+        self.open[:] = False
+        self.has_pending[:] = False
+        if not self._vertices:
+            return
+        indices = np.concatenate([block[0] for block in self._vertices])
+        x = np.concatenate([block[1] for block in self._vertices])
+        y = np.concatenate([block[2] for block in self._vertices])
+        self._vertices = []
+        order = np.argsort(indices, kind="stable")
+        indices, x, y = indices[order], x[order], y[order]
+
+        if self.mode == "polyline":
+            starts = np.flatnonzero(np.r_[True, indices[1:] != indices[:-1]])
+            stops = np.r_[starts[1:], len(indices)]
+            for start, stop in zip(starts.tolist(), stops.tolist()):
+                if stop - start < 2:
+                    continue
+                i = int(indices[start])
+                canvas.polyline(np.column_stack([x[start:stop], y[start:stop]]),
+                                color=self.color[i], thickness=self.thickness[i], pid=self.pid[i])
+        else:
+            joined = indices[1:] == indices[:-1]
+            owner = indices[:-1][joined].tolist()
+            canvas.lines(x[:-1][joined], y[:-1][joined], x[1:][joined], y[1:][joined],
+                         color=[self.color[i] for i in owner],
+                         thickness=[self.thickness[i] for i in owner],
+                         pid=[self.pid[i] for i in owner])
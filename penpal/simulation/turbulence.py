@@ -14,4 +14,12 @@ class Turbulence:
             point["impulse"][0] + random.uniform(-self.turbulence, self.turbulence), 
             point["impulse"][1] + random.uniform(-self.turbulence, self.turbulence)
             )
-        return point
\ No newline at end of file
+        return point
+
+    def apply_batch(self, state, time_step):
+        if time_step < self.after_time or time_step > self.before_time:
+            return
+        mask = state.active
+        kicks = state.rng.uniform(-self.turbulence, self.turbulence, (2, int(mask.sum())))
+        state.ix[mask] += kicks[0]
+        state.iy[mask] += kicks[1]
@@ -1,4 +1,5 @@
 import math
+import numpy as np
 
 class Vortex:
     def __init__(self, x, y, strength=1.0, after_time=0.0, before_time=1000000000):
@@ -27,4 +28,20 @@ class Vortex:
             point["impulse"][0] + self.strength * tx,
             point["impulse"][1] + self.strength * ty
         )
-        return point
\ No newline at end of file
+        return point
+
+    def apply_batch(self, state, time_step):
+        if time_step < self.after_time or time_step > self.before_time:
+            return
+        mask = state.active
+        dx = state.x[mask] - self.x
+        dy = state.y[mask] - self.y
+        # (-sin, cos) of the angle is just the normalized (-dy, dx), no atan2 needed.
+        # At the center atan2 gives angle 0, so the tangent there is (0, 1)
+        r = np.hypot(dx, dy)
+        center = r == 0
+        r[center] = 1.0
+        tx = np.where(center, 0.0, -dy / r)
+        ty = np.where(center, 1.0, dx / r)
+        state.ix[mask] += self.strength * tx
+        state.iy[mask] += self.strength * ty
@@ -0,0 +1,230 @@
+import math
+import numpy as np
+from penpal.draw_stack import ColumnarDrawStack
+
+
+def point_segment_distance(px, py, x1, y1, x2, y2):
+    """Distance from point(s) to segment(s), vectorized over NumPy arrays."""
+    dx = x2 - x1
+    dy = y2 - y1
+    len_sq = dx * dx + dy * dy
+    with np.errstate(invalid="ignore", divide="ignore"):
+        t = np.where(len_sq > 0, ((px - x1) * dx + (py - y1) * dy) / len_sq, 0.0)
+    t = np.clip(t, 0.0, 1.0)
+    return np.hypot(px - (x1 + t * dx), py - (y1 + t * dy))
+
+
+def segment_segment_distance(ax1, ay1, ax2, ay2, bx1, by1, bx2, by2):
+    """Distance between segment(s) a and segment(s) b, 0 where they intersect."""
+    distance = np.minimum(
+        np.minimum(point_segment_distance(ax1, ay1, bx1, by1, bx2, by2),
+                   point_segment_distance(ax2, ay2, bx1, by1, bx2, by2)),
+        np.minimum(point_segment_distance(bx1, by1, ax1, ay1, ax2, ay2),
+                   point_segment_distance(bx2, by2, ax1, ay1, ax2, ay2)))
+    denominator = (bx2 - bx1) * (ay1 - ay2) - (ax1 - ax2) * (by2 - by1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ua = ((by1 - by2) * (ax1 - bx1) + (bx2 - bx1) * (ay1 - by1)) / denominator
+        ub = ((ay1 - ay2) * (ax1 - bx1) + (ax2 - ax1) * (ay1 - by1)) / denominator
+    crossing = (denominator != 0) & (ua >= 0) & (ua <= 1) & (ub >= 0) & (ub <= 1)
+    return np.where(crossing, 0.0, distance)
+
+
+class SpatialIndex:
+    """
+    Uniform grid over the geometry of a draw stack.
+
+    Every line, point and polyline segment is stored once as an entry
+    (x1, y1, x2, y2, op index) and registered in all grid cells its bounding
+    box touches. The index follows a draw stack incrementally: ops appended
+    since the last query are indexed on the next query, and the index is
+    rebuilt when the stack is replaced or shrinks. In-place edits of op
+    coordinates are not tracked, call rebuild() after those.
+    """
+    def __init__(self, cell_size=10.0):
+        self.cell_size = cell_size
+        self.stack = None
+        self.indexed = 0
+        self.clear()
+
+    def clear(self):
+        self.cells = {}
+        self.size = 0
+        self.entries = np.empty((0, 4), np.float64)
+        self.entry_ops = np.empty(0, np.int64)
+        self.bounds = None
+
+    def rebuild(self, stack=None):
+        self.clear()
+        self.stack = stack if stack is not None else self.stack
+        self.indexed = 0
+        if self.stack is not None:
+            self.sync(self.stack)
+
+    def sync(self, stack):
+        """Indexes everything appended to stack since the last sync."""
+        if stack is not self.stack or len(stack) < self.indexed:
+            self.clear()
+            self.stack = stack
+            self.indexed = 0
+        if len(stack) == self.indexed:
+            return
+        segments, ops = self._geometry(stack, self.indexed)
+        self.indexed = len(stack)
+        self.insert(segments, ops)
+
+    def insert(self, segments, ops):
+        """Adds (N, 4) segments belonging to the given op indices."""
+        if len(segments) == 0:
+            return
+        start = self.size
+        end = start + len(segments)
+        if end > len(self.entries):
+            capacity = max(end, len(self.entries) * 2, 256)
+            entries = np.empty((capacity, 4), np.float64)
+            entry_ops = np.empty(capacity, np.int64)
+            entries[:start] = self.entries[:start]
+            entry_ops[:start] = self.entry_ops[:start]
+            self.entries = entries
+            self.entry_ops = entry_ops
+        self.entries[start:end] = segments
+        self.entry_ops[start:end] = ops
+        self.size = end
+
+        min_x = np.minimum(segments[:, 0], segments[:, 2])
+        max_x = np.maximum(segments[:, 0], segments[:, 2])
+        min_y = np.minimum(segments[:, 1], segments[:, 3])
+        max_y = np.maximum(segments[:, 1], segments[:, 3])
+        cx0 = np.floor(min_x / self.cell_size).astype(np.int64)
+        cx1 = np.floor(max_x / self.cell_size).astype(np.int64)
+        cy0 = np.floor(min_y / self.cell_size).astype(np.int64)
+        cy1 = np.floor(max_y / self.cell_size).astype(np.int64)
+
+        cells = self.cells
+        for entry, x0, x1, y0, y1 in zip(range(start, end), cx0.tolist(), cx1.tolist(), cy0.tolist(), cy1.tolist()):
+            for cx in range(x0, x1 + 1):
+                for cy in range(y0, y1 + 1):
+                    cell = cells.get((cx, cy))
+                    if cell is None:
+                        cells[(cx, cy)] = [entry]
+                    else:
+                        cell.append(entry)
+
+        bounds = (int(cx0.min()), int(cy0.min()), int(cx1.max()), int(cy1.max()))
+        if self.bounds is None:
+            self.bounds = bounds
+        else:
+            self.bounds = (min(self.bounds[0], bounds[0]), min(self.bounds[1], bounds[1]),
+                           max(self.bounds[2], bounds[2]), max(self.bounds[3], bounds[3]))
+
+    def candidates(self, min_x, min_y, max_x, max_y):
+        """Entry ids registered in any cell overlapping the box."""
+        cx0 = math.floor(min_x / self.cell_size)
+        cx1 = math.floor(max_x / self.cell_size)
+        cy0 = math.floor(min_y / self.cell_size)
+        cy1 = math.floor(max_y / self.cell_size)
+        found = []
+        cells = self.cells
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > len(cells):
+            # Box covers more cells than exist, walk the occupied ones instead
+            for (cx, cy), entries in cells.items():
+                if cx0 <= cx <= cx1 and cy0 <= cy <= cy1:
+                    found.extend(entries)
+        else:
+            for cx in range(cx0, cx1 + 1):
+                for cy in range(cy0, cy1 + 1):
+                    entries = cells.get((cx, cy))
+                    if entries:
+                        found.extend(entries)
+        if not found:
+            return np.empty(0, np.int64)
+        return np.unique(np.asarray(found, dtype=np.int64))
+
+    def query_radius(self, x, y, radius):
+        """Op indices with geometry within radius of (x, y)."""
+        ids = self.candidates(x - radius, y - radius, x + radius, y + radius)
+        if len(ids) == 0:
+            return []
+        e = self.entries[ids]
+        hit = point_segment_distance(x, y, e[:, 0], e[:, 1], e[:, 2], e[:, 3]) <= radius
+        return np.unique(self.entry_ops[ids[hit]]).tolist()
+
+    def query_segment(self, x1, y1, x2, y2, radius=0.0):
+        """Op indices with geometry within radius of the segment (x1, y1)-(x2, y2)."""
+        ids = self.candidates(min(x1, x2) - radius, min(y1, y2) - radius, max(x1, x2) + radius, max(y1, y2) + radius)
+        if len(ids) == 0:
+            return []
+        e = self.entries[ids]
+        hit = segment_segment_distance(x1, y1, x2, y2, e[:, 0], e[:, 1], e[:, 2], e[:, 3]) <= radius
+        return np.unique(self.entry_ops[ids[hit]]).tolist()
+
+    def nearest(self, x, y, max_distance=None):
+        """(op index, distance) of the closest geometry to (x, y), or None."""
+        if self.size == 0:
+            return None
+        cx = math.floor(x / self.cell_size)
+        cy = math.floor(y / self.cell_size)
+        # Number of rings needed to cover the whole occupied grid from (cx, cy)
+        max_ring = max(abs(cx - self.bounds[0]), abs(cx - self.bounds[2]), abs(cy - self.bounds[1]), abs(cy - self.bounds[3]))
+        best_distance = math.inf
+        best_entry = None
+        seen = set()
+        for ring in range(max_ring + 1):
+            # Anything in rings further out is at least ring * cell_size away
+            lower_bound = max(ring - 1, 0) * self.cell_size
+            if best_distance <= lower_bound:
+                break
+            if max_distance is not None and lower_bound > max_distance:
+                break
+            found = []
+            for rx in range(cx - ring, cx + ring + 1):
+                for ry in (range(cy - ring, cy + ring + 1) if rx in (cx - ring, cx + ring) else (cy - ring, cy + ring)):
+                    entries = self.cells.get((rx, ry))
+                    if entries:
+                        found.extend(e for e in entries if e not in seen)
+            if not found:
+                continue
+            ids = np.unique(np.asarray(found, dtype=np.int64))
+            seen.update(ids.tolist())
+            e = self.entries[ids]
+            distances = point_segment_distance(x, y, e[:, 0], e[:, 1], e[:, 2], e[:, 3])
+            i = int(np.argmin(distances))
+            if distances[i] < best_distance:
+                best_distance = float(distances[i])
+                best_entry = int(ids[i])
+        if best_entry is None or (max_distance is not None and best_distance > max_distance):
+            return None
+        return int(self.entry_ops[best_entry]), best_distance
+
+    def _geometry(self, stack, start):
+        """(N, 4) segments and their op indices for ops[start:]."""
+        if isinstance(stack, ColumnarDrawStack):
+            types = stack.column("type")[start:]
+            x1 = stack.column("x1")[start:]
+            y1 = stack.column("y1")[start:]
+            x2 = stack.column("x2")[start:]
+            y2 = stack.column("y2")[start:]
+            simple = np.isin(types, [stack.type_code("line"), stack.type_code("point")])
+            ops = [np.flatnonzero(simple) + start]
+            segments = [np.column_stack([x1[simple], y1[simple], x2[simple], y2[simple]])]
+            for index in (np.flatnonzero(types == stack.type_code("polyline")) + start).tolist():
+                points = np.asarray(stack[index]["points"])
+                segments.append(np.column_stack([points[:-1], points[1:]]))
+                ops.append(np.full(len(points) - 1, index))
+            return np.concatenate(segments), np.concatenate(ops)
+
+        segments = []
+        ops = []
+        for index in range(start, len(stack)):
+            op = stack[index]
+            if op["type"] == "line":
+                segments.append((op["x1"], op["y1"], op["x2"], op["y2"]))
+                ops.append(index)
+            elif op["type"] == "point":
+                segments.append((op["x"], op["y"], op["x"], op["y"]))
+                ops.append(index)
+            elif op["type"] == "polyline":
+                points = np.asarray(op["points"]).tolist()
+                for (sx, sy), (ex, ey) in zip(points[:-1], points[1:]):
+                    segments.append((sx, sy, ex, ey))
+                    ops.append(index)
+        return np.asarray(segments, dtype=np.float64).reshape(-1, 4), np.asarray(ops, dtype=np.int64)
@@ -1,5 +1,6 @@
 from svgpathtools import svg2paths, Line, CubicBezier, Path, Arc
 import math
+import numpy as np
 class SVG:
     def __init__(self, filename):
         self.filename = filename
@@ -148,7 +149,13 @@ class SVG:
             
 
             if stroke_color or not fill_color:
+                # Runs of consecutive cubic Béziers are flattened in one batch
+                curves = []
                 for segment in path:
+                    if curves and not isinstance(segment, CubicBezier):
+                        canvas.cubic_beziers(curves, color=stroke_color, thickness=pen_width)
+                        curves = []
+
                     if isinstance(segment, Line):
                         
                         # Original points
@@ -174,15 +181,7 @@ class SVG:
                         c2x_t, c2y_t = SVG.transform_point(c2x, c2y, x, y, scale, flip_x, flip_y)
                         ex_t,  ey_t  = SVG.transform_point(ex,  ey,  x, y, scale, flip_x, flip_y)
                         
-                        # Draw
-                        canvas.cubic_bezier(
-                            sx_t,  sy_t,
-                            c1x_t, c1y_t,
-                            c2x_t, c2y_t,
-                            ex_t,  ey_t,
-                            color=stroke_color,
-                            thickness=pen_width
-                        )
+                        curves.append((sx_t, sy_t, c1x_t, c1y_t, c2x_t, c2y_t, ex_t, ey_t))
 
                     elif isinstance(segment, Arc):
                         # We'll approximate the arc by sampling points along its parameter [0..1].
@@ -230,6 +229,8 @@ class SVG:
                     
                     else:
                         print(f"unknown segment: {type(segment)}")
+                if curves:
+                    canvas.cubic_beziers(curves, color=stroke_color, thickness=pen_width)
             if fill_color:
                 SVG.fill_shape_with_lines(path, canvas, pen_width=pen_width, 
                          stroke_color=fill_color, x=x, y=y, scale=scale, 
@@ -289,6 +290,15 @@ class SVG:
                         f'stroke="{color if color else "black"}" ' +
                         f'stroke-width="{op.get("thickness", 0.5) * MM_TO_PX}"/>'
                     )
+                elif op["type"] == "polyline":
+                    points = " ".join(f"{x * MM_TO_PX:.2f},{y * MM_TO_PX:.2f}" for x, y in np.asarray(op["points"]).tolist())
+                    svg_lines.append(
+                        f'  <polyline class="plotted-line" ' +
+                        f'points="{points}" ' +
+                        f'stroke="{color if color else "black"}" ' +
+                        f'fill="none" ' +
+                        f'stroke-width="{op.get("thickness", 0.5) * MM_TO_PX}"/>'
+                    )
                 elif op["type"] == "point":
                     # For points, create a small circle
                     svg_lines.append(
@@ -32,6 +32,7 @@ class Optimizations:
     @staticmethod
     def sort_lines(canvas):
         canvas.draw_stack.sort(key=lambda x: x["pid"])
+        canvas.reindex()
 
     @staticmethod
     def merge_lines(canvas, tolerance=0.1):